@@ -0,0 +1,130 @@
+# Copyright The Hubtty Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark the storage of parsed diffs on a large change.
+
+A temporary repository is created with a file of --lines lines, every
+--every'th of which is changed.  The benchmark reports the time to
+parse the diff, the memory held by the parsed file compared with the
+same lines materialized as lists of line tuples (the representation
+chunks used to hold), and the cost of looking up line positions with
+DiffChunk.indexOfLine compared with a linear scan of the tuples.
+"""
+
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import tracemalloc
+
+from benchmarks import common
+from hubtty import gitrepo
+
+
+def make_repo(path, nlines, every):
+    rnd = random.Random(3)
+    lines = ['    value_%d = compute(alpha, beta, %d)  # note %d\n'
+             % (i, rnd.randint(0, 999), i) for i in range(nlines)]
+    env = dict(os.environ, GIT_AUTHOR_NAME='bench', GIT_AUTHOR_EMAIL='b@x',
+               GIT_COMMITTER_NAME='bench', GIT_COMMITTER_EMAIL='b@x')
+    subprocess.check_call(['git', 'init', '-q', path])
+    shas = []
+    for i in range(2):
+        with open(os.path.join(path, 'big.py'), 'w') as f:
+            f.writelines(lines)
+        subprocess.check_call(['git', '-C', path, 'add', 'big.py'])
+        subprocess.check_call(['git', '-C', path, 'commit', '-qm', str(i)],
+                              env=env)
+        shas.append(subprocess.check_output(
+            ['git', '-C', path, 'rev-parse', 'HEAD']).decode().strip())
+        for j in range(0, nlines, every):
+            lines[j] = lines[j].replace('alpha', 'gamma')
+    return shas
+
+
+def parse(repo, old, new):
+    return repo.diff(old, new, syntax_highlighting=False)[-1]
+
+
+def measure(func):
+    tracemalloc.start()
+    try:
+        result = func()
+        return result, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def linear_index(lines, oldnew, lineno):
+    for i, line in enumerate(lines):
+        if line[oldnew][gitrepo.LINENO] == lineno:
+            return i
+    return None
+
+
+def main():
+    parser = common.parser(__doc__.split('\n')[0])
+    parser.add_argument('--lines', type=int, default=50000,
+                        help='number of lines in the changed file')
+    parser.add_argument('--every', type=int, default=1,
+                        help='change every N-th line')
+    parser.add_argument('--lookups', type=int, default=200,
+                        help='number of line lookups to time')
+    args = parser.parse_args()
+    path = tempfile.mkdtemp(prefix='hubtty-bench-')
+    try:
+        old, new = make_repo(path, args.lines, args.every)
+        repo = gitrepo.Repo(None, path)
+        parse_time = common.best_of(lambda: parse(repo, old, new),
+                                    args.repeat)
+        f, stored = measure(lambda: parse(repo, old, new))
+        chunks = [c for c in f.chunks if not c.gap]
+        materialized, listed = measure(
+            lambda: [list(c.lines) for c in chunks])
+        rnd = random.Random(4)
+        lookups = [rnd.randint(1, args.lines) for _ in range(args.lookups)]
+
+        # Find the chunk holding each line as the diff view does, then
+        # the position of the line within it.
+        def find(index):
+            for lineno in lookups:
+                for i, c in enumerate(chunks):
+                    if (c.range[gitrepo.NEW][gitrepo.START] <= lineno <=
+                        c.range[gitrepo.NEW][gitrepo.END]):
+                        index(i, c, lineno)
+                        break
+
+        def indexed():
+            find(lambda i, c, lineno: c.indexOfLine(gitrepo.NEW, lineno))
+
+        def scanned():
+            find(lambda i, c, lineno: linear_index(materialized[i],
+                                                   gitrepo.NEW, lineno))
+
+        rows = [{
+            'lines': sum(len(c.lines) for c in chunks),
+            'parse (s)': parse_time,
+            'parsed (MiB)': stored / 2 ** 20,
+            'as tuples (MiB)': listed / 2 ** 20,
+            'indexOfLine (s)': common.best_of(indexed, args.repeat),
+            'linear scan (s)': common.best_of(scanned, args.repeat),
+        }]
+    finally:
+        shutil.rmtree(path)
+    common.report('diff storage', rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# Copyright The Hubtty Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark highlighting the displayed lines of large files.
+
+For Python files of increasing length, time how long it takes to get
+the markup of 20 lines near the top and 20 lines in the middle, by
+lexing the whole file (hubtty.syntax.highlight_file) and incrementally
+(hubtty.syntax.LineHighlighter).
+"""
+
+from benchmarks import common
+from hubtty import syntax
+
+
+def python_file(nlines):
+    lines = []
+    while len(lines) < nlines:
+        i = len(lines)
+        lines += ['def function_%d(value):' % i,
+                  '    """Return a value derived from %d."""' % i,
+                  '    return value * %d + len("%d")' % (i, i),
+                  '']
+    return '\n'.join(lines[:nlines]) + '\n'
+
+
+def whole(text, first):
+    markup = syntax.highlight_file('example.py', text, max_file_size=10 ** 9)
+    return [markup.get(i) for i in range(first, first + 20)]
+
+
+def incremental(text, first):
+    lines = syntax.LineHighlighter(syntax.get_lexer('example.py'), text)
+    return [lines.get(i) for i in range(first, first + 20)]
+
+
+def main():
+    parser = common.parser(__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default='1000,10000,50000',
+                        help='comma-separated file lengths in lines')
+    args = parser.parse_args()
+    rows = []
+    for nlines in map(int, args.sizes.split(',')):
+        text = python_file(nlines)
+        for where, first in (('top', 10), ('middle', nlines // 2)):
+            assert whole(text, first) == incremental(text, first)
+            rows.append({
+                'lines': nlines,
+                'displayed': where,
+                'whole file (s)': common.best_of(
+                    lambda: whole(text, first), args.repeat),
+                'incremental (s)': common.best_of(
+                    lambda: incremental(text, first), args.repeat),
+            })
+    common.report('highlight', rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+# Copyright The Hubtty Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark the intraline diff engines on large hunks.
+
+By default a few synthetic hunks modelled on the worst real-world cases
+(lockfile bumps, reformatting, minified assets) are used.  Pass --repo
+and --range to benchmark the largest hunks of a real commit range
+instead:
+
+    python -m benchmarks.bench_intraline --repo ~/src/project \\
+        --range v1.0..v2.0
+"""
+
+import hashlib
+import random
+import subprocess
+
+from benchmarks import common
+from hubtty import intraline
+
+
+def _lockfile_hunk(n):
+    rnd = random.Random(1)
+    old, new = [], []
+    for i in range(n):
+        name = 'package-%d' % i
+        major, minor = rnd.randint(0, 9), rnd.randint(0, 30)
+        old_digest = hashlib.sha512(b'%d-old' % i).hexdigest()
+        new_digest = hashlib.sha512(b'%d-new' % i).hexdigest()
+        old += ['    "node_modules/%s": {' % name,
+                '      "version": "%d.%d.0",' % (major, minor),
+                '      "resolved": "https://registry.npmjs.org/%s/-/%s-%d.%d.0.tgz",'
+                % (name, name, major, minor),
+                '      "integrity": "sha512-%s",' % old_digest]
+        new += ['    "node_modules/%s": {' % name,
+                '      "version": "%d.%d.1",' % (major, minor),
+                '      "resolved": "https://registry.npmjs.org/%s/-/%s-%d.%d.1.tgz",'
+                % (name, name, major, minor),
+                '      "integrity": "sha512-%s",' % new_digest]
+    return old, new
+
+
+def _reformat_hunk(n):
+    old, new = [], []
+    for i in range(n):
+        old.append("    result_%d = compute(alpha,beta,'key_%d',gamma=%d)"
+                   % (i, i, i))
+        new.append('    result_%d = compute(alpha, beta, "key_%d", gamma=%d)'
+                   % (i, i, i))
+    return old, new
+
+
+def _minified_hunk(n):
+    rnd = random.Random(2)
+    old, new = [], []
+    for i in range(n):
+        tokens = ['var a%d=function(b){return b*%d};' % (j, rnd.randint(0, 99))
+                  for j in range(600)]
+        old.append(''.join(tokens))
+        tokens[rnd.randrange(len(tokens))] = 'var z=1;'
+        new.append(''.join(tokens))
+    return old, new
+
+
+def synthetic_hunks():
+    return [('lockfile (800 lines)', *_lockfile_hunk(100)),
+            ('reformat (400 lines)', *_reformat_hunk(200)),
+            ('minified (5 x 20k chars)', *_minified_hunk(5))]
+
+
+def repo_hunks(path, revision_range, min_lines, limit):
+    output = subprocess.check_output(
+        ['git', '-C', path, 'diff', '--no-color', '--no-ext-diff', '-U0',
+         revision_range]).decode('utf-8', errors='replace')
+    hunks = []
+    filename = None
+    old, new = [], []
+
+    def flush():
+        if len(old) + len(new) >= min_lines:
+            hunks.append(('%s (%d lines)' % (filename, len(old) + len(new)),
+                          list(old), list(new)))
+        old.clear()
+        new.clear()
+
+    for line in output.split('\n'):
+        if line.startswith('+++ '):
+            filename = line[6:]
+        elif line.startswith('--- ') or line.startswith('diff '):
+            flush()
+        elif line.startswith('@@'):
+            flush()
+        elif line.startswith('-'):
+            old.append(line[1:])
+        elif line.startswith('+'):
+            new.append(line[1:])
+    flush()
+    hunks.sort(key=lambda h: len(h[1]) + len(h[2]), reverse=True)
+    return hunks[:limit]
+
+
+def main():
+    parser = common.parser(__doc__.split('\n')[0])
+    parser.add_argument('--repo', help='git repository to take hunks from')
+    parser.add_argument('--range', default='HEAD~1..HEAD',
+                        help='revision range to diff (with --repo)')
+    parser.add_argument('--min-lines', type=int, default=100,
+                        help='ignore smaller hunks (with --repo)')
+    parser.add_argument('--limit', type=int, default=5,
+                        help='number of hunks to benchmark (with --repo)')
+    parser.add_argument('--engines', default='word,character',
+                        help='comma-separated engines to compare')
+    args = parser.parse_args()
+    if args.repo:
+        hunks = repo_hunks(args.repo, args.range, args.min_lines, args.limit)
+    else:
+        hunks = synthetic_hunks()
+    rows = []
+    for name, old, new in hunks:
+        row = {'hunk': name}
+        for engine_name in args.engines.split(','):
+            engine = intraline.get_engine(engine_name)
+            row[engine_name + ' (s)'] = common.best_of(
+                lambda: engine.compare(old, new), args.repeat)
+        rows.append(row)
+    common.report('intraline', rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,406 @@
+# Copyright The Hubtty Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark building, refreshing and drawing the main views.
+
+A temporary database is filled with thousands of open pull requests
+spread over a number of repositories.  One of them is large: its
+commits change every file of a real git repository (built with ``git
+fast-import``) in many places, and it carries many messages and inline
+comments.  The views are then created headless, against a fake screen:
+
+* the repository list;
+* the list of every open pull request;
+* the large pull request;
+* its whole diff, side by side and unified.
+
+For each view, the time to construct it, to run the background jobs
+it starts (loading diffs, checking the git repository), to refresh it
+and to render and draw the first screen is reported, along with the
+SQL statements executed and the peak memory allocated.  Caches are
+emptied before each run, so that a view is measured as it is opened
+for the first time; the refresh is the second load.
+"""
+
+import datetime
+import os
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import types
+
+import urwid
+from sqlalchemy import event
+
+from benchmarks import common
+
+EPOCH = datetime.datetime(2024, 1, 1)
+
+
+class FakeScreen:
+    """Just enough of an urwid screen to size and draw views on."""
+
+    def __init__(self, cols, rows):
+        self.size = (cols, rows)
+        self.drawn = 0
+
+    def get_cols_rows(self):
+        return self.size
+
+    def draw_screen(self, size, canvas):
+        # Walk every segment of every row, as a real screen does when
+        # it writes the canvas out.
+        for row in canvas.content():
+            for attr, cs, text in row:
+                self.drawn += len(text)
+
+    def clear(self):
+        pass
+
+
+def make_config(tmp, args):
+    from hubtty import config
+
+    class BenchConfig(config.Config):
+        def getToken(self, name, url):
+            # Never read or prompt for real credentials.
+            return 'bench'
+
+    path = os.path.join(tmp, 'hubtty.yaml')
+    with open(path, 'w') as f:
+        f.write('servers:\n'
+                '  - name: bench\n'
+                '    git-root: %(tmp)s/git\n'
+                '    dburi: sqlite:///%(tmp)s/hubtty.db\n'
+                '    log-file: %(tmp)s/hubtty.log\n'
+                '    lock-file: %(tmp)s/hubtty.lock\n'
+                '    snapshot-file: %(tmp)s/snapshot.json\n'
+                'diff-view: side-by-side\n'
+                'diff-prefetch: 0\n'
+                'hide-generated-files: false\n'
+                'startup-snapshot: false\n' % dict(tmp=tmp))
+    return BenchConfig('bench', path=path)
+
+
+class BenchApp:
+    """The parts of hubtty.app.App the views use, without a main loop.
+
+    Background jobs are queued and only run by :meth:`runJobs`, so
+    that their cost can be told apart from that of the main thread.
+    """
+
+    def __init__(self, config, cols, rows):
+        import logging
+
+        from hubtty import db, mywid, search
+        from hubtty.app import App, RepositoryCache
+
+        # Reuse the real implementations where they only need config.
+        self.time = types.MethodType(App.time, self)
+        self.isOwnAccount = types.MethodType(App.isOwnAccount, self)
+        self.getOwnAccountId = types.MethodType(App.getOwnAccountId, self)
+        self.config = config
+        self.log = logging.getLogger('hubtty.App')
+        self.own_account_id = None
+        self.db = db.Database(self, config.dburi,
+                              search.SearchCompiler(self.getOwnAccountId))
+        self.repository_cache = RepositoryCache()
+        self.ring = mywid.KillRing()
+        self.input_buffer = []
+        self.status = types.SimpleNamespace(update=lambda **kw: None)
+        self.header = urwid.AttrMap(urwid.Text(''), 'header')
+        self.loop = types.SimpleNamespace(
+            screen=FakeScreen(cols, rows),
+            set_alarm_in=lambda *args, **kw: None)
+        # Missing commits are an error rather than a fetch.
+        self.sync = types.SimpleNamespace(offline=True)
+        self.jobs = []
+        self.resetCaches()
+
+    def resetCaches(self):
+        """Empty every cache, as on start-up."""
+        from hubtty import diffcache, highlighter, markdown
+        highlighter.configure(processes=self.config.highlight_processes)
+        self.diff_cache = diffcache.DiffCache(self.config.diff_cache_size)
+        self.diff_prefetcher = diffcache.DiffPrefetcher(
+            self, self.diff_cache, self.config.diff_prefetch,
+            self.config.diff_prefetch_max_lines)
+        self.render_cache = markdown.RenderCache()
+        self.repository_cache.repositories.clear()
+
+    def runInBackground(self, func, callback, errback=None, owner=None):
+        from hubtty.app import BackgroundJob
+        job = BackgroundJob(func, callback, errback, owner)
+        self.jobs.append(job)
+        return job
+
+    def runJobs(self):
+        """Run queued background jobs, and those they start."""
+        while self.jobs:
+            job = self.jobs.pop(0)
+            if job.cancelled:
+                continue
+            result = job.func(job)
+            if not job.cancelled:
+                job.callback(result)
+
+    def findPullRequestList(self):
+        return None
+
+    def error(self, message, title='Error'):
+        raise RuntimeError('%s: %s' % (title, message))
+
+
+def source_line(f, i, version=0):
+    if version and i % 7 == f % 7:
+        return '    total_%d = compute(total_%d, %d)  # v%d\n' % (
+            i, i - 1, i * version, version)
+    return '    total_%d = compute(total_%d, %d)\n' % (i, i - 1, i)
+
+
+def source_file(f, nlines, version=0):
+    lines = ['def function_%d(total_0):\n' % f]
+    lines += [source_line(f, i, version) for i in range(1, nlines)]
+    return ''.join(lines)
+
+
+def make_git_repo(path, files, nlines, commits):
+    """Create a repository with a base and *commits* changing *files*.
+
+    Returns the base SHA and the SHA of each commit.
+    """
+    os.makedirs(path)
+    subprocess.run(['git', 'init', '-q', '-b', 'main', path], check=True)
+    stream = []
+
+    def data(text):
+        raw = text.encode()
+        stream.append(b'data %d\n%s\n' % (len(raw), raw))
+
+    for mark in range(1, commits + 2):
+        version = mark - 1
+        stream.append(b'commit refs/heads/%s\nmark :%d\n' % (
+            b'main' if not version else b'pr', mark))
+        stream.append(b'committer Bench <bench@example.com> '
+                      b'%d +0000\n' % (1704067200 + mark))
+        data('Initial commit' if not version else 'Change %d' % version)
+        if version:
+            stream.append(b'from :%d\n' % (mark - 1))
+        for f in range(files):
+            stream.append(b'M 100644 inline src/module%03d.py\n' % f)
+            # Later commits also grow the files.
+            data(source_file(f, nlines + version * 10, version))
+    marks_file = path + '.marks'
+    subprocess.run(['git', '-C', path, 'fast-import', '--quiet',
+                    '--export-marks=' + marks_file],
+                   input=b''.join(stream), check=True)
+    with open(marks_file) as f:
+        shas = [line.split()[1] for line in f]
+    os.unlink(marks_file)
+    return shas[0], shas[1:]
+
+
+def populate(app, args):
+    """Fill the database; return the key of the large pull request."""
+    with app.db.getSession() as session:
+        accounts = [session.createAccount(i, name='User %d' % i,
+                                          username='user%d' % i)
+                    for i in range(1, args.accounts + 1)]
+        app.own_account_id = accounts[0].id
+        repositories = [session.createRepository('bench/repo%03d' % r,
+                                                 subscribed=True)
+                        for r in range(args.repos)]
+        pr_id = 1000
+        for n in range(args.prs):
+            repository = repositories[n % args.repos]
+            number = n // args.repos + 1
+            pr_id += 1
+            updated = EPOCH + datetime.timedelta(minutes=n)
+            pr = repository.createPullRequest(
+                pr_id, accounts[n % args.accounts], number, 'main',
+                '%s/pulls/%d' % (repository.name, number),
+                'Change %d of %s' % (number, repository.name),
+                'Description of change %d.' % number, updated, updated,
+                'open', n % 500, n % 100,
+                'https://github.invalid/%s/pull/%d' % (
+                    repository.name, number),
+                False, True, reviewed=bool(n % 3))
+            sha = '%040x' % pr_id
+            commit = pr.createCommit('Change %d' % number, sha, '0' * 40)
+            commit.createFile('src/module000.py', 'modified', None,
+                              n % 500, n % 100)
+
+        # The large pull request, backed by a real git repository.
+        base, shas = make_git_repo(
+            os.path.join(app.config.git_root, repositories[0].name),
+            args.files, args.lines, args.commits)
+        changed = len(range(0, args.lines, 7))
+        pr = repositories[0].createPullRequest(
+            pr_id + 1, accounts[1 % args.accounts], args.prs + 1, 'main',
+            '%s/pulls/%d' % (repositories[0].name, args.prs + 1),
+            'A large change', 'A large change.\n\n' + 'Details. ' * 200,
+            EPOCH, EPOCH, 'open', args.files * changed, args.files * changed,
+            'https://github.invalid/large', False, True)
+        parent = base
+        commits = []
+        for c, sha in enumerate(shas):
+            commit = pr.createCommit('Change %d' % (c + 1), sha, parent)
+            files = [commit.createFile('src/module%03d.py' % f, 'modified',
+                                       None, changed + 10, changed)
+                     for f in range(args.files)]
+            commits.append((commit, files))
+            parent = sha
+        last, files = commits[-1]
+        comment_id = 10 ** 6
+        for m in range(args.messages):
+            author = accounts[m % args.accounts]
+            created = EPOCH + datetime.timedelta(minutes=m)
+            message = pr.createMessage(
+                last.key, comment_id + m, author, created,
+                'Review %d.\n\n* a point\n* another `point`\n\n'
+                'See https://github.invalid/issue/%d' % (m, m))
+            for c in range(args.comments // max(args.messages, 1)):
+                f = files[c % len(files)]
+                comment_id += args.messages
+                line = 1 + (c * 7) % args.lines
+                message.createComment(
+                    f.key, comment_id, author, None, created, created,
+                    False, last.sha, last.sha, line, line,
+                    'Inline comment %d on %s' % (c, f.path))
+        return pr.key, last.key, base
+
+
+def view_cases(app, pr_key, commit_key, base):
+    from hubtty.view import pull_request as view_pr
+    from hubtty.view import pull_request_list as view_pr_list
+    from hubtty.view import repository_list as view_repository_list
+    from hubtty.view.side_diff import SideDiffView
+    from hubtty.view.unified_diff import UnifiedDiffView
+
+    return [
+        ('repository list',
+         lambda: view_repository_list.RepositoryListView(app),
+         lambda view: view.refresh()),
+        ('pull request list',
+         lambda: view_pr_list.PullRequestListView(app, 'state:open'),
+         lambda view: view.refresh()),
+        ('pull request',
+         lambda: view_pr.PullRequestView(app, pr_key),
+         lambda view: view.refresh()),
+        ('side-by-side diff',
+         lambda: SideDiffView(app, commit_key, base_sha=base),
+         lambda view: view._init()),
+        ('unified diff',
+         lambda: UnifiedDiffView(app, commit_key, base_sha=base),
+         lambda view: view._init()),
+    ]
+
+
+class Counter:
+    """Count the SQL statements executed by a database."""
+
+    def __init__(self, engine):
+        self.statements = 0
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.statements += 1
+
+
+def render(app, view):
+    screen = app.loop.screen
+    canvas = view.render(screen.get_cols_rows(), focus=True)
+    screen.draw_screen(screen.get_cols_rows(), canvas)
+
+
+def measure(app, counter, construct, refresh):
+    """Time one run of a view; return the timings and statements."""
+    app.resetCaches()
+    timings = {}
+    statements = counter.statements
+
+    def step(name, func):
+        start = time.perf_counter()
+        result = func()
+        timings[name] = time.perf_counter() - start
+        return result
+
+    view = step('construct (s)', construct)
+    step('jobs (s)', app.runJobs)
+    step('render (s)', lambda: render(app, view))
+    step('refresh (s)', lambda: (refresh(view), app.runJobs()))
+    timings['SQL statements'] = counter.statements - statements
+    return timings
+
+
+def peak_memory(app, construct):
+    """Peak memory (MB) allocated to construct and draw a view."""
+    app.resetCaches()
+    tracemalloc.start()
+    try:
+        view = construct()
+        app.runJobs()
+        render(app, view)
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = common.parser(__doc__.split('\n')[0])
+    parser.set_defaults(repeat=3)
+    parser.add_argument('--repos', type=int, default=20)
+    parser.add_argument('--prs', type=int, default=3000,
+                        help='open pull requests in total')
+    parser.add_argument('--accounts', type=int, default=50)
+    parser.add_argument('--files', type=int, default=20,
+                        help='files changed by the large pull request')
+    parser.add_argument('--lines', type=int, default=2000,
+                        help='lines per file of the large pull request')
+    parser.add_argument('--commits', type=int, default=3,
+                        help='commits of the large pull request')
+    parser.add_argument('--messages', type=int, default=50,
+                        help='messages on the large pull request')
+    parser.add_argument('--comments', type=int, default=200,
+                        help='inline comments on the large pull request')
+    parser.add_argument('--size', default='200x60',
+                        help='screen size, in columns x rows')
+    args = parser.parse_args()
+    cols, rows = map(int, args.size.split('x'))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = BenchApp(make_config(tmp, args), cols, rows)
+        start = time.perf_counter()
+        pr_key, commit_key, base = populate(app, args)
+        setup = time.perf_counter() - start
+        counter = Counter(app.db.engine)
+        results = []
+        for name, construct, refresh in view_cases(app, pr_key,
+                                                   commit_key, base):
+            runs = [measure(app, counter, construct, refresh)
+                    for _ in range(args.repeat)]
+            row = {'view': name}
+            for column in runs[0]:
+                row[column] = min(run[column] for run in runs)
+            row['peak memory (MB)'] = peak_memory(app, construct)
+            results.append(row)
+    common.report('render (%d pull requests in %d repositories, setup '
+                  '%.1fs, %dx%d screen)' % (args.prs, args.repos, setup,
+                                            cols, rows),
+                  results, args.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# Copyright The Hubtty Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark start-up: importing hubtty and opening the database.
+
+Each run starts a fresh interpreter with ``-X importtime``, imports
+hubtty.app and opens a database which is already at the head revision,
+as on every launch but the first after an upgrade.  The slowest
+packages imported along the way are listed, and whether the lazily
+imported ones (Alembic, GitPython, mistune) were loaded anyway.
+"""
+
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import types
+
+from benchmarks import common
+
+CHILD = '''
+import json, sys, time, types
+start = time.perf_counter()
+import hubtty.app
+imported = time.perf_counter()
+from hubtty import db, search
+db.Database(types.SimpleNamespace(), sys.argv[1],
+            search.SearchCompiler(lambda: None))
+opened = time.perf_counter()
+json.dump({'import': imported - start, 'open': opened - imported,
+           'loaded': [m for m in ('alembic', 'git', 'mistune')
+                      if m in sys.modules]}, sys.stdout)
+'''
+
+_importtime_re = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def parse_importtime(output):
+    """Return ``{top-level package: cumulative seconds}`` from stderr."""
+    packages = {}
+    for line in output.splitlines():
+        m = _importtime_re.match(line)
+        if not m:
+            continue
+        name = m.group(4)
+        if '.' in name:
+            continue
+        seconds = int(m.group(2)) / 1e6
+        packages[name] = max(packages.get(name, 0), seconds)
+    return packages
+
+
+def run_child(dburi):
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD, dburi],
+        capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return json.loads(proc.stdout), parse_importtime(proc.stderr)
+
+
+def main():
+    parser = common.parser(__doc__.split('\n')[0])
+    parser.add_argument('--top', type=int, default=10,
+                        help='number of slowest packages to list')
+    args = parser.parse_args()
+
+    from hubtty import db, search
+    with tempfile.TemporaryDirectory() as tmp:
+        dburi = 'sqlite:///' + os.path.join(tmp, 'hubtty.db')
+        # Create the database at the head revision up front.
+        db.Database(types.SimpleNamespace(), dburi,
+                    search.SearchCompiler(lambda: None))
+        best = None
+        for _ in range(args.repeat):
+            timings, packages = run_child(dburi)
+            if best is None or (timings['import'] + timings['open'] <
+                                best[0]['import'] + best[0]['open']):
+                best = (timings, packages)
+
+    timings, packages = best
+    common.report('startup', [{
+        'import hubtty.app (s)': timings['import'],
+        'open database (s)': timings['open'],
+        'lazy modules loaded': ','.join(timings['loaded']) or 'none',
+    }], args.json)
+    slowest = sorted(packages.items(), key=lambda item: -item[1])
+    common.report('slowest imports', [
+        {'package': name, 'cumulative (s)': seconds}
+        for name, seconds in slowest[:args.top]], args.json)
+
+
+if __name__ == '__main__':
+    main()
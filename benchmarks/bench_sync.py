@@ -0,0 +1,234 @@
+# Copyright The Hubtty Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark sync end to end against a local fake GitHub.
+
+A real Sync and Database (on a temporary SQLite file) talk to the
+server of :mod:`benchmarks.fakegithub`, and fetch commits from local
+git repositories.  Three phases are measured:
+
+* initial: account, repository list, then every pull request of every
+  (subscribed) repository, with their branches and labels;
+* poll: the periodic sync of subscribed repositories, after a fraction
+  of the pull requests received a new comment (``--changed``);
+* resync: every pull request marked outdated and synced again, which
+  should be answered from the ETag cache.
+
+For each phase, the wall time, the requests made and the share answered
+with 304 Not Modified, the SQL statements executed, the time the
+database lock was held and the peak RSS of the process are reported.
+"""
+
+import os
+import resource
+import tempfile
+import time
+import types
+
+from sqlalchemy import event
+
+from benchmarks import common
+from benchmarks.fakegithub import FakeGitHub
+
+
+class TimedLock:
+    """A lock wrapper which adds up the time it is held."""
+
+    def __init__(self, lock):
+        self.lock = lock
+        self.held = 0.0
+        self._acquired = None
+
+    def acquire(self, *args, **kw):
+        result = self.lock.acquire(*args, **kw)
+        self._acquired = time.perf_counter()
+        return result
+
+    def release(self):
+        self.held += time.perf_counter() - self._acquired
+        self.lock.release()
+
+
+def make_app(tmp, api_url, git_url, args):
+    from hubtty import db, search
+    from hubtty.app import RepositoryCache
+
+    errors = []
+
+    def update(error=False, **kw):
+        if error:
+            errors.append(True)
+
+    config = types.SimpleNamespace(
+        api_url=api_url, url='https://github.invalid/', git_url=git_url,
+        git_root=os.path.join(tmp, 'git'), token='bench',
+        additional_repositories=[], expire_age='2 months',
+        ignore_pending_checks=[], intraline_diff='word',
+        pagination_parallelism=args.pagination_parallelism,
+        http_pool_size=10, http_keepalive=60, http2=False)
+    app = types.SimpleNamespace(
+        config=config, own_account_id=None, errors=errors,
+        status=types.SimpleNamespace(update=update),
+        error=lambda message: errors.append(message),
+        registerPaletteEntry=lambda *a: None,
+        repository_cache=RepositoryCache())
+    app.db = db.Database(app, 'sqlite:///' + os.path.join(tmp, 'hubtty.db'),
+                         search.SearchCompiler(lambda: app.own_account_id))
+    app.db.lock = TimedLock(app.db.lock)
+    return app
+
+
+class Runner:
+    """Run sync tasks to completion and measure each phase."""
+
+    def __init__(self, app, github):
+        from hubtty.sync import Sync
+        self.app = app
+        self.github = github
+        self.statements = 0
+        event.listen(app.db.engine, 'before_cursor_execute',
+                     self._countStatement)
+        self.read_fd, self.write_fd = os.pipe()
+        os.set_blocking(self.read_fd, False)
+        self.sync = app.sync = Sync(app, disable_background_sync=True)
+
+    def _countStatement(self, *args):
+        self.statements += 1
+
+    def drain(self):
+        """Run queued tasks until there are none left."""
+        sync = self.sync
+        while sync.queue.qsize():
+            sync._run(self.write_fd)
+            try:
+                os.read(self.read_fd, 65536)
+            except BlockingIOError:
+                pass
+            while not sync.result_queue.empty():
+                sync.result_queue.get()
+
+    def run(self, *tasks):
+        """Submit *tasks* and run them, and any they submit, to the end."""
+        for task in tasks:
+            self.sync.submitTask(task)
+        self.drain()
+
+    def phase(self, name, work):
+        """Call *work* and return the measurements taken meanwhile."""
+        stats = dict(self.github.stats)
+        statements = self.statements
+        held = self.app.db.lock.held
+        errors = len(self.app.errors)
+        start = time.perf_counter()
+        work()
+        elapsed = time.perf_counter() - start
+        requests = self.github.stats['requests'] - stats.get('requests', 0)
+        not_modified = (self.github.stats['not_modified'] -
+                        stats.get('not_modified', 0))
+        return {
+            'phase': name,
+            'wall (s)': elapsed,
+            'requests': requests,
+            '304 ratio': not_modified / requests if requests else 0.0,
+            'SQL statements': self.statements - statements,
+            'lock held (s)': self.app.db.lock.held - held,
+            'errors': len(self.app.errors) - errors,
+            'max RSS (MB)': resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
+
+
+def subscribe_all(app):
+    with app.db.getSession() as session:
+        for repository in session.getRepositories():
+            repository.subscribed = True
+
+
+def mark_outdated(app):
+    with app.db.getSession() as session:
+        for pr in session.getPullRequests('state:open'):
+            pr.outdated = True
+
+
+def run_once(github, git_dir, args):
+    from hubtty.sync import (
+        SyncOutdatedPullRequestsTask, SyncRepositoryListTask,
+        SyncSubscribedRepositoriesTask, SyncSubscribedRepositoryBranchesTask,
+        SyncSubscribedRepositoryLabelsTask)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(tmp, github.api_url, 'file://' + git_dir + '/', args)
+        runner = Runner(app, github)
+
+        def initial():
+            # The account sync submitted by Sync comes first.
+            runner.run(SyncRepositoryListTask())
+            subscribe_all(app)
+            runner.run(SyncSubscribedRepositoriesTask(),
+                       SyncSubscribedRepositoryBranchesTask(),
+                       SyncSubscribedRepositoryLabelsTask())
+
+        def poll():
+            github.touch(args.changed)
+            runner.run(SyncSubscribedRepositoriesTask())
+
+        def resync():
+            mark_outdated(app)
+            runner.run(SyncOutdatedPullRequestsTask())
+
+        rows = [runner.phase('initial', initial),
+                runner.phase('poll', poll),
+                runner.phase('resync', resync)]
+        return rows
+
+
+def main():
+    parser = common.parser(__doc__.split('\n')[0])
+    parser.set_defaults(repeat=1)
+    parser.add_argument('--repos', type=int, default=10)
+    parser.add_argument('--prs', type=int, default=20,
+                        help='open pull requests per repository')
+    parser.add_argument('--commits', type=int, default=2,
+                        help='commits per pull request')
+    parser.add_argument('--comments', type=int, default=5,
+                        help='issue and inline comments per pull request')
+    parser.add_argument('--changed', type=float, default=0.1,
+                        help='fraction of pull requests changed before '
+                        'the poll')
+    parser.add_argument('--page-size', type=int, default=100,
+                        help='largest page the server returns')
+    parser.add_argument('--pagination-parallelism', type=int, default=4)
+    args = parser.parse_args()
+
+    best = None
+    with tempfile.TemporaryDirectory() as git_dir:
+        for _ in range(args.repeat):
+            # Fresh data for every run, as the poll changes it.
+            github = FakeGitHub(repos=args.repos, prs=args.prs,
+                                commits=args.commits, comments=args.comments,
+                                page_size=args.page_size, git_dir=git_dir)
+            github.start()
+            try:
+                rows = run_once(github, git_dir, args)
+            finally:
+                github.stop()
+            if best is None or (sum(r['wall (s)'] for r in rows) <
+                                sum(r['wall (s)'] for r in best)):
+                best = rows
+    common.report('sync (%d repos x %d pull requests)' % (
+        args.repos, args.prs), best, args.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# Copyright The Hubtty Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark merging syntax markup with diff markup on long lines.
+
+Minified JavaScript lines are highlighted with Pygments and given diff
+markup emphasising a few words, then merged with
+hubtty.syntax.merge_syntax_with_diff and with the character-by-character
+merge it replaced.
+"""
+
+import random
+
+from benchmarks import common
+from hubtty import syntax
+
+
+def character_merge(syntax_markup, diff_markup):
+    """The previous merge, one (attr, char) tuple per character."""
+    syn_chars = syntax._flatten_to_chars(syntax_markup)
+    diff_chars = syntax._flatten_to_chars(diff_markup)
+    if not syn_chars or not diff_chars:
+        return diff_markup
+    if ''.join(c for _, c in syn_chars) != ''.join(c for _, c in diff_chars):
+        return diff_markup
+    return syntax._chars_to_markup([
+        (syntax._merged_attr(diff_attr, syn_chars[i][0]), char)
+        for i, (diff_attr, char) in enumerate(diff_chars)])
+
+
+def minified_lines(count, length):
+    rnd = random.Random(5)
+    lines = []
+    for _ in range(count):
+        tokens = []
+        while sum(map(len, tokens)) < length:
+            tokens.append('var a%d=function(b){return "s%d"+b*%d};'
+                          % (len(tokens), rnd.randint(0, 99),
+                             rnd.randint(0, 99)))
+        # Emphasise about one token in fifty as changed.
+        markup = [('added-word' if rnd.random() < 0.02 else 'added-line',
+                   token) for token in tokens]
+        lines.append((''.join(tokens), markup))
+    return lines
+
+
+def main():
+    parser = common.parser(__doc__.split('\n')[0])
+    parser.add_argument('--lines', type=int, default=5,
+                        help='number of changed lines')
+    parser.add_argument('--lengths', default='2000,20000,100000',
+                        help='comma-separated line lengths in characters')
+    args = parser.parse_args()
+    rows = []
+    for length in map(int, args.lengths.split(',')):
+        lines = minified_lines(args.lines, length)
+        highlighted = syntax.highlight_file(
+            'a.js', '\n'.join(text for text, _ in lines),
+            max_file_size=10 ** 8)
+        pairs = [(highlighted.get(i + 1, ''), markup)
+                 for i, (_, markup) in enumerate(lines)]
+        for syn, diff in pairs:
+            assert (syntax.merge_syntax_with_diff(syn, diff) ==
+                    character_merge(syn, diff))
+        rows.append({
+            'line length': length,
+            'spans (s)': common.best_of(
+                lambda: [syntax.merge_syntax_with_diff(*p) for p in pairs],
+                args.repeat),
+            'characters (s)': common.best_of(
+                lambda: [character_merge(*p) for p in pairs], args.repeat),
+        })
+    common.report('syntax merge', rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# Copyright The Hubtty Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Helpers shared by the benchmark scripts."""
+
+import argparse
+import json
+import sys
+import time
+
+
+def parser(description):
+    """Return an argument parser with the common benchmark options."""
+    p = argparse.ArgumentParser(description=description)
+    p.add_argument('--repeat', type=int, default=5,
+                   help='number of timed runs; the best is reported')
+    p.add_argument('--json', action='store_true',
+                   help='print results as JSON instead of a table')
+    return p
+
+
+def best_of(func, repeat):
+    """Run *func* *repeat* times and return the fastest wall time."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def report(name, rows, as_json=False, out=sys.stdout):
+    """Print *rows* (a list of dicts with the same keys)."""
+    if as_json:
+        json.dump({'benchmark': name, 'results': rows}, out, indent=2)
+        out.write('\n')
+        return
+    if not rows:
+        return
+    columns = list(rows[0].keys())
+    cells = [[_format(row[c]) for c in columns] for row in rows]
+    widths = [max(len(c), *(len(r[i]) for r in cells))
+              for i, c in enumerate(columns)]
+    out.write(name + '\n')
+    out.write('  '.join(c.ljust(w) for c, w in zip(columns, widths)) + '\n')
+    for r in cells:
+        out.write('  '.join(v.ljust(w) for v, w in zip(r, widths)) + '\n')
+
+
+def _format(value):
+    if isinstance(value, float):
+        return '%.4f' % value
+    return str(value)
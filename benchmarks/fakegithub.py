@@ -0,0 +1,470 @@
+# Copyright The Hubtty Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""A local stand-in for the GitHub REST API, for benchmarks.
+
+:class:`FakeGitHub` generates *repos* repositories with *prs* open pull
+requests each, every one with *commits* commits, *comments* issue
+comments and as many inline review comments.  It serves them over HTTP
+on localhost with the behaviour sync relies on:
+
+* ``ETag`` headers, and ``304 Not Modified`` for a matching
+  ``If-None-Match``;
+* ``Link`` headers with ``next`` and ``last`` page links;
+* ``X-RateLimit-*`` headers, decremented on every request but 304s;
+* search filtering on ``repo:``, ``state:`` and ``updated:>``.
+
+With *git_dir* set, a git repository holding the commits of every pull
+request (under ``refs/pull/N/head``) is created for each repository, so
+that sync can fetch them from ``file://`` URLs.
+
+Every request is counted in :attr:`FakeGitHub.stats`.
+"""
+
+import collections
+import datetime
+import hashlib
+import http.server
+import json
+import os
+import re
+import subprocess
+import threading
+import urllib.parse
+
+EPOCH = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _iso(when):
+    return when.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _user(uid):
+    return {'id': uid, 'login': 'user%d' % uid}
+
+
+class FakeGitHub:
+    """Generated GitHub data served over HTTP on localhost."""
+
+    def __init__(self, repos=10, prs=20, commits=2, comments=5,
+                 files=3, page_size=100, git_dir=None, rate_limit=100000):
+        self.page_size = page_size
+        self.lock = threading.Lock()
+        self.stats = collections.Counter()
+        # Large enough by default for a benchmark never to wait for
+        # the (fictitious) reset time.
+        self.rate_limit = self.rate_remaining = rate_limit
+        self._ids = iter(range(1000, 1 << 62))
+        self.repos = collections.OrderedDict()
+        for r in range(repos):
+            name = 'bench/repo%03d' % r
+            self.repos[name] = self._makeRepo(name, prs, commits, comments,
+                                              files)
+        if git_dir:
+            for name, repo in self.repos.items():
+                self._makeGitRepo(os.path.join(git_dir, name), repo)
+        self._commits_by_sha = {}
+        for repo in self.repos.values():
+            for pr in repo['prs'].values():
+                parent = repo.get('base')
+                for c in pr['commits']:
+                    c['parent'] = parent
+                    parent = c['sha']
+                    self._commits_by_sha[c['sha']] = c
+        self.server = None
+
+    # Data generation
+
+    def _makeRepo(self, name, prs, commits, comments, files):
+        labels = [{'id': next(self._ids), 'name': label, 'color': color,
+                   'description': label}
+                  for label, color in (('bug', 'd73a4a'),
+                                       ('enhancement', 'a2eeef'),
+                                       ('ci', '0e8a16'))]
+        repo = {'name': name, 'labels': labels, 'prs': {}}
+        for number in range(1, prs + 1):
+            created = EPOCH + datetime.timedelta(hours=number)
+            pr = {
+                'number': number,
+                'id': next(self._ids),
+                'title': 'Change %d of %s' % (number, name),
+                'body': 'Description of change %d.\n\n' % number * 3,
+                'created': created,
+                'updated': created + datetime.timedelta(minutes=30),
+                'labels': [labels[number % len(labels)]],
+                'commits': [],
+                'review_id': next(self._ids),
+                'issue_comments': [],
+                'review_comments': [],
+            }
+            for c in range(commits):
+                pr['commits'].append({
+                    'sha': hashlib.sha1(
+                        ('%s#%d:%d' % (name, number, c)).encode()).hexdigest(),
+                    'message': 'Commit %d of change %d\n\nDetails.' % (
+                        c, number),
+                    'files': ['src/module%d.py' % f for f in range(files)],
+                })
+            for c in range(comments):
+                pr['issue_comments'].append(self._comment(pr, c))
+                pr['review_comments'].append({
+                    'id': next(self._ids),
+                    'body': 'Inline comment %d' % c,
+                    'user': _user(2 + c % 5),
+                    'created': created + datetime.timedelta(minutes=c),
+                    'path': pr['commits'][-1]['files'][c % files]
+                    if commits and files else 'README',
+                    'line': 10 + c,
+                })
+            repo['prs'][number] = pr
+        return repo
+
+    def _comment(self, pr, index):
+        return {
+            'id': next(self._ids),
+            'body': 'Comment %d on change %d' % (index, pr['number']),
+            'user': _user(2 + index % 5),
+            'created': pr['created'] + datetime.timedelta(minutes=index),
+        }
+
+    def _makeGitRepo(self, path, repo):
+        """Create a git repository holding the commits of *repo*."""
+        os.makedirs(path, exist_ok=True)
+        subprocess.run(['git', 'init', '-q', '--bare', '-b', 'main', path],
+                       check=True)
+        stream = []
+        mark = 0
+
+        def data(text):
+            raw = text.encode()
+            stream.append(b'data %d\n%s\n' % (len(raw), raw))
+
+        def commit(ref, message, parent, files):
+            nonlocal mark
+            mark += 1
+            stream.append(b'commit %s\nmark :%d\n' % (ref.encode(), mark))
+            stream.append(b'committer Bench <bench@example.com> '
+                          b'1704067200 +0000\n')
+            data(message)
+            if parent:
+                stream.append(b'from :%d\n' % parent)
+            for f in files:
+                stream.append(b'M 100644 inline %s\n' % f.encode())
+                data('# %s\n%s' % (message, 'x = 1\n' * 20))
+            return mark
+
+        base = commit('refs/heads/main', 'Initial commit', None,
+                      ['README', 'src/module0.py'])
+        marks = {base: repo}
+        for pr in repo['prs'].values():
+            parent = base
+            ref = 'refs/pull/%d/head' % pr['number']
+            for c in pr['commits']:
+                parent = commit(ref, c['message'], parent, c['files'])
+                marks[parent] = c
+        marks_file = path + '.marks'
+        subprocess.run(['git', '-C', path, 'fast-import', '--quiet',
+                        '--export-marks=' + marks_file],
+                       input=b''.join(stream), check=True)
+        with open(marks_file) as f:
+            for line in f:
+                m, sha = line.split()
+                c = marks[int(m[1:])]
+                if c is repo:
+                    repo['base'] = sha
+                else:
+                    c['sha'] = sha
+        os.unlink(marks_file)
+
+    # Mutations
+
+    def touch(self, fraction, now=None):
+        """Add a comment to *fraction* of the pull requests.
+
+        Returns the number of pull requests changed.
+        """
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        changed = 0
+        with self.lock:
+            for repo in self.repos.values():
+                prs = list(repo['prs'].values())
+                step = max(1, round(1 / fraction)) if fraction else None
+                for pr in prs[::step] if step else []:
+                    comment = self._comment(pr, len(pr['issue_comments']))
+                    comment['created'] = now
+                    pr['issue_comments'].append(comment)
+                    pr['updated'] = now
+                    changed += 1
+        return changed
+
+    # Serialization
+
+    def _pr(self, repo, pr):
+        return {
+            'id': pr['id'],
+            'number': pr['number'],
+            'state': 'open',
+            'title': pr['title'],
+            'body': pr['body'],
+            'user': _user(2),
+            'created_at': _iso(pr['created']),
+            'updated_at': _iso(pr['updated']),
+            'additions': 10 * len(pr['commits']),
+            'deletions': 2 * len(pr['commits']),
+            'html_url': self.url + repo['name'] + '/pull/%d' % pr['number'],
+            'merged': False,
+            'mergeable': True,
+            'draft': False,
+            'labels': pr['labels'],
+            'base': {'ref': 'main', 'repo': {'full_name': repo['name']}},
+        }
+
+    def _commits(self, pr):
+        return [{'sha': c['sha'],
+                 'commit': {'message': c['message']},
+                 'parents': [{'sha': c['parent']}] if c.get('parent') else []}
+                for c in pr['commits']]
+
+    def _commit(self, sha):
+        c = self._commits_by_sha.get(sha)
+        if c is None:
+            return None
+        return {'sha': sha, 'files': [
+            {'filename': f, 'status': 'modified', 'additions': 5,
+             'deletions': 1, 'patch': '@@ -1 +1 @@\n-a\n+b'}
+            for f in c['files']]}
+
+    def _reviews(self, pr):
+        if not pr['review_comments']:
+            return []
+        return [{'id': pr['review_id'], 'user': _user(3),
+                 'state': 'COMMENTED', 'body': 'Review',
+                 'commit_id': pr['commits'][-1]['sha'] if pr['commits'] else None,
+                 'submitted_at': _iso(pr['created'])}]
+
+    def _reviewComments(self, pr):
+        sha = pr['commits'][-1]['sha'] if pr['commits'] else None
+        return [{'id': c['id'], 'user': c['user'], 'body': c['body'],
+                 'path': c['path'], 'line': c['line'],
+                 'original_line': c['line'], 'side': 'RIGHT',
+                 'commit_id': sha, 'original_commit_id': sha,
+                 'pull_request_review_id': pr['review_id'],
+                 'in_reply_to_id': None,
+                 'created_at': _iso(c['created']),
+                 'updated_at': _iso(c['created']),
+                 'html_url': self.url + 'comment/%d' % c['id']}
+                for c in pr['review_comments']]
+
+    def _issueComments(self, pr):
+        return [{'id': c['id'], 'user': c['user'], 'body': c['body'],
+                 'created_at': _iso(c['created'])}
+                for c in pr['issue_comments']]
+
+    def _status(self, sha):
+        return {'statuses': [{'context': 'ci/lint', 'state': 'success',
+                              'target_url': self.url + 'ci/' + sha,
+                              'description': 'Lint passed',
+                              'created_at': _iso(EPOCH),
+                              'updated_at': _iso(EPOCH)}]}
+
+    def _checkRuns(self, sha):
+        return {'total_count': 1, 'check_runs': [
+            {'name': 'ci/tests', 'status': 'completed',
+             'conclusion': 'success',
+             'html_url': self.url + 'ci/' + sha + '/tests',
+             'started_at': _iso(EPOCH), 'completed_at': _iso(EPOCH)}]}
+
+    def _search(self, q):
+        terms = q.split()
+        repos = [t[5:] for t in terms if t.startswith('repo:')]
+        since = None
+        for t in terms:
+            if t.startswith('updated:>'):
+                since = datetime.datetime.fromisoformat(t[9:])
+                if since.tzinfo is None:
+                    since = since.replace(tzinfo=datetime.timezone.utc)
+        items = []
+        for name in repos:
+            repo = self.repos.get(name)
+            if repo is None:
+                continue
+            for pr in repo['prs'].values():
+                if since and pr['updated'] <= since:
+                    continue
+                items.append({
+                    'number': pr['number'], 'state': 'open',
+                    'updated_at': _iso(pr['updated']),
+                    'pull_request': {'url': self.api_url + 'repos/%s/pulls/%d'
+                                     % (name, pr['number'])}})
+        return {'total_count': len(items), 'incomplete_results': False,
+                'items': items[:1000]}
+
+    # Routing
+
+    def resolve(self, path, query):
+        """Return the JSON document for an API *path*, or None."""
+        if path in ('user', 'users/bench'):
+            return {'id': 1, 'login': 'bench', 'name': 'Bench',
+                    'email': 'bench@example.com'}
+        if path == 'user/repos':
+            return [{'full_name': name, 'description': 'Repository ' + name,
+                     'permissions': {'push': True}}
+                    for name in self.repos]
+        m = re.match(r'users/user(\d+)$', path)
+        if m:
+            return dict(_user(int(m.group(1))), name='User ' + m.group(1),
+                        email=None)
+        if path == 'search/issues':
+            return self._search(query.get('q', ''))
+        m = re.match(r'repos/([^/]+/[^/]+)(?:/(.*))?$', path)
+        if not m or m.group(1) not in self.repos:
+            return None
+        repo = self.repos[m.group(1)]
+        rest = m.group(2)
+        if rest is None:
+            return {'full_name': repo['name'],
+                    'description': 'Repository ' + repo['name']}
+        if rest == 'branches':
+            return [{'name': 'main'}]
+        if rest == 'labels':
+            return repo['labels']
+        m = re.match(r'commits/([0-9a-f]+)(?:/(status|check-runs))?$', rest)
+        if m:
+            if m.group(2) == 'status':
+                return self._status(m.group(1))
+            if m.group(2) == 'check-runs':
+                return self._checkRuns(m.group(1))
+            return self._commit(m.group(1))
+        m = re.match(r'(pulls|issues)/(\d+)(?:/(\w+))?$', rest)
+        if not m or int(m.group(2)) not in repo['prs']:
+            return None
+        pr = repo['prs'][int(m.group(2))]
+        kind, sub = m.group(1), m.group(3)
+        if kind == 'issues':
+            return self._issueComments(pr) if sub == 'comments' else None
+        return {None: lambda: self._pr(repo, pr),
+                'commits': lambda: self._commits(pr),
+                'comments': lambda: self._reviewComments(pr),
+                'reviews': lambda: self._reviews(pr)}.get(
+                    sub, lambda: None)()
+
+    def paginate(self, doc, query, base):
+        """Return the page of *doc* selected by *query*, and its links."""
+        per_page = min(int(query.get('per_page', 30)), self.page_size)
+        page = int(query.get('page', 1))
+        if isinstance(doc, dict) and 'items' in doc:
+            items, wrap = doc['items'], lambda i: dict(doc, items=i)
+        elif isinstance(doc, dict) and 'check_runs' in doc:
+            items, wrap = doc['check_runs'], lambda i: dict(doc, check_runs=i)
+        elif isinstance(doc, list):
+            items, wrap = doc, lambda i: i
+        else:
+            return doc, []
+        last = max(1, -(-len(items) // per_page))
+        links = []
+
+        def link(n, rel):
+            q = dict(query, page=str(n))
+            links.append('<%s?%s>; rel="%s"' % (
+                base, urllib.parse.urlencode(q), rel))
+        if page < last:
+            link(page + 1, 'next')
+            link(last, 'last')
+        return wrap(items[(page - 1) * per_page:page * per_page]), links
+
+    # Server
+
+    def start(self):
+        """Serve the API on a free localhost port; return its URL."""
+        handler = type('Handler', (_Handler,), {'github': self})
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                                      handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.api_url
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    @property
+    def api_url(self):
+        return 'http://127.0.0.1:%d/' % self.server.server_port
+
+    @property
+    def url(self):
+        return 'https://github.invalid/'
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; without this, delayed
+    # ACKs would stall every request on a kept-alive connection.
+    disable_nagle_algorithm = True
+    github = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b'', headers=()):
+        gh = self.github
+        with gh.lock:
+            if status != 304:
+                gh.rate_remaining = max(0, gh.rate_remaining - 1)
+            remaining = gh.rate_remaining
+        self.send_response(status)
+        self.send_header('X-RateLimit-Limit', str(gh.rate_limit))
+        self.send_header('X-RateLimit-Remaining', str(remaining))
+        self.send_header('X-RateLimit-Reset', '4102444800')
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        gh = self.github
+        parts = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(parts.query))
+        path = parts.path.lstrip('/')
+        with gh.lock:
+            gh.stats['requests'] += 1
+            doc = gh.resolve(path, query)
+            if doc is not None:
+                doc, links = gh.paginate(doc, query, gh.api_url + path)
+        if doc is None:
+            with gh.lock:
+                gh.stats['not_found'] += 1
+            self._send(404, b'{"message": "Not Found"}')
+            return
+        body = json.dumps(doc).encode()
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            with gh.lock:
+                gh.stats['not_modified'] += 1
+            self._send(304, headers=[('ETag', etag)])
+            return
+        headers = [('Content-Type', 'application/json'), ('ETag', etag)]
+        if links:
+            headers.append(('Link', ', '.join(links)))
+        self._send(200, body, headers)
+
+    def _notAllowed(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        self._send(405, b'{"message": "Read-only"}')
+
+    do_POST = do_PUT = do_PATCH = do_DELETE = _notAllowed
@@ -15,6 +15,7 @@
 
 import argparse
 import colorsys
+import concurrent.futures
 import dataclasses
 import datetime
 import dateutil
@@ -40,11 +41,17 @@ import urwid
 
 from hubtty import db
 from hubtty import config
+from hubtty import diffcache
+from hubtty import highlighter
 from hubtty import keymap
+from hubtty import markdown
+from hubtty import metrics
 from hubtty import mywid
 from hubtty import palette
+from hubtty import sampling
 from hubtty import sync
 from hubtty import search
+from hubtty import snapshot
 from hubtty import requestsexceptions
 from hubtty.view import pull_request_list as view_pr_list
 from hubtty.view import repository_list as view_repository_list
@@ -70,6 +77,38 @@ class _ForegroundCmdState:
     description: str
 
 
+# The number of threads running background jobs; further jobs wait
+# for one of them to be free.
+BACKGROUND_JOB_WORKERS = 4
+
+
+def _nameBackgroundWorker():
+    # Keep one name for all workers, as metrics are grouped by thread.
+    threading.current_thread().name = 'background job'
+
+
+class BackgroundJob:
+    """Work submitted with :meth:`App.runInBackground`.
+
+    The result of a cancelled job is discarded.  Long-running work may
+    also check :attr:`cancelled` to stop early.
+    """
+
+    def __init__(self, func, callback, errback, owner):
+        self.func = func
+        self.callback = callback
+        self.errback = errback
+        self.owner = owner
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+
 WELCOME_TEXT = """\
 Welcome to Hubtty!
 
@@ -108,7 +147,20 @@ class SyncTasksDialog(urwid.WidgetWrap, mywid.LineBoxTitlePropertyMixin):
     def refresh(self):
         running, queued = self.app.sync.queue.snapshot()
         total = len(running) + sum(len(tasks) for tasks in queued.values())
-        lines = ['Total tasks: %d' % total, '']
+        lines = ['Total tasks: %d' % total]
+        counters = self.app.sync.counters
+        lines.append('Pull request syncs: %d (%d unchanged)' % (
+            counters['pull_request_syncs'],
+            counters['pull_request_syncs_skipped']))
+        hosts = self.app.sync.connection_stats.snapshot()
+        if hosts:
+            lines.append('Connections (%s):' % getattr(
+                self.app.sync.session, 'http_version', 'HTTP/1.1'))
+            for host, counts in hosts.items():
+                lines.append('  %s: %d requests over %d connections' % (
+                    host, counts.get('requests', 0),
+                    counts.get('connections', 0)))
+        lines.append('')
         if running:
             lines.append('\N{BLACK RIGHT-POINTING POINTER} Running:')
             for task in running:
@@ -128,6 +180,84 @@ class SyncTasksDialog(urwid.WidgetWrap, mywid.LineBoxTitlePropertyMixin):
         self.text_widget.set_text('\n'.join(lines))
 
 
+class MetricsDialog(urwid.WidgetWrap, mywid.LineBoxTitlePropertyMixin):
+    """Live-updating dialog showing the sync and interface metrics."""
+
+    signals = ['close']
+    LATENCY_TITLES = [
+        ('task', 'Sync tasks'),
+        ('refresh', 'View refreshes'),
+        ('database lock wait', 'Database lock wait, by thread'),
+        ('database lock hold', 'Database lock hold, by thread'),
+        ('database statement', 'SQL statements, by thread'),
+    ]
+
+    def __init__(self, app):
+        self.app = app
+        self.text_widget = urwid.Text('')
+        ok_button = mywid.FixedButton('OK')
+        urwid.connect_signal(ok_button, 'click',
+                             lambda button: self._emit('close'))
+        save_button = mywid.FixedButton('Save JSON')
+        urwid.connect_signal(save_button, 'click',
+                             lambda button: self.save())
+        self.saved_widget = urwid.Text('')
+        rows = [
+            self.text_widget,
+            urwid.Divider(),
+            urwid.Columns([('pack', ok_button), ('pack', save_button),
+                           self.saved_widget], dividechars=2),
+        ]
+        listbox = urwid.ListBox(rows)
+        super().__init__(urwid.LineBox(listbox, 'Metrics'))
+        self.refresh()
+
+    def save(self):
+        path = self.app.config.metrics_file
+        try:
+            metrics.get_metrics().dump(path)
+        except OSError as e:
+            self.app.log.exception("Unable to save metrics to %s", path)
+            self.saved_widget.set_text(('error', 'Unable to save: %s' % e))
+            return
+        self.saved_widget.set_text('Saved to %s' % path)
+
+    def refresh(self):
+        data = metrics.get_metrics().snapshot()
+        lines = ['Collected over the last %s' % datetime.timedelta(
+            seconds=int(data['time'] - data['started']))]
+        for kind, title in self.LATENCY_TITLES:
+            histograms = data['latency'].get(kind)
+            if not histograms:
+                continue
+            lines.append('')
+            lines.append('%s (count, mean, p95, max in ms):' % title)
+            for name, h in sorted(histograms.items(),
+                                  key=lambda item: -item[1]['total']):
+                lines.append('  %-36s %6d %8.1f %8.1f %8.1f' % (
+                    name, h['count'], h['mean'] * 1000, h['p95'] * 1000,
+                    h['max'] * 1000))
+        etag = data['etag']
+        lines.append('')
+        lines.append('HTTP requests (ETag hit rate %d%% of %d):' % (
+            etag['hit_rate'] * 100, etag['hits'] + etag['misses']))
+        for r in sorted(data['requests'], key=lambda r: -r['count']):
+            status = ' '.join('%s:%d' % item for item in r['status'].items())
+            lines.append('  %-6s %-44s %6d %9.1f kB  %s' % (
+                r['method'], r['endpoint'], r['count'], r['bytes'] / 1024,
+                status))
+        if data['queue']:
+            lines.append('')
+            lines.append('Queued tasks by priority (now, max):')
+            priorities = data['queue'][-1]['depths']
+            for pri in sorted(priorities, key=int):
+                label = SyncTasksDialog.PRIORITY_LABELS.get(int(pri), pri)
+                lines.append('  %-8s %6d %6d' % (
+                    label, priorities[pri],
+                    max(s['peak'].get(pri, 0) for s in data['queue'])))
+        self.text_widget.set_text('\n'.join(lines))
+
+
 class ClickableText(urwid.WidgetWrap):
     """A text widget that triggers a callback on mouse click."""
 
@@ -149,6 +279,8 @@ class StatusHeader(urwid.WidgetWrap):
         self.title_widget = urwid.Text('Start')
         self.error_widget = urwid.Text('')
         self.offline_widget = urwid.Text('')
+        self.profiling_widget = urwid.Text('')
+        self.queries_widget = urwid.Text('')
         self.sync_text = urwid.Text('Sync: 0')
         self.sync_widget = ClickableText(self.sync_text, lambda: app.showSyncTasks())
         self.held_widget = urwid.Text('')
@@ -157,15 +289,21 @@ class StatusHeader(urwid.WidgetWrap):
         self._w.contents.append((self.held_widget, ('pack', None, False)))
         self._w.contents.append((self.error_widget, ('pack', None, False)))
         self._w.contents.append((self.offline_widget, ('pack', None, False)))
+        self._w.contents.append((self.profiling_widget, ('pack', None, False)))
+        self._w.contents.append((self.queries_widget, ('pack', None, False)))
         self._w.contents.append((self.sync_widget, ('pack', None, False)))
         self.error = None
         self.offline = None
+        self.profiling = None
+        self.queries = None
         self.title = None
         self.message = None
         self.sync = None
         self.held = None
         self._error = False
         self._offline = False
+        self._profiling = False
+        self._queries = None
         self._title = ''
         self._message = ''
         self._sync = 0
@@ -173,7 +311,8 @@ class StatusHeader(urwid.WidgetWrap):
         self.held_key = self.app.config.keymap.formatKeys(keymap.LIST_HELD)
 
     def update(self, title=None, message=None, error=None,
-               offline=None, refresh=True, held=None):
+               offline=None, refresh=True, held=None, profiling=None,
+               queries=None):
         if title is not None:
             self.title = title
         if message is not None:
@@ -184,6 +323,10 @@ class StatusHeader(urwid.WidgetWrap):
             self.offline = offline
         if held is not None:
             self.held = held
+        if profiling is not None:
+            self.profiling = profiling
+        if queries is not None:
+            self.queries = queries
         self.sync = self.app.sync.queue.qsize()
         if refresh:
             self.refresh()
@@ -212,6 +355,17 @@ class StatusHeader(urwid.WidgetWrap):
                 self.offline_widget.set_text(' Offline')
             else:
                 self.offline_widget.set_text('')
+        if self._profiling != self.profiling:
+            self._profiling = self.profiling
+            if self._profiling:
+                self.profiling_widget.set_text(('error', ' Profiling'))
+            else:
+                self.profiling_widget.set_text('')
+        if self._queries != self.queries:
+            self._queries = self.queries
+            count, seconds = self._queries
+            self.queries_widget.set_text(' %d queries / %.1f ms' % (
+                count, seconds * 1000))
         if self._sync != self.sync:
             self._sync = self.sync
             self.sync_text.set_text(' Sync: %i' % self._sync)
@@ -357,13 +511,20 @@ class App:
 
         self.repository_cache = RepositoryCache()
         self.ring = mywid.KillRing()
+        self.profiler = metrics.Profiler()
+        # Show the SQL statements run by the last refresh in debug mode.
+        self.show_queries = debug
         self.input_buffer = []
         webbrowser.register('xdg-open', None, BackgroundBrowser("xdg-open"))
 
         self.fetch_missing_refs = fetch_missing_refs
         self.config.keymap.updateCommandMap()
         self.search = search.SearchCompiler(self.getOwnAccountId)
-        self.db = db.Database(self, self.config.dburi, self.search)
+        slow_query_threshold = None
+        if self.config.slow_query_threshold:
+            slow_query_threshold = self.config.slow_query_threshold / 1000
+        self.db = db.Database(self, self.config.dburi, self.search,
+                              slow_query_threshold)
 
         self.own_account_id = None
         with self.db.getSession() as session:
@@ -372,6 +533,13 @@ class App:
                 self.own_account_id = account.id
 
         self.sync = sync.Sync(self, disable_background_sync)
+        highlighter.configure(processes=self.config.highlight_processes,
+                              cache_dir=self.config.highlight_cache_dir)
+        self.diff_cache = diffcache.DiffCache(self.config.diff_cache_size)
+        self.diff_prefetcher = diffcache.DiffPrefetcher(
+            self, self.diff_cache, self.config.diff_prefetch,
+            self.config.diff_prefetch_max_lines)
+        self.render_cache = markdown.RenderCache()
 
         self.status = StatusHeader(self)
         self.header = urwid.AttrMap(self.status, 'header')
@@ -383,9 +551,17 @@ class App:
             self.footer = urwid.AttrMap(self.breadcrumbs, 'footer')
         else:
             self.footer = None
-        screen = view_repository_list.RepositoryListView(self)
+        # With a snapshot, the first screen is drawn without querying
+        # the database; the real data is loaded once the loop runs.
+        dashboard = None
+        if self.config.startup_snapshot:
+            dashboard = snapshot.load(self.config.snapshot_file)
+        screen = view_repository_list.RepositoryListView(self, dashboard)
         self.status.update(title=screen.title)
-        self.updateStatusQueries()
+        if dashboard is None:
+            self.updateStatusQueries()
+        else:
+            self.status.update(held=dashboard.get('held', 0))
         self.frame = urwid.Frame(body=screen, footer=self.footer)
         self.loop = urwid.MainLoop(self.frame, palette=self.config.palette.getPalette(),
                                    handle_mouse=self.config.handle_mouse,
@@ -401,6 +577,15 @@ class App:
         self.custom_cmd_pipe = self.loop.watch_pipe(self._customCmdPipeInput)
         self.custom_cmd_queue = queue.Queue()
         self._fg_cmd = None  # _ForegroundCmdState while a command is in flight
+        self.job_pipe = self.loop.watch_pipe(self._jobPipeInput)
+        self.job_queue = queue.Queue()
+        self.background_jobs = set()
+        self.job_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=BACKGROUND_JOB_WORKERS,
+            initializer=_nameBackgroundWorker)
+
+        self.loop.set_alarm_in(metrics.QUEUE_SAMPLE_INTERVAL,
+                               self._sampleQueue)
 
         warnings.showwarning = self._showWarning
 
@@ -421,14 +606,21 @@ class App:
             # entry by urwid.  True-color is only enabled when
             # COLORTERM explicitly advertises it.
             self.loop.screen.set_terminal_properties(colors=256)
-        with self.db.getSession() as session:
-            for label in session.getLabels():
-                self.registerPaletteEntry(label.id, label.color)
+        if dashboard is None:
+            with self.db.getSession() as session:
+                for label in session.getLabels():
+                    self.registerPaletteEntry(label.id, label.color)
+        else:
+            self.runInBackground(self._loadDashboard,
+                                 functools.partial(self._showDashboard,
+                                                   screen))
 
         self.startSocketListener()
 
         if not disable_sync:
-            self.sync_thread = threading.Thread(target=self.sync.run, args=(self.sync_pipe,))
+            self.sync_thread = threading.Thread(target=self.sync.run,
+                                                args=(self.sync_pipe,),
+                                                name='sync')
             self.sync_thread.daemon = True
             self.sync_thread.start()
         else:
@@ -449,6 +641,41 @@ class App:
         default_fg, default_bg = self.config.palette.getPaletteItem('pr-data')
         self.loop.screen.register_palette_entry(name, default_fg, default_bg, foreground_high=fg, background_high=color)
 
+    def _loadDashboard(self, job):
+        # Fill the repository cache for the repository list, which is
+        # what makes drawing it slow.
+        with self.db.getSession() as session:
+            repositories = session.getRepositories(subscribed=True)
+            for topic in session.getTopics():
+                repositories.extend(topic.repositories)
+            for repository in repositories:
+                self.repository_cache.get(repository)
+            held = session.getHeldCount()
+            labels = [(label.id, label.color) for label in session.getLabels()]
+        return held, labels
+
+    def _showDashboard(self, screen, result):
+        held, labels = result
+        for label_id, label_color in labels:
+            self.registerPaletteEntry(label_id, label_color)
+        current = self._getCurrentScreen()
+        screen.refresh()
+        # The screen may no longer be the one shown.
+        self.status.update(held=held, title=current.title)
+
+    def saveSnapshot(self):
+        """Save the repository list for the next launch."""
+        for widget in [*self.screens, self.frame.body]:
+            if isinstance(widget, view_repository_list.RepositoryListView):
+                break
+        else:
+            return
+        data = widget.getSnapshot()
+        if data is None:
+            return
+        data['held'] = self.status.held or 0
+        snapshot.save(self.config.snapshot_file, data)
+
     def getOwnAccountId(self):
         return self.own_account_id
 
@@ -599,11 +826,78 @@ class App:
             lambda button: self.backScreen())
         self.popup(dialog, min_height=max(8, min(20, message.count('\n') + 6)))
 
+    def runInBackground(self, func, callback, errback=None, owner=None):
+        """Run *func* in a worker thread and pass its result to *callback*.
+
+        *func* is called with the :class:`BackgroundJob` as its only
+        argument.  *callback* (or *errback*, with the exception, if
+        *func* raised) is called on the main thread.  Jobs belonging to
+        an *owner* screen are cancelled once that screen is no longer
+        in the screen history.
+        """
+        job = BackgroundJob(func, callback, errback, owner)
+        self.background_jobs.add(job)
+        self.job_executor.submit(self._runBackgroundWorker, job)
+        return job
+
+    def _runBackgroundWorker(self, job):
+        result = error = None
+        try:
+            if not job.cancelled:
+                func = getattr(job.func, 'func', job.func)
+                with sampling.activity(getattr(func, '__qualname__',
+                                               repr(func))):
+                    result = job.func(job)
+        except hubtty.view.DisplayError as e:
+            error = e
+        except Exception as e:
+            error = e
+            self.log.exception("Error in background job %s", job.func)
+        self.job_queue.put((job, result, error))
+        os.write(self.job_pipe, b'job\n')
+
+    def _jobPipeInput(self, data=None):
+        """Called on the main thread when background jobs finish."""
+        while True:
+            try:
+                (job, result, error) = self.job_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.background_jobs.discard(job)
+            if job.cancelled:
+                continue
+            if error is None:
+                job.callback(result)
+            elif job.errback:
+                job.errback(error)
+            else:
+                self.error(str(error))
+
+    def _sampleQueue(self, loop=None, data=None):
+        """Record the depth of the sync queue, then schedule the next sample."""
+        metrics.get_metrics().sampleQueue(self.sync.queue.depths())
+        self.loop.set_alarm_in(metrics.QUEUE_SAMPLE_INTERVAL,
+                               self._sampleQueue)
+
+    def _cancelOrphanedJobs(self):
+        screens = [self.frame.body] + list(self.screens)
+        for job in list(self.background_jobs):
+            if job.owner is not None and job.owner not in screens:
+                self.log.debug("Cancelling background job for %s",
+                               job.owner)
+                job.cancel()
+                self.background_jobs.discard(job)
+
     def run(self):
         try:
             self.loop.run()
         except KeyboardInterrupt:
             pass
+        finally:
+            self.job_executor.shutdown(wait=False, cancel_futures=True)
+            highlighter.get_highlighter().shutdown()
+            if self.config.startup_snapshot:
+                self.saveSnapshot()
 
     def _quit(self, widget=None):
         raise urwid.ExitMainLoop()
@@ -657,6 +951,7 @@ class App:
             self.screens.append(self.frame.body)
         self.clearInputBuffer()
         self.frame.body = widget
+        self._cancelOrphanedJobs()
 
     def getPreviousScreen(self):
         if not self.screens:
@@ -675,6 +970,7 @@ class App:
             self.status.update(title=widget.title)
         self.clearInputBuffer()
         self.frame.body = widget
+        self._cancelOrphanedJobs()
         self.refresh(force=True)
 
     def findPullRequestList(self):
@@ -689,6 +985,7 @@ class App:
             widget = self.screens.pop()
             self.clearInputBuffer()
             self.frame.body = widget
+        self._cancelOrphanedJobs()
 
     def refresh(self, data=None, force=False):
         widget = self.frame.body
@@ -696,17 +993,31 @@ class App:
             widget = widget.contents[0][0]
         interested = force
         invalidate = False
+        events = []
         try:
             while True:
                 event = self.sync.result_queue.get(0)
                 if widget.interested(event):
                     interested = True
+                    events.append(event)
                 if hasattr(event, 'held_changed') and event.held_changed:
                     invalidate = True
         except queue.Empty:
             pass
         if interested:
-            widget.refresh()
+            # Views able to refresh only what the events changed do
+            # so, unless asked to refresh everything.
+            queries = self.db.queryStats()
+            queries_start = queries.snapshot()
+            with metrics.get_metrics().timed('refresh',
+                                             type(widget).__name__):
+                if events and not force and hasattr(widget, 'refreshEvents'):
+                    widget.refreshEvents(events)
+                else:
+                    widget.refresh()
+            if self.show_queries:
+                self.status.update(queries=queries.since(queries_start),
+                                   refresh=False)
         if invalidate:
             self.updateStatusQueries()
         self.status.refresh()
@@ -719,7 +1030,7 @@ class App:
 
     def updateStatusQueries(self):
         with self.db.getSession() as session:
-            held = len(session.getHeld())
+            held = session.getHeldCount()
             self.status.update(held=held)
 
     def popup(self, widget,
@@ -939,6 +1250,10 @@ class App:
             self.doSearch("is:held")
         elif keymap.SYNC_TASKS in commands:
             self.showSyncTasks()
+        elif keymap.METRICS in commands:
+            self.showMetrics()
+        elif keymap.TOGGLE_PROFILER in commands:
+            self.toggleProfiler()
         elif key in self.config.dashboards:
             d = self.config.dashboards[key]
             try:
@@ -974,6 +1289,29 @@ class App:
             lambda button: self.backScreen())
         self.popup(dialog, min_width=76, min_height=40)
 
+    def showMetrics(self):
+        dialog = MetricsDialog(self)
+        urwid.connect_signal(dialog, 'close',
+            lambda button: self.backScreen())
+        self.popup(dialog, relative_width=80, relative_height=80,
+                   min_width=96, min_height=40)
+
+    def toggleProfiler(self):
+        """Start profiling the interface, or stop and save the profile."""
+        if not self.profiler.running:
+            self.profiler.start()
+            self.status.update(profiling=True)
+            return
+        path = self.config.profile_file
+        self.status.update(profiling=False)
+        try:
+            self.profiler.stop(path)
+        except OSError as e:
+            self.log.exception("Unable to save profile to %s", path)
+            self.error("Unable to save profile: %s" % e)
+            return
+        self.error("Profile saved to %s" % path, title='Profile')
+
     def openURL(self, url):
         self.log.debug("Open URL %s", url)
         webbrowser.open_new_tab(url)
@@ -1127,6 +1465,13 @@ def main():
     parser.add_argument('--fetch-missing-refs', dest='fetch_missing_refs',
                         action='store_true',
                         help='fetch any refs missing from local repos')
+    parser.add_argument('--profile', dest='profile', metavar='FILE',
+                        help='sample the stacks of all threads and write '
+                        'them to FILE at exit, as collapsed stacks')
+    parser.add_argument('--profile-interval', dest='profile_interval',
+                        type=float, default=10, metavar='MS',
+                        help='time between two profile samples '
+                        '(default: 10ms)')
     parser.add_argument('--print-keymap', nargs=0, action=PrintKeymapAction,
                         help='print the keymap command names to stdout')
     parser.add_argument('--print-palette', nargs=0, action=PrintPaletteAction,
@@ -1144,9 +1489,19 @@ def main():
     parser.add_argument('server', nargs='?',
                         help='the server to use (as specified in config file)')
     args = parser.parse_args()
-    g = App(args.server, args.palette, args.keymap, args.debug, args.verbose,
-            args.no_sync, args.debug_sync, args.fetch_missing_refs, args.path)
-    g.run()
+    profiler = None
+    if args.profile:
+        profiler = sampling.SamplingProfiler(args.profile,
+                                             args.profile_interval / 1000)
+        profiler.start()
+    try:
+        g = App(args.server, args.palette, args.keymap, args.debug,
+                args.verbose, args.no_sync, args.debug_sync,
+                args.fetch_missing_refs, args.path)
+        g.run()
+    finally:
+        if profiler:
+            profiler.stop()
 
 
 if __name__ == '__main__':
@@ -13,7 +13,11 @@
 # under the License.
 
 import collections
+import functools
+import hashlib
+import json
 import re
+import threading
 
 import urwid
 
@@ -65,6 +69,9 @@ class SearchReplacement:
 class CommentLink:
     def __init__(self, config):
         self.match = re.compile(config['match'], re.M)
+        # Identifies the configuration, for caching rendered messages.
+        self.fingerprint = hashlib.sha1(json.dumps(
+            config, sort_keys=True).encode('utf8')).hexdigest()
         self.test_result = config.get('test-result', None)
         self.replacements = []
         for r in config['replacements']:
@@ -130,3 +137,260 @@ class CommentLink:
                 chunk = after
         return ret
 
+
+# Default number of scanned messages held in memory.
+DEFAULT_SCAN_ENTRIES = 256
+
+
+_group_name_re = re.compile(r'\(\?P([<=])(\w+)([>)])')
+
+
+def _rename_groups(pattern, prefix, offset):
+    """Return *pattern* with its groups renamed for a combined pattern.
+
+    Named groups and their references get *prefix* prepended, and
+    numbered backreferences are shifted by *offset*, the number of
+    groups before those of *pattern* in the combined pattern.
+    """
+    out = []
+    i = 0
+    in_class = False
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\':
+            m = re.match(r'[1-9][0-9]?', pattern[i + 1:i + 3])
+            if m and not in_class:
+                out.append('\\%d' % (int(m.group()) + offset))
+                i += 1 + m.end()
+            else:
+                out.append(pattern[i:i + 2])
+                i += 2
+            continue
+        if in_class:
+            if c == ']':
+                in_class = False
+        elif c == '[':
+            in_class = True
+            out.append(c)
+            i += 1
+            # A closing bracket first in the class is a literal.
+            for literal in ('^', ']'):
+                if pattern.startswith(literal, i):
+                    out.append(literal)
+                    i += 1
+            continue
+        elif c == '(':
+            m = _group_name_re.match(pattern, i)
+            if m:
+                out.append('(?P%s%s%s%s' % (m.group(1), prefix, m.group(2),
+                                            m.group(3)))
+                i = m.end()
+                continue
+        out.append(c)
+        i += 1
+    return ''.join(out)
+
+
+def _combine(commentlinks):
+    """Return one pattern matching any of *commentlinks*, or None.
+
+    Each commentlink is an alternative in a group named ``_<index>``,
+    and its named groups are renamed ``_<index>_<name>``.  None is
+    returned if the patterns cannot be combined (for instance because
+    one of them sets global flags).
+    """
+    flags = re.compile('', re.M).flags
+    if any(c.match.flags != flags for c in commentlinks):
+        return None
+    alternatives = []
+    offset = 0
+    for i, commentlink in enumerate(commentlinks):
+        offset += 1
+        alternatives.append('(?P<_%d>%s)' % (i, _rename_groups(
+            commentlink.match.pattern, '_%d_' % i, offset)))
+        offset += commentlink.match.groups
+    try:
+        combined = re.compile('|'.join(alternatives), re.M)
+    except re.error:
+        return None
+    if combined.groups != offset:
+        return None
+    return combined
+
+
+class Scanner:
+    """Apply a list of commentlinks in a single pass over a text.
+
+    The patterns of all the commentlinks are combined into one regular
+    expression, with a named group per commentlink telling which one
+    matched.  Commentlinks take precedence in the order they are
+    configured: a match is dropped if an earlier commentlink matches
+    text overlapping it, even if the later one starts first.  Scans are
+    cached by text.
+    """
+
+    def __init__(self, commentlinks, scan_entries=DEFAULT_SCAN_ENTRIES):
+        self.commentlinks = list(commentlinks)
+        self.scan_entries = scan_entries
+        self._scans = collections.OrderedDict()
+        self._tests = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # The combined pattern, and for each commentlink the combined
+        # pattern of the ones before it.
+        self._combined = _combine(self.commentlinks)
+        self._earlier = [None]
+        if self._combined is not None:
+            self._earlier += [_combine(self.commentlinks[:i])
+                              for i in range(1, len(self.commentlinks))]
+        self._groups = [
+            [('_%d_%s' % (i, name), name) for name in c.match.groupindex]
+            for i, c in enumerate(self.commentlinks)]
+
+    def _find(self, text):
+        """Return ``(start, end, index, data)`` for each match, in order."""
+        if self._combined is None:
+            return self._findSeparately(text)
+        found = []
+        # The next match of the commentlinks before each one; matches
+        # are found in order, so it only needs to be searched again
+        # once it is behind.
+        blockers = {}
+        pos = 0
+        while pos <= len(text):
+            m = self._combined.search(text, pos)
+            if m is None:
+                break
+            start, end = m.span()
+            if start == end:
+                pos = end + 1
+                continue
+            i = int(m.lastgroup[1:])
+            earlier = self._earlier[i]
+            if earlier is not None:
+                blocker = blockers.get(i, earlier)
+                if blocker is earlier or (blocker is not None and
+                                          blocker.start() < start):
+                    blocker = blockers[i] = earlier.search(text, start)
+                if blocker is not None and blocker.start() < end:
+                    # The earlier commentlink wins; look for other
+                    # matches from the next position on.
+                    pos = start + 1
+                    continue
+            found.append((start, end, i, {
+                name: m.group(group) for group, name in self._groups[i]}))
+            pos = end
+        return found
+
+    def _findSeparately(self, text):
+        # Match each commentlink, in order, in the parts of the text
+        # left unmatched by the previous ones.
+        found = []
+        for i, commentlink in enumerate(self.commentlinks):
+            gaps = []
+            pos = 0
+            for start, end, _, _ in found:
+                if start > pos:
+                    gaps.append((pos, start))
+                pos = end
+            if pos < len(text):
+                gaps.append((pos, len(text)))
+            new = []
+            for gap_start, gap_end in gaps:
+                for m in commentlink.match.finditer(text[gap_start:gap_end]):
+                    if m.start() != m.end():
+                        new.append((gap_start + m.start(),
+                                    gap_start + m.end(), i, m.groupdict()))
+            if new:
+                found = sorted(found + new, key=lambda match: match[0])
+        return found
+
+    def _cached(self, cache, text, compute):
+        with self._lock:
+            result = cache.get(text)
+            if result is not None:
+                cache.move_to_end(text)
+                return result
+        result = compute(text)
+        with self._lock:
+            cache[text] = result
+            while len(cache) > self.scan_entries:
+                cache.popitem(last=False)
+        return result
+
+    def scan(self, text):
+        """Return the matches in *text* as a list.
+
+        Each match is a ``(start, end, index, data)`` tuple where
+        *index* is the position of the commentlink in the list and
+        *data* its named groups.  Results are cached by text.
+        """
+        return self._cached(self._scans, text, self._find)
+
+    def _findTests(self, text):
+        # As CommentLink.getTestResults: each commentlink is matched on
+        # every line on its own, regardless of the others.
+        found = []
+        for i, commentlink in enumerate(self.commentlinks):
+            if commentlink.test_result is None:
+                continue
+            for line in text.split('\n'):
+                m = commentlink.match.search(line)
+                if m:
+                    found.append((i, m.groupdict()))
+        return found
+
+    def getTestResults(self, app, text, context=None):
+        """Return the test results of all the commentlinks in *text*.
+
+        The result is the same as merging the results of
+        :meth:`CommentLink.getTestResults` for each commentlink; the
+        matches are cached by text.
+        """
+        if not any(c.test_result is not None for c in self.commentlinks):
+            return {}
+        ret = collections.OrderedDict()
+        for i, data in self._cached(self._tests, text, self._findTests):
+            commentlink = self.commentlinks[i]
+            if context:
+                data = dict(data, **context)
+            try:
+                repl = [r.replace(app, data) for r in commentlink.replacements]
+                job = commentlink.test_result.format(**data)
+            except KeyError:
+                continue
+            ret[job] = repl + ['\n']
+        return ret
+
+    def run(self, app, chunks, context=None):
+        """Return *chunks* with the commentlinks applied.
+
+        A match whose replacements reference a missing context
+        variable is kept as text.
+        """
+        ret = []
+        for chunk in chunks:
+            if not isinstance(chunk, str) or not chunk:
+                ret.append(chunk)
+                continue
+            pos = 0
+            for start, end, i, data in self.scan(chunk):
+                if context:
+                    data = dict(data, **context)
+                try:
+                    replacements = [r.replace(app, data)
+                                    for r in self.commentlinks[i].replacements]
+                except KeyError:
+                    continue
+                if start > pos:
+                    ret.append(chunk[pos:start])
+                ret += replacements
+                pos = end
+            if pos < len(chunk):
+                ret.append(chunk[pos:])
+        return ret
+
+
+@functools.lru_cache(maxsize=16)
+def get_scanner(commentlinks):
+    """Return a :class:`Scanner` for the *commentlinks* tuple."""
+    return Scanner(commentlinks)
@@ -41,6 +41,9 @@ class ConfigSchema:
               'git-url': str,
               'log-file': str,
               'lock-file': str,
+              'snapshot-file': str,
+              'metrics-file': str,
+              'profile-file': str,
               'additional-repositories': [str],
               'socket': str,
               }
@@ -133,6 +136,14 @@ class ConfigSchema:
                            'diff-view': str,
                            'syntax-highlighting': bool,
                            'max-highlight-size': int,
+                           'highlight-processes': int,
+                           'highlight-cache-dir': str,
+                           'intraline-diff': v.Any('word', 'character', 'none'),
+                           'max-diff-file-lines': int,
+                           'max-diff-file-size': int,
+                           'diff-prefetch': int,
+                           'diff-prefetch-max-lines': int,
+                           'diff-cache-size': int,
                            'hide-comments': self.hide_comments,
                            # 'thread-prs': bool,
                            'display-times-in-utc': bool,
@@ -145,6 +156,12 @@ class ConfigSchema:
                            'size-column': self.size_column,
                            'generated-files': [str],
                            'hide-generated-files': bool,
+                           'startup-snapshot': bool,
+                           'pagination-parallelism': v.All(int, v.Range(min=1)),
+                           'http-pool-size': v.All(int, v.Range(min=1)),
+                           'http-keepalive': v.All(int, v.Range(min=0)),
+                           'http2': bool,
+                           'slow-query-threshold': v.All(int, v.Range(min=0)),
                            })
         return schema
 
@@ -196,6 +213,15 @@ class Config:
                                                          'hubtty.%s.lock'
                                                          % server['name']))
         self.lock_file = os.path.expanduser(lock_file)
+        snapshot_file = server.get('snapshot-file', os.path.join(
+            data_path, 'hubtty.%s.snapshot' % server['name']))
+        self.snapshot_file = os.path.expanduser(snapshot_file)
+        metrics_file = server.get('metrics-file', os.path.join(
+            data_path, 'hubtty.%s.metrics.json' % server['name']))
+        self.metrics_file = os.path.expanduser(metrics_file)
+        profile_file = server.get('profile-file', os.path.join(
+            data_path, 'hubtty.%s.prof' % server['name']))
+        self.profile_file = os.path.expanduser(profile_file)
 
         self.additional_repositories = server.get('additional-repositories', [])
 
@@ -253,6 +279,19 @@ class Config:
         self.syntax_highlighting = self.config.get('syntax-highlighting', True)
         self.max_highlight_size = self.config.get('max-highlight-size',
                                                    512 * 1024)
+        self.highlight_processes = self.config.get('highlight-processes', 2)
+        self.highlight_cache_dir = self.config.get('highlight-cache-dir')
+        if self.highlight_cache_dir:
+            self.highlight_cache_dir = os.path.expanduser(
+                self.highlight_cache_dir)
+        self.intraline_diff = self.config.get('intraline-diff', 'word')
+        self.max_diff_file_lines = self.config.get('max-diff-file-lines', 5000)
+        self.max_diff_file_size = self.config.get('max-diff-file-size',
+                                                   1024 * 1024)
+        self.diff_prefetch = self.config.get('diff-prefetch', 3)
+        self.diff_prefetch_max_lines = self.config.get(
+            'diff-prefetch-max-lines', 5000)
+        self.diff_cache_size = self.config.get('diff-cache-size', 200000)
 
         self.dashboards = collections.OrderedDict()
         for d in self.config.get('dashboards', []):
@@ -276,6 +315,14 @@ class Config:
         self.breadcrumbs = self.config.get('breadcrumbs', True)
         self.close_pr_on_review = self.config.get('close-pr-on-review', False)
         self.handle_mouse = self.config.get('handle-mouse', True)
+        self.startup_snapshot = self.config.get('startup-snapshot', False)
+        self.pagination_parallelism = self.config.get(
+            'pagination-parallelism', 4)
+        self.http_pool_size = self.config.get('http-pool-size', 10)
+        self.http_keepalive = self.config.get('http-keepalive', 60)
+        self.http2 = self.config.get('http2', False)
+        self.slow_query_threshold = self.config.get('slow-query-threshold',
+                                                    100)
 
         pr_list_options = self.config.get('pr-list-options', {})
         self.pr_list_options = {
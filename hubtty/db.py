@@ -18,19 +18,23 @@ import time
 import logging
 import threading
 
-import alembic
-import alembic.config
-import alembic.migration
 import sqlalchemy
 from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, Boolean, DateTime, Text, UniqueConstraint
 from sqlalchemy.schema import ForeignKey
-from sqlalchemy.orm import registry, sessionmaker, relationship, scoped_session, joinedload
+from sqlalchemy.orm import registry, sessionmaker, relationship, scoped_session, joinedload, selectinload
 from sqlalchemy.orm.session import Session
-from sqlalchemy.sql import exists, text
+from sqlalchemy.sql import exists, func, text
 from sqlalchemy.sql.expression import and_
 
+from hubtty import metrics
+from hubtty import sampling
 from hubtty import sync
 
+# The latest revision in hubtty/alembic/versions.  A database already
+# at this revision is opened without loading Alembic at all; update it
+# whenever a migration is added.
+HEAD_REVISION = 'b4c7d8e9f0a1'
+
 mapper = registry()
 metadata = MetaData()
 repository_table = Table(
@@ -716,13 +720,39 @@ def add_sqlite_match(dbapi_connection, connection_record):
     dbapi_connection.create_function("matches", 2, match)
 
 
+class QueryStats:
+    """The number of SQL statements run by a thread, and their duration."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def snapshot(self):
+        return (self.count, self.seconds)
+
+    def since(self, snapshot):
+        """Return the statements run since *snapshot* as (count, seconds)."""
+        return (self.count - snapshot[0], self.seconds - snapshot[1])
+
+
 class Database:
-    def __init__(self, app, dburi, search):
+    def __init__(self, app, dburi, search, slow_query_threshold=None):
+        """Open the database at *dburi*, migrating it if needed.
+
+        Statements taking longer than *slow_query_threshold* seconds
+        are logged along with the view or task which ran them.
+        """
         self.log = logging.getLogger('hubtty.db')
         self.own_account_key = None
         self.dburi = dburi
         self.search = search
+        self.slow_query_threshold = slow_query_threshold
+        self._query_stats = threading.local()
         self.engine = create_engine(self.dburi)
+        sqlalchemy.event.listen(self.engine, 'before_cursor_execute',
+                                self._beforeExecute)
+        sqlalchemy.event.listen(self.engine, 'after_cursor_execute',
+                                self._afterExecute)
         self.app = app
         #metadata.create_all(self.engine)
         self.migrate(app)
@@ -740,13 +770,55 @@ class Database:
     def getSession(self):
         return DatabaseSession(self)
 
+    def queryStats(self):
+        """Return the :class:`QueryStats` of the current thread."""
+        stats = getattr(self._query_stats, 'stats', None)
+        if stats is None:
+            stats = self._query_stats.stats = QueryStats()
+        return stats
+
+    def _beforeExecute(self, conn, cursor, statement, parameters, context,
+                       executemany):
+        # Kept on the execution context, which is discarded along with
+        # it if the statement fails.
+        context._hubtty_query_start = time.perf_counter()
+
+    def _afterExecute(self, conn, cursor, statement, parameters, context,
+                      executemany):
+        elapsed = time.perf_counter() - context._hubtty_query_start
+        stats = self.queryStats()
+        stats.count += 1
+        stats.seconds += elapsed
+        metrics.get_metrics().observe('database statement',
+                                      threading.current_thread().name,
+                                      elapsed)
+        if (self.slow_query_threshold is not None and
+            elapsed >= self.slow_query_threshold):
+            self.log.warning("Slow query (%.1f ms) from %s: %s",
+                             elapsed * 1000, sampling.origin(), statement)
+
+    def getRevision(self, conn):
+        """Return the migration revision of the database, or None."""
+        if not self.engine.dialect.has_table(conn, 'alembic_version'):
+            return None
+        revisions = conn.execute(
+            text('SELECT version_num FROM alembic_version')).scalars().all()
+        if len(revisions) != 1:
+            # Unusual; let Alembic sort it out.
+            return None
+        return revisions[0]
+
     def migrate(self, app):
-        conn = self.engine.connect()
-        context = alembic.migration.MigrationContext.configure(conn)
-        current_rev = context.get_current_revision()
-        self.log.debug('Current migration revision: %s', current_rev)
+        with self.engine.connect() as conn:
+            current_rev = self.getRevision(conn)
+            self.log.debug('Current migration revision: %s', current_rev)
+            if current_rev == HEAD_REVISION:
+                return
+            has_table = self.engine.dialect.has_table(conn, "repository")
 
-        has_table = self.engine.dialect.has_table(conn, "repository")
+        # Alembic is slow to import, so only when there is work to do.
+        import alembic.command
+        import alembic.config
 
         config = alembic.config.Config()
         config.set_main_option("script_location", "hubtty:alembic")
@@ -765,8 +837,13 @@ class DatabaseSession:
         self.search = database.search
 
     def __enter__(self):
+        requested = time.time()
         self.database.lock.acquire()
         self.start = time.time()
+        self.queries_start = self.database.queryStats().snapshot()
+        metrics.get_metrics().observe('database lock wait',
+                                      threading.current_thread().name,
+                                      self.start - requested)
         return self
 
     def __exit__(self, etype, value, tb):
@@ -777,8 +854,15 @@ class DatabaseSession:
         self.session().close()
         self.session = None
         end = time.time()
-        self.database.log.debug("Database lock held %s seconds", end-self.start)
+        self.queries, self.query_time = self.database.queryStats().since(
+            self.queries_start)
+        self.database.log.debug(
+            "Database lock held %s seconds, %d queries in %.1f ms",
+            end-self.start, self.queries, self.query_time * 1000)
         self.database.lock.release()
+        metrics.get_metrics().observe('database lock hold',
+                                      threading.current_thread().name,
+                                      end - self.start)
 
     def abort(self):
         self.session().rollback()
@@ -836,10 +920,24 @@ class DatabaseSession:
         except sqlalchemy.orm.exc.NoResultFound:
             return None
 
-    def getPullRequest(self, key, lazy=True):
+    def getPullRequest(self, key, lazy=True, load=()):
+        """Return the pull request with the given key, or None.
+
+        *load* names children to load along with the pull request, in
+        one query each: ``'commits'`` (with their files), ``'messages'``
+        (with their authors and comments) and ``'approvals'``.
+        """
         query = self.session().query(PullRequest).filter_by(key=key)
         if not lazy:
             query = query.options(joinedload(PullRequest.commits).joinedload(Commit.files).joinedload(File.comments))
+        if 'commits' in load:
+            query = query.options(selectinload(PullRequest.commits).selectinload(Commit.files))
+        if 'messages' in load:
+            query = query.options(
+                selectinload(PullRequest.messages).joinedload(Message.author),
+                selectinload(PullRequest.messages).selectinload(Message.comments))
+        if 'approvals' in load:
+            query = query.options(selectinload(PullRequest.approvals).joinedload(Approval.reviewer))
         try:
             return query.one()
         except sqlalchemy.orm.exc.NoResultFound:
@@ -908,6 +1006,26 @@ class DatabaseSession:
         except sqlalchemy.orm.exc.NoResultFound:
             return None
 
+    def getCommentCounts(self, pull_request):
+        """Return the inline comment counts of each commit.
+
+        The result maps commit keys to ``(current, drafts)``: the number
+        of comments on a current line and the number of draft comments.
+        """
+        query = self.session().query(
+            file_table.c.commit_key,
+            func.count(comment_table.c.key).filter(comment_table.c.line > 0),
+            func.count(comment_table.c.key).filter(comment_table.c.draft == True),
+        ).select_from(comment_table).join(
+            file_table, file_table.c.key == comment_table.c.file_key
+        ).join(
+            commit_table, commit_table.c.key == file_table.c.commit_key
+        ).filter(
+            commit_table.c.pr_key == pull_request.key
+        ).group_by(file_table.c.commit_key)
+        return {commit_key: (current, drafts)
+                for commit_key, current, drafts in query}
+
     def getCommitsBySha(self, sha):
         try:
             return self.session().query(Commit).filter_by(sha=sha).all()
@@ -962,6 +1080,10 @@ class DatabaseSession:
     def getHeld(self):
         return self.session().query(PullRequest).filter_by(held=True).all()
 
+    def getHeldCount(self):
+        return self.session().query(func.count(PullRequest.key)).filter_by(
+            held=True).scalar()
+
     def getOutdated(self):
         return self.session().query(PullRequest).filter_by(outdated=True).all()
 
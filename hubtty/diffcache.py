@@ -0,0 +1,220 @@
+# Copyright The Hubtty Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Caching and background prefetching of computed diffs.
+
+Computing a diff (running git, parsing the patch, intraline and syntax
+highlighting) is the most expensive part of opening a diff view.  The
+result only depends on the two commit SHAs and the diff options, so it
+can be cached and, while the user is reading one pull request, computed
+ahead of time for the ones they are likely to open next.
+"""
+
+import collections
+import logging
+import os
+import queue
+import threading
+
+from hubtty import gitrepo
+
+# Default budget for the diff cache, counted in diff lines.
+DEFAULT_CACHE_LINES = 200000
+
+
+class DiffCache:
+    """A thread-safe LRU cache of computed diffs.
+
+    Entries are the lists of :class:`hubtty.gitrepo.DiffFile` objects
+    yielded by :meth:`hubtty.gitrepo.Repo.iterDiff`, keyed by repository
+    path, commit SHAs and diff options.  The memory budget is expressed
+    as the total number of patch lines held; least recently used
+    entries are evicted once it is exceeded, and a single diff larger
+    than the budget is never cached.
+
+    Callers always receive copies (see :meth:`DiffFile.copy`) since
+    views consume chunk lines as context gets expanded.  Files are
+    parsed at most once, whichever copy asks first.
+    """
+
+    def __init__(self, max_lines=DEFAULT_CACHE_LINES):
+        self.max_lines = max_lines
+        self.lines = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(repo, old, new, **options):
+        return (repo.path, old, new, tuple(sorted(options.items())))
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.lines = 0
+
+    def _store(self, key, files, size):
+        if size > self.max_lines:
+            return
+        with self._lock:
+            self._entries[key] = (files, size)
+            self.lines += size
+            while self.lines > self.max_lines:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.lines -= evicted
+
+    def diff(self, repo, old, new, lazy=False, **options):
+        """Return the diff from *old* to *new*, computing it if needed.
+
+        Accepts the same keyword options as :meth:`Repo.diff`.  With
+        *lazy*, the returned files may still need to be parsed with
+        :meth:`DiffFile.parse`.  If another thread is already computing
+        the same diff, wait for it rather than doing the work twice.
+        """
+        key = self.key(repo, old, new, **options)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    files = entry[0]
+                    break
+                event = self._pending.get(key)
+                if event is None:
+                    event = self._pending[key] = threading.Event()
+                    self.misses += 1
+                    files = None
+                    break
+            # If the other thread fails we loop around and compute
+            # the diff ourselves, which reports the error to our caller.
+            event.wait()
+        if files is None:
+            try:
+                files = list(repo.iterDiff(old, new, **options))
+                self._store(key, files, sum(f.patch_lines for f in files))
+            finally:
+                with self._lock:
+                    del self._pending[key]
+                event.set()
+        files = [f.copy() for f in files]
+        if not lazy:
+            for f in files:
+                f.parse()
+        return files
+
+
+class DiffPrefetcher:
+    """Precompute diffs for pull requests the user is likely to open.
+
+    Views call :meth:`prefetch` with the focused pull request followed
+    by the ones after it in list order.  A single daemon thread computes
+    the diff that the ``diff-default`` setting would open for each of
+    them (plus the head commit of the focused one) into the
+    :class:`DiffCache`.
+
+    The work is bounded: only one diff is computed at a time, pull
+    requests with more changed lines than ``diff-prefetch-max-lines``
+    are skipped, and the cache enforces its own memory budget.  Each
+    call to :meth:`prefetch` supersedes the previous one, so queued
+    work for pull requests the user has moved past is dropped.
+    """
+
+    def __init__(self, app, cache, count, max_lines):
+        self.log = logging.getLogger('hubtty.diffcache')
+        self.app = app
+        self.cache = cache
+        self.count = count
+        self.max_lines = max_lines
+        self.generation = 0
+        self.queue = queue.Queue()
+        self.thread = None
+
+    def prefetch(self, pr_keys):
+        """Replace any pending work with prefetching for *pr_keys*.
+
+        The first key is the focused pull request; its head commit is
+        prefetched as well.
+        """
+        if not self.count:
+            return
+        self.generation += 1
+        for i, pr_key in enumerate(pr_keys[:self.count + 1]):
+            self.queue.put((self.generation, pr_key, i == 0))
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True,
+                                           name='diff prefetch')
+            self.thread.start()
+
+    def cancel(self):
+        """Drop all queued prefetch work."""
+        self.generation += 1
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            try:
+                self._process(*job)
+            except Exception:
+                self.log.exception("Error prefetching diff for %s", job)
+
+    def _process(self, generation, pr_key, head):
+        # Don't take the database lock for superseded work.
+        if generation != self.generation:
+            return
+        for repo_name, old, new in self._getWanted(pr_key, head):
+            if generation != self.generation:
+                return
+            # Never clone a repository just to prefetch a diff.
+            if not os.path.exists(os.path.join(self.app.config.git_root,
+                                               repo_name)):
+                return
+            repo = gitrepo.get_repo(repo_name, self.app.config)
+            if repo.checkCommits({old, new} - {gitrepo.EMPTY_TREE_SHA}):
+                self.log.debug("Not prefetching %s..%s; commits missing",
+                               old, new)
+                continue
+            self.log.debug("Prefetching diff %s..%s", old, new)
+            self.cache.diff(
+                repo, old, new, show_old_commit=False,
+                syntax_highlighting=self.app.config.syntax_highlighting,
+                max_highlight_size=self.app.config.max_highlight_size)
+
+    def _getWanted(self, pr_key, head):
+        with self.app.db.getSession() as session:
+            pr = session.getPullRequest(pr_key)
+            if pr is None or not pr.commits:
+                return []
+            if pr.additions + pr.deletions > self.max_lines:
+                return []
+            repo_name = pr.repository.name
+            first = pr.commits[0]
+            last = pr.commits[-1]
+            if self.app.config.diff_default == 'full':
+                wanted = [(repo_name, first.parent, last.sha)]
+            else:
+                wanted = [(repo_name, first.parent, first.sha)]
+            if head and (repo_name, last.parent, last.sha) not in wanted:
+                wanted.append((repo_name, last.parent, last.sha))
+        return wanted
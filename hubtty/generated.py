@@ -29,13 +29,12 @@ Four sources of patterns are combined (checked in this order):
    (``generated-files`` list).
 """
 
+import collections
 import fnmatch
 import logging
 import os
 import re
-
-import git
-import gitdb
+import threading
 
 log = logging.getLogger(__name__)
 
@@ -181,6 +180,77 @@ def _match_pattern(pattern, path):
         return False
 
 
+_GLOB_CHARS = re.compile(r'[*?\[]')
+
+
+class _PatternSet:
+    """A list of glob patterns compiled for matching many paths.
+
+    Matches exactly like :func:`_match_pattern` applied to each
+    pattern in turn, but does the work of interpreting the patterns
+    once:
+
+    * Basename patterns without wildcards are looked up in a set.
+    * Basename patterns of the form ``*<literal>`` (e.g. ``*.min.js``)
+      are looked up by suffix.
+    * The remaining basename patterns, and the full-path patterns, are
+      each combined into a single alternation regex.
+    """
+
+    def __init__(self, patterns):
+        self.names = set()
+        self.suffixes = set()
+        basename_regexes = []
+        path_regexes = []
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if pattern.endswith('/'):
+                pattern = pattern[:-1]
+            if not pattern:
+                continue
+            if '/' not in pattern:
+                if not _GLOB_CHARS.search(pattern):
+                    self.names.add(pattern)
+                elif (pattern.startswith('*') and
+                      not _GLOB_CHARS.search(pattern[1:])):
+                    self.suffixes.add(pattern[1:])
+                else:
+                    basename_regexes.append(fnmatch.translate(pattern))
+                continue
+            regex = '^' + _glob_to_regex(pattern) + '$'
+            try:
+                re.compile(regex)
+            except re.error:
+                log.debug("Invalid glob pattern %r (bad regex %r)",
+                          pattern, regex)
+                continue
+            path_regexes.append(regex)
+        self.suffix_lengths = sorted({len(s) for s in self.suffixes})
+        self.basename_re = self._combine(basename_regexes)
+        self.path_re = self._combine(path_regexes)
+
+    @staticmethod
+    def _combine(regexes):
+        if not regexes:
+            return None
+        return re.compile('|'.join('(?:%s)' % r for r in regexes))
+
+    def match(self, path):
+        basename = os.path.basename(path)
+        if basename in self.names:
+            return True
+        for length in self.suffix_lengths:
+            if length > len(basename):
+                break
+            if basename[len(basename) - length:] in self.suffixes:
+                return True
+        if self.basename_re is not None and self.basename_re.match(basename):
+            return True
+        if self.path_re is not None and self.path_re.match(path):
+            return True
+        return False
+
+
 def parse_gitattributes(content):
     """Parse ``.gitattributes`` content for ``linguist-generated`` markers.
 
@@ -216,6 +286,22 @@ def parse_gitattributes(content):
     return generated, not_generated
 
 
+def _gitattributes_blob(repo_path, commit_sha):
+    """Return the ``.gitattributes`` blob of a commit, or None."""
+    import git
+    import gitdb
+    try:
+        repo = git.Repo(repo_path)
+        commit = repo.commit(commit_sha)
+        return commit.tree['.gitattributes']
+    except (KeyError, gitdb.exc.BadObject, ValueError):
+        return None
+    except Exception:
+        log.debug("Failed to read .gitattributes from commit %s",
+                  commit_sha, exc_info=True)
+        return None
+
+
 def read_gitattributes(repo_path, commit_sha=None):
     """Read ``.gitattributes`` content from a git repository.
 
@@ -230,13 +316,11 @@ def read_gitattributes(repo_path, commit_sha=None):
         exist or cannot be read.
     """
     if commit_sha:
+        blob = _gitattributes_blob(repo_path, commit_sha)
+        if blob is None:
+            return ''
         try:
-            repo = git.Repo(repo_path)
-            commit = repo.commit(commit_sha)
-            blob = commit.tree['.gitattributes']
             return blob.data_stream.read().decode('utf-8', errors='replace')
-        except (KeyError, gitdb.exc.BadObject, ValueError):
-            return ''
         except Exception:
             log.debug("Failed to read .gitattributes from commit %s",
                       commit_sha, exc_info=True)
@@ -258,6 +342,10 @@ class GeneratedFileFilter:
     highest precedence and can un-mark a file that would otherwise
     match a built-in or user-supplied pattern.
 
+    Patterns are compiled when the filter is created and results are
+    remembered per path, so a filter is meant to be reused; see
+    :func:`get_filter`.
+
     Usage::
 
         filt = GeneratedFileFilter(
@@ -276,21 +364,29 @@ class GeneratedFileFilter:
             (optional; falls back to the working-tree copy).
         user_patterns: Extra glob patterns supplied via the Hubtty
             ``generated-files`` configuration option.
+        gitattributes: ``.gitattributes`` content to use instead of
+            reading it from *repo_path*.
     """
 
-    def __init__(self, repo_path=None, commit_sha=None, user_patterns=None):
+    def __init__(self, repo_path=None, commit_sha=None, user_patterns=None,
+                 gitattributes=None):
         self._generated_patterns = list(BUILTIN_GENERATED_PATTERNS)
         self._not_generated_patterns = []
 
         if user_patterns:
             self._generated_patterns.extend(user_patterns)
 
-        if repo_path:
+        content = gitattributes
+        if content is None and repo_path:
             content = read_gitattributes(repo_path, commit_sha)
-            if content:
-                ga_gen, ga_not = parse_gitattributes(content)
-                self._generated_patterns.extend(ga_gen)
-                self._not_generated_patterns.extend(ga_not)
+        if content:
+            ga_gen, ga_not = parse_gitattributes(content)
+            self._generated_patterns.extend(ga_gen)
+            self._not_generated_patterns.extend(ga_not)
+
+        self._generated = _PatternSet(self._generated_patterns)
+        self._not_generated = _PatternSet(self._not_generated_patterns)
+        self._results = {}
 
     def is_generated(self, path):
         """Return ``True`` if *path* should be considered a generated file.
@@ -299,13 +395,51 @@ class GeneratedFileFilter:
             path: Repository-relative file path (e.g.
                 ``src/proto/foo.pb.go``).
         """
-        # Explicit "not generated" markers always win.
-        for pattern in self._not_generated_patterns:
-            if _match_pattern(pattern, path):
-                return False
+        result = self._results.get(path)
+        if result is None:
+            # Explicit "not generated" markers always win.
+            result = (not self._not_generated.match(path) and
+                      self._generated.match(path))
+            self._results[path] = result
+        return result
 
-        for pattern in self._generated_patterns:
-            if _match_pattern(pattern, path):
-                return True
 
-        return False
+# Filters by .gitattributes blob SHA and user patterns.
+_filters = collections.OrderedDict()
+_filters_lock = threading.Lock()
+_MAX_FILTERS = 32
+
+
+def get_filter(repo_path, commit_sha, user_patterns=None):
+    """Return a GeneratedFileFilter for a commit of a repository.
+
+    Filters are shared by all commits with the same ``.gitattributes``
+    blob (or none), so patterns are compiled and paths matched once.
+    """
+    blob = None
+    if repo_path and commit_sha:
+        blob = _gitattributes_blob(repo_path, commit_sha)
+    key = (blob.hexsha if blob is not None else None,
+           tuple(user_patterns or ()))
+    with _filters_lock:
+        filt = _filters.get(key)
+        if filt is not None:
+            _filters.move_to_end(key)
+            return filt
+    content = ''
+    if blob is not None:
+        try:
+            content = blob.data_stream.read().decode('utf-8',
+                                                      errors='replace')
+        except Exception:
+            log.debug("Failed to read .gitattributes from commit %s",
+                      commit_sha, exc_info=True)
+            # Try again next time rather than caching the failure.
+            return GeneratedFileFilter(user_patterns=user_patterns)
+    filt = GeneratedFileFilter(user_patterns=user_patterns,
+                               gitattributes=content)
+    with _filters_lock:
+        _filters[key] = filt
+        while len(_filters) > _MAX_FILTERS:
+            _filters.popitem(last=False)
+    return filt
@@ -12,17 +12,24 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import array
+import bisect
+import copy
 import datetime
 import logging
 import difflib
+import functools
 import itertools
 import os
 import re
+import threading
 
-import git
-import gitdb
+# GitPython is imported by the methods using it: it takes a large part
+# of the start-up time and is not needed to draw the first screen.
 
-from hubtty.syntax import (DEFAULT_MAX_FILE_SIZE, highlight_file,
+from hubtty import highlighter
+from hubtty import intraline
+from hubtty.syntax import (DEFAULT_MAX_FILE_SIZE, LineHighlighter,
                            merge_syntax_with_diff)
 
 # The well-known SHA of git's empty tree object.  Used as the synthetic
@@ -30,6 +37,10 @@ from hubtty.syntax import (DEFAULT_MAX_FILE_SIZE, highlight_file,
 # <empty-tree> <sha>`` shows the full content as additions.
 EMPTY_TREE_SHA = '4b825dc642cb6eb9a060e54bf899d15006bc06b3'
 
+# Lines of context around each hunk requested from git; the rest of
+# the file is read only if the user expands it.
+DEFAULT_CONTEXT = 10
+
 OLD = 0
 NEW = 1
 START = 0
@@ -127,14 +138,251 @@ class CommitContext:
             fromfile="/a/COMMIT_MSG", tofile="/b/COMMIT_MSG"))
 
 
+# Line markers, stored in LineStore as their index in this tuple.
+MARKERS = ('', ' ', '-', '+')
+
+
+class LineStore:
+    """Compact storage for the lines of a parsed DiffFile.
+
+    Each row is one displayed line, pairing a line of the old file with
+    a line of the new file; either side may be padding.  Line numbers
+    are kept in arrays (-1 for padding), markers packed into bytes and
+    text in a single buffer addressed by offsets, with unchanged lines
+    sharing their text between both sides.
+
+    Markup is only built when a row is requested.  Intraline markup is
+    computed for a whole block of changed lines at once and kept.
+    """
+
+    def __init__(self, compare=None):
+        # The following are indexed by OLD / NEW.
+        self.lineno = (array.array('i'), array.array('i'))
+        self.marker = (bytearray(), bytearray())
+        self.start = (array.array('i'), array.array('i'))
+        self.end = (array.array('i'), array.array('i'))
+        # For each row, the block of changed lines it belongs to (an
+        # index into self.blocks), or -1 for unchanged lines.
+        self.block = array.array('i')
+        # (first row, number of old lines, number of new lines)
+        self.blocks = []
+        if compare is None:
+            compare = intraline.IntralineEngine().compare
+        self.compare = compare
+        self._parts = []
+        self._length = 0
+        self._buffer = ''
+        self._intraline = {}
+        self._index = [None, None]
+
+    def __len__(self):
+        return len(self.block)
+
+    def _addText(self, text):
+        start = self._length
+        self._parts.append(text)
+        self._length += len(text)
+        return start, self._length
+
+    def _addSide(self, oldnew, lineno, marker, span):
+        self.lineno[oldnew].append(lineno)
+        self.marker[oldnew].append(marker)
+        self.start[oldnew].append(span[0])
+        self.end[oldnew].append(span[1])
+
+    def addContext(self, old_lineno, new_lineno, text):
+        span = self._addText(text)
+        self._addSide(OLD, old_lineno, 1, span)
+        self._addSide(NEW, new_lineno, 1, span)
+        self.block.append(-1)
+
+    def addChanged(self, old_lineno, old, new_lineno, new):
+        """Add a block of removed lines *old* and added lines *new*."""
+        block = len(self.blocks)
+        self.blocks.append((len(self), len(old), len(new)))
+        for i in range(max(len(old), len(new))):
+            if i < len(old):
+                self._addSide(OLD, old_lineno + i, 2, self._addText(old[i]))
+            else:
+                self._addSide(OLD, -1, 0, (0, 0))
+            if i < len(new):
+                self._addSide(NEW, new_lineno + i, 3, self._addText(new[i]))
+            else:
+                self._addSide(NEW, -1, 0, (0, 0))
+            self.block.append(block)
+
+    def text(self, oldnew, row):
+        if len(self._buffer) != self._length:
+            self._buffer = ''.join(self._parts)
+            self._parts = [self._buffer]
+        return self._buffer[self.start[oldnew][row]:self.end[oldnew][row]]
+
+    def intraline(self, block):
+        """Return the intraline markup of a block of changed lines."""
+        markup = self._intraline.get(block)
+        if markup is None:
+            first, old_count, new_count = self.blocks[block]
+            old = [self.text(OLD, first + i) for i in range(old_count)]
+            new = [self.text(NEW, first + i) for i in range(new_count)]
+            markup = self._intraline[block] = self.compare(old, new)
+        return markup
+
+    def _getIndex(self, oldnew):
+        # Rows that have a line on this side, and their line numbers;
+        # both ascending, so they can be bisected.
+        index = self._index[oldnew]
+        if index is None or index[2] != len(self):
+            rows = array.array('i')
+            linenos = array.array('i')
+            for row, lineno in enumerate(self.lineno[oldnew]):
+                if lineno >= 0:
+                    rows.append(row)
+                    linenos.append(lineno)
+            index = self._index[oldnew] = (rows, linenos, len(self))
+        return index
+
+    def rowOf(self, oldnew, lineno):
+        """Return the row of line *lineno* of the old or new file."""
+        rows, linenos, _ = self._getIndex(oldnew)
+        i = bisect.bisect_left(linenos, lineno)
+        if i < len(linenos) and linenos[i] == lineno:
+            return rows[i]
+        return None
+
+    def span(self, oldnew, start, stop):
+        """Return the first and last line numbers within some rows.
+
+        Returns ``[0, 0]`` if the rows only hold padding on that side.
+        """
+        rows, linenos, _ = self._getIndex(oldnew)
+        i = bisect.bisect_left(rows, start)
+        j = bisect.bisect_left(rows, stop) - 1
+        if i > j:
+            return [0, 0]
+        return [linenos[i], linenos[j]]
+
+
+class LazyLines:
+    """Base class for the lines of a chunk, built as they are used.
+
+    Behaves like a list of line tuples as far as the diff view uses
+    it: slicing builds just the requested lines, and lines can be
+    deleted from either end.
+    """
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._line(i)
+                    for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self._line(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._line(i)
+
+    def __delitem__(self, index):
+        start, stop, step = index.indices(len(self))
+        if start >= stop:
+            return
+        if start == 0:
+            self._dropFront(stop)
+        elif stop == len(self):
+            self._dropBack(stop - start)
+        else:
+            raise ValueError("Only lines at either end can be removed")
+
+
+class ChunkLines(LazyLines):
+    """The lines of a chunk: a window onto rows of a LineStore."""
+
+    def __init__(self, diff, start, stop):
+        self.diff = diff
+        self.start = start
+        self.stop = stop
+
+    def copy(self):
+        return ChunkLines(self.diff, self.start, self.stop)
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def _line(self, i):
+        return self.diff._storedLine(self.start + i)
+
+    def _dropFront(self, count):
+        self.start += count
+
+    def _dropBack(self, count):
+        self.stop -= count
+
+    def range(self):
+        store = self.diff.store
+        return [store.span(OLD, self.start, self.stop),
+                store.span(NEW, self.start, self.stop)]
+
+    def index(self, oldnew, lineno):
+        row = self.diff.store.rowOf(oldnew, lineno)
+        if row is not None and self.start <= row < self.stop:
+            return row - self.start
+        return None
+
+
+class GapLines(LazyLines):
+    """The lines of a DiffGapChunk, read from the file's raw lines."""
+
+    def __init__(self, diff, old_start, new_start, count):
+        self.diff = diff
+        self.old_start = old_start
+        self.new_start = new_start
+        self.count = count
+
+    def copy(self):
+        return GapLines(self.diff, self.old_start, self.new_start, self.count)
+
+    def __len__(self):
+        return self.count
+
+    def _line(self, i):
+        return self.diff._gapLine(self.old_start + i, self.new_start + i)
+
+    def _dropFront(self, count):
+        self.old_start += count
+        self.new_start += count
+        self.count -= count
+
+    def _dropBack(self, count):
+        self.count -= count
+
+    def range(self):
+        if not self.count:
+            return [[0, 0], [0, 0]]
+        return [[self.old_start, self.old_start + self.count - 1],
+                [self.new_start, self.new_start + self.count - 1]]
+
+    def index(self, oldnew, lineno):
+        if oldnew == OLD:
+            i = lineno - self.old_start
+        else:
+            i = lineno - self.new_start
+        if 0 <= i < self.count:
+            return i
+        return None
+
+
 class DiffChunk:
+    gap = False
+
     def __init__(self):
-        self.oldlines = []
-        self.newlines = []
         self.first = False
         self.last = False
+        # Set to a LazyLines object when the chunk is complete.
         self.lines = []
-        self.calcRange()
+        self.range = [[0, 0],
+                      [0, 0]]
 
     def __repr__(self):
         return '<{} old lines {}-{} / new lines {}-{}>'.format(
@@ -143,30 +391,17 @@ class DiffChunk:
             self.range[NEW][START], self.range[NEW][END])
 
     def calcRange(self):
-        self.range = [[0, 0],
-                      [0, 0]]
-        for l in self.lines:
-            if self.range[OLD][START] == 0 and l[OLD][LINENO] is not None:
-                self.range[OLD][START] = l[OLD][LINENO]
-            if self.range[NEW][START] == 0 and l[NEW][LINENO] is not None:
-                self.range[NEW][START] = l[NEW][LINENO]
-            if (self.range[OLD][START] != 0 and
-                self.range[NEW][START] != 0):
-                break
-
-        for l in self.lines[::-1]:
-            if self.range[OLD][END] == 0 and l[OLD][LINENO] is not None:
-                self.range[OLD][END] = l[OLD][LINENO]
-            if self.range[NEW][END] == 0 and l[NEW][LINENO] is not None:
-                self.range[NEW][END] = l[NEW][LINENO]
-            if (self.range[OLD][END] != 0 and
-                self.range[NEW][END] != 0):
-                break
+        self.range = self.lines.range()
 
     def indexOfLine(self, oldnew, lineno):
-        for i, l in enumerate(self.lines):
-            if l[oldnew][LINENO] == lineno:
-                return i
+        return self.lines.index(oldnew, lineno)
+
+    def copy(self):
+        chunk = copy.copy(self)
+        chunk.__dict__.pop('button', None)
+        chunk.lines = self.lines.copy()
+        chunk.range = [list(r) for r in self.range]
+        return chunk
 
 class DiffContextChunk(DiffChunk):
     context = True
@@ -174,6 +409,54 @@ class DiffContextChunk(DiffChunk):
 class DiffChangedChunk(DiffChunk):
     context = False
 
+class DiffGapChunk(DiffContextChunk):
+    """Unchanged lines between hunks that git did not include.
+
+    The diff is produced with little context; the lines in between are
+    read from the file only when the user expands them.
+    """
+    gap = True
+
+    def __init__(self, diff, old_start, new_start, count):
+        super().__init__()
+        self.lines = GapLines(diff, old_start, new_start, count)
+        self.calcRange()
+
+class DeferredSyntax:
+    """Syntax highlighting of a parsed DiffFile still being computed.
+
+    A file whose highlighting was not available when it was parsed is
+    displayed without it; :meth:`result` waits for the highlighter and
+    returns a highlighted copy of the file.
+    """
+
+    def __init__(self, sources, apply):
+        # sources is a list of (OLD or NEW, callable returning the
+        # syntax markup, possibly after waiting or working for it).
+        self.sources = sources
+        self._apply = apply
+        self._file = None
+        self._lock = threading.Lock()
+
+    @property
+    def file(self):
+        """The highlighted file, once :meth:`result` has produced it."""
+        return self._file
+
+    def result(self):
+        with self._lock:
+            if self._file is None:
+                markup = [{}, {}]
+                for oldnew, source in self.sources:
+                    try:
+                        markup[oldnew] = source()
+                    except Exception:
+                        DiffFile.log.debug("Syntax highlighting failed",
+                                           exc_info=True)
+                self._file = self._apply(markup[OLD], markup[NEW])
+            return self._file
+
+
 class DiffFile:
     log = logging.getLogger('hubtty.gitrepo')
 
@@ -184,21 +467,145 @@ class DiffFile:
         self.new_empty = False
         self.chunks = []
         self.current_chunk = None
+        self._chunk_start = 0
         self.old_lineno = 0
         self.new_lineno = 0
-        self.offset = 0
         self.old_syntax = {}
         self.new_syntax = {}
+        # The lines of the patch; see LineStore.
+        self.store = None
+        # Size of the raw patch, known before the file is parsed.
+        self.patch_lines = 0
+        self.patch_bytes = 0
+        # A file produced by Repo.iterDiff is parsed on demand: either
+        # by calling _parser, or by parsing the file it was copied
+        # from (_origin) and copying its chunks.
+        self._parser = None
+        self._origin = None
+        self._lock = threading.Lock()
+        # Set by parsing if syntax highlighting is still in progress.
+        self.deferred_syntax = None
+        # The raw lines of the file, for reading unchanged lines that
+        # are not part of the patch (see DiffGapChunk).
+        self.context_lines = None
+
+    @property
+    def parsed(self):
+        return self._parser is None and self._origin is None
+
+    def _copyParse(self, origin):
+        # Take the chunks of a parsed file, preferring its highlighted
+        # version if that has been computed by now.
+        if origin.deferred_syntax is not None:
+            if origin.deferred_syntax.file is not None:
+                origin = origin.deferred_syntax.file
+            else:
+                self.deferred_syntax = origin.deferred_syntax
+        self.store = origin.store
+        self.chunks = [chunk.copy() for chunk in origin.chunks]
+        for chunk in self.chunks:
+            chunk.lines.diff = self
+        self.old_syntax = origin.old_syntax
+        self.new_syntax = origin.new_syntax
+        self.context_lines = origin.context_lines
+
+    def parse(self):
+        """Parse the patch into chunks unless that has happened already.
+
+        Returns the file itself.
+        """
+        with self._lock:
+            if self._origin is not None:
+                self._copyParse(self._origin.parse())
+                self._origin = None
+            elif self._parser is not None:
+                parser = self._parser
+                self._parser = None
+                parser(self)
+        return self
+
+    def copy(self):
+        """Return a copy whose chunks can be consumed independently.
+
+        The diff view removes lines from chunks as context is expanded,
+        so a cached diff hands out copies of the chunks; the line
+        storage itself is shared.  Copies of an unparsed file parse the
+        original when they are parsed, so the work is shared.
+        """
+        f = copy.copy(self)
+        f._lock = threading.Lock()
+        if self.parsed:
+            f.deferred_syntax = None
+            f._copyParse(self)
+        else:
+            f._parser = None
+            f._origin = self
+        return f
+
+    def withSyntax(self, old_syntax, new_syntax):
+        """Return a copy of this parsed file using the given syntax markup."""
+        f = self.copy()
+        f.deferred_syntax = None
+        f.old_syntax = old_syntax
+        f.new_syntax = new_syntax
+        return f
+
+    def _storedLine(self, row):
+        store = self.store
+        block = store.block[row]
+        line = []
+        for oldnew, syntax in ((OLD, self.old_syntax), (NEW, self.new_syntax)):
+            lineno = store.lineno[oldnew][row]
+            if lineno < 0:
+                line.append((None, '', ''))
+                continue
+            if block < 0:
+                markup = syntax.get(lineno, store.text(oldnew, row))
+            else:
+                first = store.blocks[block][0]
+                markup = store.intraline(block)[oldnew][row - first]
+                if lineno in syntax:
+                    markup = merge_syntax_with_diff(syntax[lineno], markup)
+            line.append((lineno, MARKERS[store.marker[oldnew][row]],
+                         self.expand_tabs(markup)))
+        return tuple(line)
+
+    def _gapLine(self, old_lineno, new_lineno):
+        text = self.context_lines[new_lineno - 1]
+        text = text.decode('utf-8', errors='replace')
+        old = self.old_syntax.get(old_lineno, text)
+        new = self.new_syntax.get(new_lineno, text)
+        return ((old_lineno, ' ', self.expand_tabs(old)),
+                (new_lineno, ' ', self.expand_tabs(new)))
+
+    def findLine(self, old_lineno, new_lineno):
+        """Return the line tuples displaying the given line numbers.
+
+        Works for lines that have already been taken out of their
+        chunk for display.  Returns None if there is no such line.
+        """
+        if self.store is not None:
+            for oldnew, lineno in ((NEW, new_lineno), (OLD, old_lineno)):
+                if lineno is None:
+                    continue
+                row = self.store.rowOf(oldnew, lineno)
+                if row is not None:
+                    line = self._storedLine(row)
+                    if (line[OLD][LINENO] == old_lineno and
+                        line[NEW][LINENO] == new_lineno):
+                        return line
+                break
+        if (self.context_lines is not None and
+            old_lineno is not None and new_lineno is not None and
+            0 < new_lineno <= len(self.context_lines)):
+            return self._gapLine(old_lineno, new_lineno)
+        return None
 
     def finalize(self):
         if not self.current_chunk:
             return
-        oldlines = [(n, d, self.expand_tabs(l)) for (n, d, l)
-                        in self.current_chunk.oldlines]
-        newlines = [(n, d, self.expand_tabs(l)) for (n, d, l)
-                        in self.current_chunk.newlines]
-        self.current_chunk.lines = list(
-                zip(oldlines, newlines))
+        self.current_chunk.lines = ChunkLines(
+            self, self._chunk_start, len(self.store))
         if not self.chunks:
             self.current_chunk.first = True
         else:
@@ -242,50 +649,42 @@ class DiffFile:
             self.log.exception("Error expanding tabs")
             return l
 
-    def addDiffLines(self, old, new):
-        if (self.current_chunk and
-            not isinstance(self.current_chunk, DiffChangedChunk)):
+    def _startChunk(self, cls):
+        if self.current_chunk and not isinstance(self.current_chunk, cls):
             self.finalize()
+        if self.store is None:
+            self.store = LineStore()
         if not self.current_chunk:
-            self.current_chunk = DiffChangedChunk()
-        for l in old:
-            if self.old_syntax and self.old_lineno in self.old_syntax:
-                l = merge_syntax_with_diff(
-                    self.old_syntax[self.old_lineno], l)
-            self.current_chunk.oldlines.append((self.old_lineno, '-', l))
-            self.old_lineno += 1
-            self.offset -= 1
-        for l in new:
-            if self.new_syntax and self.new_lineno in self.new_syntax:
-                l = merge_syntax_with_diff(
-                    self.new_syntax[self.new_lineno], l)
-            self.current_chunk.newlines.append((self.new_lineno, '+', l))
-            self.new_lineno += 1
-            self.offset += 1
-        while self.offset > 0:
-            self.current_chunk.oldlines.append((None, '', ''))
-            self.offset -= 1
-        while self.offset < 0:
-            self.current_chunk.newlines.append((None, '', ''))
-            self.offset += 1
+            self.current_chunk = cls()
+            self._chunk_start = len(self.store)
 
-    def addNewLine(self, line):
-        if (self.current_chunk and
-            not isinstance(self.current_chunk, DiffChangedChunk)):
+    def addDiffLines(self, old, new):
+        """Add removed lines *old* and added lines *new* (plain text)."""
+        self._startChunk(DiffChangedChunk)
+        self.store.addChanged(self.old_lineno, old, self.new_lineno, new)
+        self.old_lineno += len(old)
+        self.new_lineno += len(new)
+
+    def addGap(self, count):
+        """Add *count* unchanged lines that are not part of the patch."""
+        if self.current_chunk:
             self.finalize()
-        if not self.current_chunk:
-            self.current_chunk = DiffChangedChunk()
+        chunk = DiffGapChunk(self, self.old_lineno, self.new_lineno, count)
+        if not self.chunks:
+            chunk.first = True
+        else:
+            self.chunks[-1].last = False
+        chunk.last = True
+        self.chunks.append(chunk)
+        self.old_lineno += count
+        self.new_lineno += count
+
+    def addNewLine(self, line):
+        self._startChunk(DiffChangedChunk)
 
     def addContextLine(self, line):
-        if (self.current_chunk and
-            not isinstance(self.current_chunk, DiffContextChunk)):
-            self.finalize()
-        if not self.current_chunk:
-            self.current_chunk = DiffContextChunk()
-        old_content = self.old_syntax.get(self.old_lineno, line)
-        new_content = self.new_syntax.get(self.new_lineno, line)
-        self.current_chunk.oldlines.append((self.old_lineno, ' ', old_content))
-        self.current_chunk.newlines.append((self.new_lineno, ' ', new_content))
+        self._startChunk(DiffContextChunk)
+        self.store.addContext(self.old_lineno, self.new_lineno, line)
         self.old_lineno += 1
         self.new_lineno += 1
 
@@ -295,17 +694,25 @@ class GitCloneError(Exception):
         self.msg = msg
 
 class Repo:
-    def __init__(self, url, path):
+    def __init__(self, url, path, intraline_engine=None, syntax_highlighter=None):
         self.log = logging.getLogger('hubtty.gitrepo')
         self.url = url
         self.path = path
-        self.differ = difflib.Differ()
+        if intraline_engine is None:
+            intraline_engine = intraline.get_engine()
+        self.intraline_engine = intraline_engine
+        if syntax_highlighter is None:
+            syntax_highlighter = highlighter.get_highlighter()
+        self.highlighter = syntax_highlighter
         if not os.path.exists(path):
             if url is None:
                 raise GitCloneError("No URL available for git clone")
+            import git
             git.Repo.clone_from(self.url, self.path)
 
     def checkCommits(self, shas):
+        import git
+        import gitdb
         invalid = set()
         repo = git.Repo(self.path)
         for sha in shas:
@@ -318,6 +725,7 @@ class Repo:
         return invalid
 
     def fetch(self, url, refspec):
+        import git
         repo = git.Repo(self.path)
         # If any refspec targets the currently checked-out branch, detach
         # HEAD first so that git doesn't refuse the fetch.
@@ -343,6 +751,7 @@ class Repo:
             repo.git.fetch(url, refspec)
 
     def deleteRef(self, ref):
+        import git
         repo = git.Repo(self.path)
         try:
             # Use force to delete even unmerged refs
@@ -351,126 +760,60 @@ class Repo:
             self.log.error("Failed to delete ref: %s", e.stderr)
 
 
-    trailing_ws_re = re.compile(r'\s+$')
-    def _emph_trail_ws(self, style, line):
-        result = (style, line)
-        re_result = self.trailing_ws_re.search(line)
-        if (re_result):
-            span = re_result.span()
-            if len(line[:span[0]]) == 0:
-                ws_line = ('trailing-ws', line)
-            else:
-                ws_line = [(style, line[:span[0]]),
-                           ('trailing-ws', line[span[0]:span[1]])]
-            result = ws_line
-        return result
-
     def intralineDiff(self, old, new):
         # takes a list of old lines and a list of new lines
-        prevline = None
-        prevstyle = None
-        output_old = []
-        output_new = []
-        #self.log.debug('startold' + repr(old))
-        #self.log.debug('startnew' + repr(new))
-        for line in self.differ.compare(old, new):
-            #self.log.debug('diff output: ' + line)
-            key = line[0]
-            rest = line[2:]
-            if key == '?':
-                result = []
-                accumulator = ''
-                emphasis = False
-                rest = rest[:-1]  # It has a newline.
-                for i, c in enumerate(prevline):
-                    if i >= len(rest):
-                        indicator = ' '
-                    else:
-                        indicator = rest[i]
-                    #self.log.debug('%s %s %s %s %s' % (i, c, indicator, emphasis, accumulator))
-                    if indicator != ' ' and not emphasis:
-                        # changing from not emph to emph
-                        if accumulator:
-                            result.append((prevstyle+'-line', accumulator))
-                        accumulator = ''
-                        emphasis = True
-                    elif indicator == ' ' and emphasis:
-                        # changing from emph to not emph
-                        if accumulator:
-                            result.append((prevstyle+'-word', accumulator))
-                        accumulator = ''
-                        emphasis = False
-                    accumulator += c
-                if accumulator:
-                    if emphasis:
-                        result.append(self._emph_trail_ws(prevstyle+'-word',
-                                                          accumulator))
-                    else:
-                        result.append(self._emph_trail_ws(prevstyle+'-line',
-                                                          accumulator))
-                if prevstyle == 'added':
-                    output_new.append(result)
-                elif prevstyle == 'removed':
-                    output_old.append(result)
-                prevline = None
-                continue
-            if prevline is not None:
-                if prevstyle == 'added' or prevstyle == 'context':
-                    output_new.append(self._emph_trail_ws(prevstyle+'-line',
-                                                          prevline))
-                if prevstyle == 'removed' or prevstyle == 'context':
-                    output_old.append((prevstyle+'-line', prevline))
-            if key == '+':
-                prevstyle = 'added'
-            elif key == '-':
-                prevstyle = 'removed'
-            elif key == ' ':
-                prevstyle = 'context'
-            prevline = rest
-        #self.log.debug('prev'+repr(prevline))
-        if prevline is not None:
-            if prevstyle == 'added':
-                output_new.append(self._emph_trail_ws(prevstyle+'-line',
-                                                      prevline))
-            elif prevstyle == 'removed':
-                output_old.append((prevstyle+'-line', prevline))
-        #self.log.debug(repr(output_old))
-        #self.log.debug(repr(output_new))
-        return output_old, output_new
+        return self.intraline_engine.compare(old, new)
 
     header_re = re.compile(r'@@ -(\d+)(,\d+)? \+(\d+)(,\d+)? @@')
     def _highlight(self, commit, path, max_file_size=None):
-        """Return per-line syntax markup for *path* in *commit*."""
+        """Return a Future of per-line syntax markup for *path* in *commit*."""
         if path in ('Empty file', '/COMMIT_MSG'):
-            return {}
+            return highlighter.completed({})
+        limit = max_file_size if max_file_size is not None \
+            else DEFAULT_MAX_FILE_SIZE
         try:
             blob = commit.tree[path]
-            limit = max_file_size if max_file_size is not None \
-                else DEFAULT_MAX_FILE_SIZE
+        except KeyError:
+            return highlighter.completed({})
+
+        def read():
             if blob.size > limit:
-                return {}
-            data = blob.data_stream.read()
-            # Skip binary files (null-byte heuristic).
-            if b'\x00' in data:
-                return {}
-            text = data.decode('utf-8')
-            return highlight_file(path, text, max_file_size=limit)
-        except Exception:
-            self.log.debug("Syntax highlighting failed for %s in %s",
-                           path, commit, exc_info=True)
-            return {}
+                return None
+            try:
+                data = blob.data_stream.read()
+                # Skip binary files (null-byte heuristic).
+                if b'\x00' in data:
+                    return None
+                return data.decode('utf-8')
+            except Exception:
+                self.log.debug("Syntax highlighting failed for %s in %s",
+                               path, commit, exc_info=True)
+                return None
+        return self.highlighter.submit(blob.hexsha, path, read, limit)
 
-    def diff(self, old, new, context=10000, show_old_commit=False,
+    def diff(self, old, new, context=DEFAULT_CONTEXT, show_old_commit=False,
              syntax_highlighting=True, max_highlight_size=None):
         """Create a diff from old to new.
 
         Note that the commit message is also diffed, and listed as /COMMIT_MSG.
         """
+        return [f.parse() for f in self.iterDiff(
+            old, new, context=context, show_old_commit=show_old_commit,
+            syntax_highlighting=syntax_highlighting,
+            max_highlight_size=max_highlight_size)]
+
+    def iterDiff(self, old, new, context=DEFAULT_CONTEXT, show_old_commit=False,
+                 syntax_highlighting=True, max_highlight_size=None):
+        """Yield the files of a diff from old to new without parsing them.
+
+        Git produces the whole patch at once, but turning it into
+        chunks (intraline diffs, syntax highlighting, tab expansion) is
+        deferred until DiffFile.parse() is called on a file.
+        """
+        import git
         repo = git.Repo(self.path)
-        #'-y', '-x', 'diff -C10', old, new, path).split('\n'):
         oldc = repo.commit(old)
         newc = repo.commit(new)
-        files = []
         extra_contexts = []
         if show_old_commit:
             extra_contexts.append(CommitContext(oldc, newc))
@@ -490,114 +833,187 @@ class Repo:
             if diff_context.deleted_file:
                 f.newname = 'Empty file'
                 f.new_empty = True
-            files.append(f)
             if diff_context.rename_from:
                 f.oldname = diff_context.rename_from
             if diff_context.rename_to:
                 f.newname = diff_context.rename_to
-            if syntax_highlighting:
-                if not f.old_empty:
-                    f.old_syntax = self._highlight(
-                        oldc, f.oldname, max_file_size=max_highlight_size)
-                if not f.new_empty:
-                    f.new_syntax = self._highlight(
-                        newc, f.newname, max_file_size=max_highlight_size)
-            oldchunk = []
-            newchunk = []
-            prev_key = ''
-            if isinstance(diff_context.diff, str):
-                diff_text = diff_context.diff
-            else:
-                diff_text = diff_context.diff.decode('utf-8')
-            diff_lines = diff_text.split('\n')
-            for i, line in enumerate(diff_lines):
-                last_line = (i == len(diff_lines)-1)
-                if line.startswith('---'):
-                    continue
-                if line.startswith('+++'):
-                    continue
-                if line.startswith('@@'):
-                    #socket.sendall(line)
-                    m = self.header_re.match(line)
-                    #socket.sendall(str(m.groups()))
-                    f.old_lineno = int(m.group(1))
-                    f.new_lineno = int(m.group(3))
-                    continue
-                if not line:
-                    if prev_key != '\\':
-                        # Strangely, we get an extra newline in the
-                        # diff in the case that the last line is "\ No
-                        # newline at end of file".  This is a
-                        # workaround for that.
-                        prev_key = ''
-                        line = 'X '
-                    else:
-                        line = ' '
-                key = line[0]
-                rest = line[1:]
-                if key == '\\':
-                    # This is for "\ No newline at end of file" which
-                    # follows either a -, + or ' ' line to indicate
-                    # which file it's talking about (or both).  For
-                    # now, treat it like normal text and let the user
-                    # infer from context that it's not actually in the
-                    # file.  Potential TODO: highlight it to make that
-                    # more clear.
-                    if prev_key:
-                        key = prev_key
-                    else:
-                        key = ' '
-                    prev_key = '\\'
-                if key == '-':
-                    prev_key = '-'
-                    oldchunk.append(rest)
-                    if not last_line:
-                        continue
-                if key == '+':
-                    prev_key = '+'
-                    newchunk.append(rest)
-                    if not last_line:
-                        continue
-                prev_key = ''
-                # end of chunk
+            if diff_context.diff:
+                f.patch_bytes = len(diff_context.diff)
+                if isinstance(diff_context.diff, str):
+                    f.patch_lines = diff_context.diff.count('\n')
+                else:
+                    f.patch_lines = diff_context.diff.count(b'\n')
+            f._parser = functools.partial(
+                self._parseDiff, diff_context=diff_context,
+                oldc=oldc, newc=newc,
+                syntax_highlighting=syntax_highlighting,
+                max_highlight_size=max_highlight_size)
+            yield f
+
+    def _parseDiff(self, f, diff_context, oldc, newc,
+                   syntax_highlighting, max_highlight_size):
+        f.store = LineStore(self.intralineDiff)
+        if (f.context_lines is None and diff_context.diff and
+            not isinstance(diff_context, CommitContext) and
+            not f.old_empty and not f.new_empty):
+            f.context_lines = self._readLines(newc, f.newname)
+        oldchunk = []
+        newchunk = []
+        prev_key = ''
+        hunks = False
+        if isinstance(diff_context.diff, str):
+            diff_text = diff_context.diff
+        else:
+            diff_text = diff_context.diff.decode('utf-8')
+        diff_lines = diff_text.split('\n')
+        for i, line in enumerate(diff_lines):
+            last_line = (i == len(diff_lines)-1)
+            if line.startswith('---'):
+                continue
+            if line.startswith('+++'):
+                continue
+            if line.startswith('@@'):
+                #socket.sendall(line)
+                m = self.header_re.match(line)
+                #socket.sendall(str(m.groups()))
                 if oldchunk or newchunk:
-                    oldchunk, newchunk = self.intralineDiff(oldchunk, newchunk)
                     f.addDiffLines(oldchunk, newchunk)
-                oldchunk = []
-                newchunk = []
-                if key == ' ':
-                    f.addContextLine(rest)
-                    continue
-                if line.startswith("similarity index"):
-                    continue
-                if line.startswith("rename"):
-                    continue
-                if line.startswith("index"):
-                    continue
-                if line.startswith("Binary files"):
+                    oldchunk = []
+                    newchunk = []
+                old_start = int(m.group(1))
+                new_start = int(m.group(3))
+                if f.context_lines is not None:
+                    if not hunks:
+                        f.old_lineno = f.new_lineno = 1
+                    if new_start > f.new_lineno:
+                        f.addGap(new_start - f.new_lineno)
+                hunks = True
+                f.old_lineno = old_start
+                f.new_lineno = new_start
+                continue
+            if not line:
+                if prev_key != '\\':
+                    # Strangely, we get an extra newline in the
+                    # diff in the case that the last line is "\ No
+                    # newline at end of file".  This is a
+                    # workaround for that.
+                    prev_key = ''
+                    line = 'X '
+                else:
+                    line = ' '
+            key = line[0]
+            rest = line[1:]
+            if key == '\\':
+                # This is for "\ No newline at end of file" which
+                # follows either a -, + or ' ' line to indicate
+                # which file it's talking about (or both).  For
+                # now, treat it like normal text and let the user
+                # infer from context that it's not actually in the
+                # file.  Potential TODO: highlight it to make that
+                # more clear.
+                if prev_key:
+                    key = prev_key
+                else:
+                    key = ' '
+                prev_key = '\\'
+            if key == '-':
+                prev_key = '-'
+                oldchunk.append(rest)
+                if not last_line:
                     continue
+            if key == '+':
+                prev_key = '+'
+                newchunk.append(rest)
                 if not last_line:
-                    raise Exception("Unhandled line: %s" % line)
-            if not diff_context.diff:
-                # There is no diff, possibly because this is simply a
-                # rename.  Include context lines so that comments may
-                # appear.
-                if not f.new_empty:
-                    blob = newc.tree[f.newname]
-                else:
-                    blob = oldc.tree[f.oldname]
-                f.old_lineno = 1
-                f.new_lineno = 1
-                for line in blob.data_stream.read().splitlines():
-                    if isinstance(line, str):
-                        f.addContextLine(line)
-                    else:
-                        try:
-                            f.addContextLine(line.decode('utf8'))
-                        except:
-                            f.addContextLine("<binary data>")
-            f.finalize()
-        return files
+                    continue
+            prev_key = ''
+            # end of chunk
+            if oldchunk or newchunk:
+                f.addDiffLines(oldchunk, newchunk)
+            oldchunk = []
+            newchunk = []
+            if key == ' ':
+                f.addContextLine(rest)
+                continue
+            if line.startswith("similarity index"):
+                continue
+            if line.startswith("rename"):
+                continue
+            if line.startswith("index"):
+                continue
+            if line.startswith("Binary files"):
+                continue
+            if not last_line:
+                raise Exception("Unhandled line: %s" % line)
+        if hunks and f.context_lines is not None:
+            # Unchanged lines after the last hunk.
+            if len(f.context_lines) >= f.new_lineno:
+                f.addGap(len(f.context_lines) - f.new_lineno + 1)
+        if not diff_context.diff:
+            # There is no diff, possibly because this is simply a
+            # rename.  Include the file as context so that comments may
+            # appear.
+            if not f.new_empty:
+                f.context_lines = self._readLines(newc, f.newname)
+            else:
+                f.context_lines = self._readLines(oldc, f.oldname)
+            f.old_lineno = 1
+            f.new_lineno = 1
+            if f.context_lines:
+                f.addGap(len(f.context_lines))
+        f.finalize()
+        if syntax_highlighting:
+            self._applySyntax(f, oldc, newc, max_highlight_size)
+
+    def _applySyntax(self, f, oldc, newc, max_highlight_size):
+        futures = []
+        if not f.old_empty:
+            futures.append((OLD, self._highlight(
+                oldc, f.oldname, max_file_size=max_highlight_size)))
+        if not f.new_empty:
+            futures.append((NEW, self._highlight(
+                newc, f.newname, max_file_size=max_highlight_size)))
+        # The last line of each side shown before context is expanded.
+        last = [0, 0]
+        for chunk in f.chunks:
+            if not chunk.gap:
+                for oldnew in (OLD, NEW):
+                    last[oldnew] = max(last[oldnew], chunk.range[oldnew][END])
+        # Use what is ready now; the rest is applied to a copy of the
+        # file once the highlighter has finished.
+        sources = []
+        pending = False
+        for oldnew, future in futures:
+            if not future.done():
+                sources.append((oldnew, future.result))
+                pending = True
+                continue
+            markup = future.result()
+            if (isinstance(markup, LineHighlighter) and
+                not markup.ready(last[oldnew])):
+                # Lexing up to the changed lines takes a while.
+                sources.append((oldnew, functools.partial(
+                    markup.prepare, last[oldnew])))
+                pending = True
+                continue
+            sources.append((oldnew, future.result))
+            if oldnew == OLD:
+                f.old_syntax = markup
+            else:
+                f.new_syntax = markup
+        if pending:
+            f.deferred_syntax = DeferredSyntax(sources, f.withSyntax)
+
+    def _readLines(self, commit, path):
+        """Return the lines of *path* in *commit* as a list of bytes."""
+        try:
+            blob = commit.tree[path]
+        except KeyError:
+            return None
+        lines = blob.data_stream.read().split(b'\n')
+        if lines[-1] == b'':
+            lines.pop()
+        return lines
 
     def getFile(self, old, new, path, syntax_highlighting=True,
                  max_highlight_size=None):
@@ -606,6 +1022,7 @@ class Repo:
         f.newname = path
         f.old_lineno = 1
         f.new_lineno = 1
+        import git
         repo = git.Repo(self.path)
         newc = repo.commit(new)
         try:
@@ -614,20 +1031,13 @@ class Repo:
             return None
         data = blob.data_stream.read()
         if syntax_highlighting:
-            limit = max_highlight_size if max_highlight_size is not None \
-                else DEFAULT_MAX_FILE_SIZE
-            if len(data) > limit:
-                pass  # skip highlighting for large files
-            else:
-                try:
-                    text = data.decode('utf-8')
-                    syntax = highlight_file(path, text,
-                                            max_file_size=limit)
-                    f.old_syntax = syntax
-                    f.new_syntax = syntax
-                except Exception:
-                    self.log.debug("Syntax highlighting failed for %s",
-                                   path, exc_info=True)
+            syntax = self._highlight(newc, path,
+                                     max_file_size=max_highlight_size)
+            try:
+                f.old_syntax = f.new_syntax = syntax.result()
+            except Exception:
+                self.log.debug("Syntax highlighting failed for %s",
+                               path, exc_info=True)
         for line in data.splitlines():
             if isinstance(line, str):
                 f.addContextLine(line)
@@ -640,4 +1050,5 @@ def get_repo(repo_name, config):
     local_path = os.path.join(config.git_root, repo_name)
     local_root = os.path.abspath(config.git_root)
     assert os.path.commonprefix((local_root, local_path)) == local_root
-    return Repo(config.git_url + repo_name, local_path)
+    return Repo(config.git_url + repo_name, local_path,
+                intraline.get_engine(config.intraline_diff))
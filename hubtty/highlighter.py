@@ -0,0 +1,313 @@
+# Copyright The Hubtty Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Cached, parallel syntax highlighting of git blobs.
+
+Lexing a file with Pygments is the most expensive part of parsing a
+diff.  The result only depends on the content of the blob and on the
+lexer, so it is cached by blob SHA and lexer name: a file that is
+unchanged across commits, interdiffs or (with a cache directory)
+sessions is only lexed once.
+
+Files whose lexer can resume from a saved state are highlighted
+incrementally (see :class:`hubtty.syntax.LineHighlighter`): only as far
+as the lines being displayed, with the lexer checkpoints kept in the
+cache.  Once such a file has been lexed to its end, the markup of all
+of its lines is stored in the disk cache.  Other files are lexed whole in a pool of worker processes so
+that they neither block the caller nor compete for the GIL.
+"""
+
+import collections
+import concurrent.futures
+import functools
+import logging
+import marshal
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+
+from pygments.lexers import get_lexer_for_filename
+from pygments.lexers.special import TextLexer
+
+from hubtty import syntax
+
+# Default number of highlighted blobs held in memory.
+DEFAULT_CACHE_ENTRIES = 512
+
+# Default size of the on-disk cache, in bytes.  Once it is exceeded,
+# the least recently used files are removed down to PRUNE_TARGET of it.
+DEFAULT_CACHE_DIR_SIZE = 256 * 1024 * 1024
+PRUNE_TARGET = 0.8
+
+
+@functools.lru_cache(maxsize=1024)
+def _lexer_name(basename):
+    # Pygments selects lexers by file name patterns matched against
+    # the basename, so the choice can be memoized on it.
+    try:
+        lexer = get_lexer_for_filename(basename, stripall=False)
+    except Exception:
+        return None
+    if isinstance(lexer, TextLexer):
+        return None
+    return lexer.name
+
+
+def lexer_name(path):
+    """Return the name of the lexer used for *path*, or None."""
+    return _lexer_name(os.path.basename(path))
+
+
+def completed(result):
+    """Return a Future that already holds *result*."""
+    future = concurrent.futures.Future()
+    future.set_result(result)
+    return future
+
+
+class Highlighter:
+    """Highlight blobs with a per-blob cache and a process pool.
+
+    With *processes* set to 0, cache misses are lexed synchronously
+    by the calling thread.  With *cache_dir* set, the markup of every
+    highlighted file is also stored on disk, up to *cache_dir_size*
+    bytes, and survives restarts.  With *incremental* unset, every file is lexed whole.
+    """
+
+    def __init__(self, processes=0, cache_entries=DEFAULT_CACHE_ENTRIES,
+                 cache_dir=None, incremental=True,
+                 cache_dir_size=DEFAULT_CACHE_DIR_SIZE):
+        self.log = logging.getLogger('hubtty.highlighter')
+        self.processes = processes
+        self.incremental = incremental
+        self.cache_entries = cache_entries
+        self.cache_dir = cache_dir
+        self.cache_dir_size = cache_dir_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        # Futures of the files being lexed in the pool, by key.
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        # Bytes used by the disk cache; computed on the first store.
+        self._disk_usage = None
+        self._disk_lock = threading.Lock()
+
+    @staticmethod
+    def key(blob_sha, path):
+        """Return the cache key for *path* at *blob_sha*.
+
+        Returns None if the file would not be highlighted at all.
+        """
+        name = lexer_name(path)
+        if name is None:
+            return None
+        return (blob_sha, name)
+
+    def _path(self, key):
+        blob_sha, name = key
+        return os.path.join(self.cache_dir, blob_sha[:2], '%s-%s.marshal' % (
+            blob_sha, re.sub(r'\W', '_', name)))
+
+    def lookup(self, key):
+        """Return the cached markup for *key*, or None."""
+        with self._lock:
+            markup = self._entries.get(key)
+            if markup is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return markup
+        if self.cache_dir:
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as f:
+                    markup = marshal.load(f)
+                # Pruning removes the least recently used files first.
+                os.utime(path)
+            except (OSError, EOFError, ValueError, TypeError):
+                markup = None
+            if markup is not None:
+                self._remember(key, markup)
+                with self._lock:
+                    self.hits += 1
+                return markup
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _remember(self, key, markup):
+        with self._lock:
+            self._entries[key] = markup
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.cache_entries:
+                self._entries.popitem(last=False)
+
+    def store(self, key, markup):
+        self._remember(key, markup)
+        if not self.cache_dir or not isinstance(markup, dict):
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, 'wb') as f:
+                marshal.dump(markup, f)
+            os.replace(tmp, path)
+            self._addDiskUsage(os.path.getsize(path))
+        except (OSError, ValueError):
+            self.log.debug("Unable to store highlighting in %s", path,
+                           exc_info=True)
+
+    def _persist(self, key, highlighter):
+        # Building the markup of the lines not displayed yet takes
+        # about as long as lexing the file, so it is left to a thread.
+        thread = threading.Thread(
+            target=lambda: self.store(key, highlighter.lines()),
+            daemon=True, name='highlight cache')
+        thread.start()
+
+    def _cacheFiles(self):
+        """Return (mtime, size, path) of every file of the disk cache."""
+        files = []
+        for directory in os.scandir(self.cache_dir):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def _addDiskUsage(self, size):
+        with self._disk_lock:
+            if self._disk_usage is None:
+                self._disk_usage = sum(
+                    size for _, size, _ in self._cacheFiles())
+            else:
+                self._disk_usage += size
+            if self._disk_usage > self.cache_dir_size:
+                self._prune()
+
+    def _prune(self):
+        # Called with the disk lock held.
+        files = sorted(self._cacheFiles())
+        usage = sum(size for _, size, _ in files)
+        target = self.cache_dir_size * PRUNE_TARGET
+        for _, size, path in files:
+            if usage <= target:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            usage -= size
+        self.log.debug("Pruned highlight cache to %d bytes", usage)
+        self._disk_usage = usage
+
+    def _getPool(self):
+        with self._lock:
+            if self._pool is None:
+                # Fork is unsafe in a process running several threads.
+                self._pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def submit(self, blob_sha, path, read,
+               max_file_size=syntax.DEFAULT_MAX_FILE_SIZE):
+        """Highlight *path* at *blob_sha*; return a Future of its markup.
+
+        *read* is called to obtain the text of the blob, unless the
+        result is cached; it may return None to skip highlighting.  The
+        markup is a mapping as returned by
+        :func:`hubtty.syntax.highlight_file`, or a
+        :class:`hubtty.syntax.LineHighlighter` which highlights lines as
+        they are looked up.
+        """
+        key = self.key(blob_sha, path)
+        if key is None:
+            return completed({})
+        markup = self.lookup(key)
+        if markup is not None:
+            return completed(markup)
+        with self._lock:
+            future = self._pending.get(key)
+        if future is not None:
+            return future
+        text = read()
+        if text is None:
+            return completed({})
+        if self.incremental:
+            lexer = syntax.get_lexer(path)
+            if lexer is not None and syntax.resumable(lexer):
+                on_finished = None
+                if self.cache_dir:
+                    on_finished = functools.partial(self._persist, key)
+                markup = syntax.LineHighlighter(lexer, text,
+                                                on_finished=on_finished)
+                self.store(key, markup)
+                return completed(markup)
+        if not self.processes:
+            markup = syntax.highlight_file(path, text, max_file_size)
+            self.store(key, markup)
+            return completed(markup)
+        pool = self._getPool()
+        with self._lock:
+            # Another thread may have submitted it meanwhile.
+            future = self._pending.get(key)
+            if future is not None:
+                return future
+            future = pool.submit(syntax.highlight_file, path, text,
+                                 max_file_size)
+            self._pending[key] = future
+
+        def done(future):
+            if not future.cancelled() and future.exception() is None:
+                self.store(key, future.result())
+            with self._lock:
+                self._pending.pop(key, None)
+        future.add_done_callback(done)
+        return future
+
+    def shutdown(self):
+        with self._lock:
+            pool = self._pool
+            self._pool = None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+_highlighter = None
+
+
+def get_highlighter():
+    """Return the shared highlighter (synchronous unless configured)."""
+    global _highlighter
+    if _highlighter is None:
+        _highlighter = Highlighter()
+    return _highlighter
+
+
+def configure(processes=0, cache_dir=None):
+    """Replace the shared highlighter with one using these settings."""
+    global _highlighter
+    if _highlighter is not None:
+        _highlighter.shutdown()
+    _highlighter = Highlighter(processes=processes, cache_dir=cache_dir)
+    return _highlighter
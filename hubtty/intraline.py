@@ -0,0 +1,267 @@
+# Copyright The Hubtty Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Intraline highlighting of the changed lines of a diff hunk.
+
+An engine takes the removed and added lines of one hunk and returns
+urwid markup for each of them, using the ``removed-line`` /
+``added-line`` styles for unchanged text and ``removed-word`` /
+``added-word`` to emphasise what changed within a line.  Trailing
+whitespace is flagged with ``trailing-ws``.
+
+Engines (selected with the ``intraline-diff`` option):
+
+``word``
+    Pairs removed and added lines by similarity and diffs each pair
+    token by token.  Word emphasis is skipped for lines and hunks above
+    a size threshold, keeping the cost roughly linear in the size of
+    the hunk.
+``character``
+    The original ``difflib.Differ`` based character-level comparison.
+    Quadratic on large hunks.
+``none``
+    No word emphasis at all.
+"""
+
+import difflib
+import re
+
+_trailing_ws_re = re.compile(r'\s+$')
+
+
+def emph_trailing_ws(style, line):
+    """Return markup for *line* with trailing whitespace emphasised."""
+    m = _trailing_ws_re.search(line)
+    if not m:
+        return (style, line)
+    start = m.start()
+    if start == 0:
+        return ('trailing-ws', line)
+    return [(style, line[:start]), ('trailing-ws', line[start:])]
+
+
+def _emphasised(style, segments):
+    """Build markup from ``(emphasised, text)`` segments of one line."""
+    result = []
+    for emphasis, text in segments[:-1]:
+        result.append((style + ('-word' if emphasis else '-line'), text))
+    emphasis, text = segments[-1]
+    last = emph_trailing_ws(style + ('-word' if emphasis else '-line'), text)
+    if isinstance(last, list):
+        result.extend(last)
+    else:
+        result.append(last)
+    return result
+
+
+class IntralineEngine:
+    """Base class for intraline engines; emphasises nothing."""
+
+    name = 'none'
+
+    def compare(self, old, new):
+        """Return ``(old_markup, new_markup)`` lists for a hunk."""
+        return ([('removed-line', line) for line in old],
+                [emph_trailing_ws('added-line', line) for line in new])
+
+
+class CharacterEngine(IntralineEngine):
+    """Character-level comparison using ``difflib.Differ``."""
+
+    name = 'character'
+
+    def __init__(self):
+        self.differ = difflib.Differ()
+
+    def _hinted(self, style, line, hints):
+        segments = []
+        accumulator = []
+        emphasis = False
+        for i, c in enumerate(line):
+            indicator = hints[i] if i < len(hints) else ' '
+            if (indicator != ' ') != emphasis:
+                if accumulator:
+                    segments.append((emphasis, ''.join(accumulator)))
+                accumulator = []
+                emphasis = not emphasis
+            accumulator.append(c)
+        if accumulator:
+            segments.append((emphasis, ''.join(accumulator)))
+        if not segments:
+            return (style + '-line', line)
+        return _emphasised(style, segments)
+
+    def compare(self, old, new):
+        prevline = None
+        prevstyle = None
+        output_old = []
+        output_new = []
+        for line in self.differ.compare(old, new):
+            key = line[0]
+            rest = line[2:]
+            if key == '?':
+                result = self._hinted(prevstyle, prevline, rest[:-1])
+                if prevstyle == 'added':
+                    output_new.append(result)
+                elif prevstyle == 'removed':
+                    output_old.append(result)
+                prevline = None
+                continue
+            if prevline is not None:
+                if prevstyle == 'added' or prevstyle == 'context':
+                    output_new.append(emph_trailing_ws(prevstyle + '-line',
+                                                       prevline))
+                if prevstyle == 'removed' or prevstyle == 'context':
+                    output_old.append((prevstyle + '-line', prevline))
+            if key == '+':
+                prevstyle = 'added'
+            elif key == '-':
+                prevstyle = 'removed'
+            elif key == ' ':
+                prevstyle = 'context'
+            prevline = rest
+        if prevline is not None:
+            if prevstyle == 'added' or prevstyle == 'context':
+                output_new.append(emph_trailing_ws(prevstyle + '-line',
+                                                   prevline))
+            if prevstyle == 'removed' or prevstyle == 'context':
+                output_old.append((prevstyle + '-line', prevline))
+        return output_old, output_new
+
+
+class WordEngine(IntralineEngine):
+    """Token-level comparison of lines paired by similarity.
+
+    Lines of a hunk are first aligned with ``difflib.SequenceMatcher``
+    (which is fast on whole lines since they hash), then each removed
+    line in a replaced block is paired with the most similar added line
+    within a small look-ahead window.  Paired lines are diffed as
+    sequences of words, whitespace runs and punctuation.
+    """
+
+    name = 'word'
+
+    # Words, runs of whitespace, or single other characters.
+    token_re = re.compile(r'\w+|\s+|[^\w\s]')
+
+    def __init__(self, max_line_length=1000, max_hunk_size=100000,
+                 window=10, cutoff=0.5):
+        # Lines longer than max_line_length characters, and hunks with
+        # more than max_hunk_size characters in total, get no word
+        # emphasis.
+        self.max_line_length = max_line_length
+        self.max_hunk_size = max_hunk_size
+        self.window = window
+        self.cutoff = cutoff
+
+    def compare(self, old, new):
+        size = sum(map(len, old)) + sum(map(len, new))
+        if size > self.max_hunk_size:
+            return super().compare(old, new)
+        output_old = [None] * len(old)
+        output_new = [None] * len(new)
+        matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                for i, j in zip(range(i1, i2), range(j1, j2)):
+                    output_old[i] = ('context-line', old[i])
+                    output_new[j] = emph_trailing_ws('context-line', new[j])
+            elif tag == 'replace':
+                self._replace(old, new, i1, i2, j1, j2,
+                              output_old, output_new)
+        for i, markup in enumerate(output_old):
+            if markup is None:
+                output_old[i] = ('removed-line', old[i])
+        for j, markup in enumerate(output_new):
+            if markup is None:
+                output_new[j] = emph_trailing_ws('added-line', new[j])
+        return output_old, output_new
+
+    def _tokens(self, line):
+        if len(line) > self.max_line_length:
+            return None
+        return self.token_re.findall(line)
+
+    def _replace(self, old, new, i1, i2, j1, j2, output_old, output_new):
+        new_tokens = [self._tokens(line) for line in new[j1:j2]]
+        matcher = difflib.SequenceMatcher(None, autojunk=False)
+        j = j1
+        for i in range(i1, i2):
+            a = self._tokens(old[i])
+            if a is None:
+                continue
+            matcher.set_seq1(a)
+            best = None
+            best_ratio = self.cutoff
+            for k in range(j, min(j2, j + self.window)):
+                b = new_tokens[k - j1]
+                if b is None:
+                    continue
+                matcher.set_seq2(b)
+                if (matcher.real_quick_ratio() > best_ratio and
+                    matcher.quick_ratio() > best_ratio):
+                    ratio = matcher.ratio()
+                    if ratio > best_ratio:
+                        best = k
+                        best_ratio = ratio
+                        # Most replaced lines are edited in place, so
+                        # stop looking once a close match is found.
+                        if ratio >= 0.75:
+                            break
+            if best is None:
+                continue
+            matcher.set_seq2(new_tokens[best - j1])
+            output_old[i], output_new[best] = self._pair(
+                old[i], new[best], a, new_tokens[best - j1],
+                matcher.get_opcodes())
+            j = best + 1
+
+    def _pair(self, old_line, new_line, a, b, opcodes):
+        old_segments = []
+        new_segments = []
+        for tag, a1, a2, b1, b2 in opcodes:
+            emphasis = (tag != 'equal')
+            if a1 != a2:
+                self._append(old_segments, emphasis, a[a1:a2])
+            if b1 != b2:
+                self._append(new_segments, emphasis, b[b1:b2])
+        return (self._markup('removed', old_line, old_segments),
+                self._markup('added', new_line, new_segments))
+
+    @staticmethod
+    def _append(segments, emphasis, tokens):
+        if segments and segments[-1][0] == emphasis:
+            segments[-1][1].extend(tokens)
+        else:
+            segments.append((emphasis, list(tokens)))
+
+    def _markup(self, style, line, segments):
+        if not any(emphasis for emphasis, _ in segments):
+            if style == 'added':
+                return emph_trailing_ws('added-line', line)
+            return ('removed-line', line)
+        return _emphasised(style, [(emphasis, ''.join(tokens))
+                                   for emphasis, tokens in segments])
+
+
+ENGINES = {
+    'word': WordEngine,
+    'character': CharacterEngine,
+    'none': IntralineEngine,
+}
+
+
+def get_engine(name='word'):
+    """Return a new instance of the intraline engine called *name*."""
+    return ENGINES[name]()
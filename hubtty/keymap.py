@@ -40,6 +40,8 @@ PR_SEARCH = 'pull request search'
 REFINE_PR_SEARCH = 'refine pull request search'
 LIST_HELD = 'list held pull requests'
 SYNC_TASKS = 'sync tasks'
+METRICS = 'metrics'
+TOGGLE_PROFILER = 'toggle profiler'
 # Pull requests screen:
 TOGGLE_REVIEWED = 'toggle reviewed'
 TOGGLE_HIDDEN = 'toggle hidden'
@@ -109,6 +111,8 @@ DEFAULT_KEYMAP = {
     REFINE_PR_SEARCH: 'meta o',
     LIST_HELD: 'f12',
     SYNC_TASKS: 'ctrl t',
+    METRICS: 'meta t',
+    TOGGLE_PROFILER: 'meta p',
 
     TOGGLE_REVIEWED: 'v',
     TOGGLE_HIDDEN: 'k',
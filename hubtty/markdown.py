@@ -12,16 +12,75 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
+import hashlib
 import logging
-import mistune
+import threading
+
 import urwid
 
+from hubtty import commentlink
 from hubtty import mywid
 
+# Default number of rendered messages held in memory.
+DEFAULT_CACHE_ENTRIES = 512
+
+
+class RenderCache:
+    """An LRU cache of rendered messages.
+
+    Rendering the markdown of a pull request description or review
+    message and running the commentlinks over it is repeated every time
+    a pull request view is refreshed or reopened, although the result
+    only depends on the text of the message, the commentlink
+    configuration and the context the commentlinks are run with.  The
+    cache is keyed on a hash of those, so an entry is only invalidated
+    when the message body itself changes.
+
+    The cached markup is shared between callers and must not be
+    modified in place.  Links in it are bound to the application the
+    cache belongs to.
+    """
+
+    def __init__(self, max_entries=DEFAULT_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text, commentlinks, context=None):
+        digest = hashlib.sha1(text.encode('utf8')).hexdigest()
+        return (digest, tuple(c.fingerprint for c in commentlinks),
+                tuple(sorted(context.items())) if context else None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key, render):
+        """Return the markup for *key*, calling *render* on a miss."""
+        with self._lock:
+            markup = self._entries.get(key)
+            if markup is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return markup
+            self.misses += 1
+        markup = render()
+        with self._lock:
+            self._entries[key] = markup
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return markup
+
+
 class Renderer:
-    def __init__(self, app):
+    def __init__(self, app, cache=None):
         self.log = logging.getLogger('hubtty.markdown')
         self.app = app
+        self.cache = cache
 
     def toUrwidMarkup(self, ast):
         text = []
@@ -152,9 +211,27 @@ class Renderer:
         
 
     def render(self, text):
+        import mistune
         md = mistune.create_markdown(renderer='ast', plugins=['strikethrough'])
         # Misture returns newline for empty text, we don't want that
         if not text:
             return []
         ast = md(text)
         return self.toUrwidMarkup(ast)
+
+    def renderMessage(self, text, context=None):
+        """Render *text* and run the configured commentlinks over it.
+
+        The result comes from the render cache if there is one, in
+        which case it is shared and must not be modified in place.
+        """
+        text = text or ''
+        commentlinks = self.app.config.commentlinks
+
+        def render():
+            scanner = commentlink.get_scanner(tuple(commentlinks))
+            return scanner.run(self.app, self.render(text), context)
+        if self.cache is None:
+            return render()
+        return self.cache.get(
+            RenderCache.key(text, commentlinks, context), render)
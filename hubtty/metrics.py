@@ -0,0 +1,263 @@
+# Copyright The Hubtty Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Metrics about sync and the user interface.
+
+A single :class:`Metrics` instance, returned by :func:`get_metrics`,
+collects:
+
+* latency histograms, by kind and name: sync tasks by class, view
+  refreshes by view class, and the time spent waiting for and holding
+  the database lock by thread;
+* HTTP requests by method and endpoint, with their status codes and
+  the bytes received;
+* hits and misses of the ETag cache;
+* the depth of each sync queue priority over time, with its peak
+  between samples.
+
+They are shown in the metrics dialog and can be dumped to JSON.
+:class:`Profiler` captures a cProfile profile of the main thread
+between two presses of a key.
+"""
+
+import bisect
+import collections
+import contextlib
+import cProfile
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import urllib.parse
+
+# Upper bounds of the latency histogram buckets, in seconds; slower
+# observations go in a last, unbounded bucket.
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+_BUCKET_LABELS = ['<=%g' % b for b in BUCKETS] + ['>%g' % BUCKETS[-1]]
+
+# How often the queue depth is sampled, in seconds, and how many
+# samples are kept (an hour's worth).
+QUEUE_SAMPLE_INTERVAL = 5
+QUEUE_SAMPLES = 720
+
+# Path segments which vary between requests to the same endpoint.
+_sha_re = re.compile(r'^[0-9a-f]{40}$')
+
+
+def endpoint(url):
+    """Return the endpoint of an API *url*, with its parameters elided.
+
+    >>> endpoint('https://api.github.com/repos/org/repo/pulls/12?page=2')
+    'repos/:owner/:repo/pulls/:number'
+    """
+    path = urllib.parse.urlsplit(url).path.strip('/').split('/')
+    if path and path[0] == 'api':
+        # GitHub Enterprise serves the API under /api/v3.
+        path = path[2:]
+    result = []
+    for i, segment in enumerate(path):
+        if i in (1, 2) and path[0] == 'repos':
+            segment = (':owner', ':repo')[i - 1]
+        elif i == 1 and path[0] == 'users':
+            segment = ':user'
+        elif segment.isdigit():
+            segment = ':number'
+        elif _sha_re.match(segment):
+            segment = ':sha'
+        result.append(segment)
+    return '/'.join(result)
+
+
+class Histogram:
+    """A latency distribution over :data:`BUCKETS`."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Return an upper bound of the *q* quantile (0 to 1)."""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank and seen:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'buckets': dict(zip(_BUCKET_LABELS, self.buckets)),
+        }
+
+
+class Metrics:
+    """Thread-safe collection of the metrics described above."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self._latencies = {}
+        self._requests = {}
+        self._etag = collections.Counter()
+        self._queue = collections.deque(maxlen=QUEUE_SAMPLES)
+        self._queue_peak = {}
+
+    def observe(self, kind, name, seconds):
+        """Add a *seconds* long observation to the *kind*/*name* histogram."""
+        with self._lock:
+            histogram = self._latencies.get((kind, name))
+            if histogram is None:
+                histogram = self._latencies[(kind, name)] = Histogram()
+            histogram.observe(seconds)
+
+    @contextlib.contextmanager
+    def timed(self, kind, name):
+        """Observe the time spent in the body of the ``with`` statement."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(kind, name, time.perf_counter() - start)
+
+    def request(self, method, url, status, size):
+        """Count an HTTP request and the *size* bytes of its response."""
+        key = (method.upper(), endpoint(url))
+        with self._lock:
+            counts = self._requests.get(key)
+            if counts is None:
+                counts = self._requests[key] = {
+                    'count': 0, 'bytes': 0, 'status': collections.Counter()}
+            counts['count'] += 1
+            counts['bytes'] += size
+            counts['status'][status] += 1
+
+    def etag(self, hit):
+        """Count a conditional request, answered from the cache if *hit*."""
+        with self._lock:
+            self._etag['hits' if hit else 'misses'] += 1
+
+    def observeQueue(self, depths):
+        """Note *depths* (queued tasks by priority) as they change.
+
+        Only their peak is kept, until the next :meth:`sampleQueue`.
+        """
+        with self._lock:
+            for priority, depth in depths.items():
+                if depth > self._queue_peak.get(priority, 0):
+                    self._queue_peak[priority] = depth
+
+    def sampleQueue(self, depths):
+        """Record *depths* and the peak depths since the last sample.
+
+        This is meant to be called every :data:`QUEUE_SAMPLE_INTERVAL`.
+        """
+        now = time.time()
+        with self._lock:
+            peak = {priority: max(depth, self._queue_peak.get(priority, 0))
+                    for priority, depth in depths.items()}
+            self._queue_peak = {}
+            self._queue.append((now, dict(depths), peak))
+
+    def snapshot(self):
+        """Return all the metrics as a JSON-serializable dict."""
+        with self._lock:
+            latencies = {}
+            for (kind, name), histogram in sorted(self._latencies.items()):
+                latencies.setdefault(kind, {})[name] = histogram.snapshot()
+            requests = [
+                {'method': method, 'endpoint': path,
+                 'count': counts['count'], 'bytes': counts['bytes'],
+                 'status': {str(s): n for s, n in sorted(
+                     counts['status'].items())}}
+                for (method, path), counts in sorted(self._requests.items())]
+            hits, misses = self._etag['hits'], self._etag['misses']
+            queue = [{'time': when,
+                      'depths': {str(p): n for p, n in depths.items()},
+                      'peak': {str(p): n for p, n in peak.items()}}
+                     for when, depths, peak in self._queue]
+        return {
+            'started': self.started,
+            'time': time.time(),
+            'latency': latencies,
+            'requests': requests,
+            'etag': {'hits': hits, 'misses': misses,
+                     'hit_rate': hits / (hits + misses)
+                     if hits + misses else 0.0},
+            'queue': queue,
+        }
+
+    def dump(self, path):
+        """Atomically write the snapshot of the metrics to *path*."""
+        data = self.snapshot()
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, path)
+
+
+class Profiler:
+    """A cProfile capture of the main thread, started and stopped at will."""
+
+    def __init__(self):
+        self._profile = None
+
+    @property
+    def running(self):
+        return self._profile is not None
+
+    def start(self):
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def stop(self, path):
+        """Stop profiling and write the pstats data to *path*."""
+        profile, self._profile = self._profile, None
+        profile.disable()
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        profile.dump_stats(path)
+
+
+_metrics = Metrics()
+
+
+def get_metrics():
+    """Return the shared :class:`Metrics`."""
+    return _metrics
+
+
+def reset():
+    """Replace the shared metrics with empty ones."""
+    global _metrics
+    _metrics = Metrics()
+    return _metrics
@@ -32,6 +32,10 @@ GLOBAL_HELP = (
      "List held pull requests"),
     (keymap.SYNC_TASKS,
      "Show sync task queue"),
+    (keymap.METRICS,
+     "Show sync and interface metrics"),
+    (keymap.TOGGLE_PROFILER,
+     "Start or stop profiling the interface"),
     (keymap.KILL,
      "Kill to end of line (editing)"),
     (keymap.YANK,
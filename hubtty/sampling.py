@@ -0,0 +1,168 @@
+# Copyright The Hubtty Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""A sampling profiler of every thread, for diagnosing stalls.
+
+Started with ``hubtty --profile FILE``, :class:`SamplingProfiler`
+wakes up periodically and records the stack of every other thread
+(the urwid main loop, sync, background jobs...).  Nothing is done in
+the profiled threads themselves, so the overhead is low enough for
+normal use.
+
+Each sample is attributed to what its thread was busy with: the sync
+task or background job being run (declared with :func:`activity`), or
+else the outermost view or dialog method on the stack.  At exit, the
+samples are written as collapsed stacks, one per line::
+
+    thread;activity;frame;frame;... count
+
+which is the input of flame graph tools such as ``flamegraph.pl`` or
+speedscope.
+"""
+
+import collections
+import contextlib
+import logging
+import os
+import re
+import sys
+import threading
+
+# Default time between two samples, in seconds.
+DEFAULT_INTERVAL = 0.01
+
+# Activities declared by the running threads, by thread identifier.
+_activities = {}
+
+# Methods of views and dialogs, to which main thread samples are
+# attributed.
+_widget_method_re = re.compile(r'^\w+(View|Dialog)\.\w+$')
+
+log = logging.getLogger('hubtty.sampling')
+
+
+@contextlib.contextmanager
+def activity(name):
+    """Attribute the samples of this thread to *name* meanwhile."""
+    ident = threading.get_ident()
+    previous = _activities.get(ident)
+    _activities[ident] = name
+    try:
+        yield
+    finally:
+        if previous is None:
+            del _activities[ident]
+        else:
+            _activities[ident] = previous
+
+
+def _qualname(frame):
+    code = frame.f_code
+    qualname = getattr(code, 'co_qualname', None)
+    if qualname is None:
+        # Before Python 3.11, name methods after the class of self.
+        qualname = code.co_name
+        if code.co_argcount and code.co_varnames[0] == 'self':
+            owner = frame.f_locals.get('self')
+            if owner is not None:
+                qualname = '%s.%s' % (type(owner).__name__, qualname)
+    return qualname
+
+
+def _label(ident, stack):
+    # The declared activity, or else the outermost widget method of
+    # *stack* (frames, outermost first).
+    label = _activities.get(ident)
+    if label is not None:
+        return label
+    for frame in stack:
+        qualname = _qualname(frame)
+        if _widget_method_re.match(qualname):
+            return qualname
+    return 'other'
+
+
+def _stack(frame):
+    """Return the frames of the stack ending with *frame*, outermost first."""
+    stack = []
+    while frame is not None:
+        stack.append(frame)
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def origin():
+    """Return what the current thread is busy with, as in the samples."""
+    return _label(threading.get_ident(), _stack(sys._getframe(1)))
+
+
+def _frame_name(frame):
+    return '%s:%s' % (os.path.basename(frame.f_code.co_filename),
+                      _qualname(frame))
+
+
+class SamplingProfiler:
+    """Sample the stacks of all threads every *interval* seconds."""
+
+    def __init__(self, path, interval=DEFAULT_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='sampling profiler')
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling and write the collapsed stacks."""
+        self._stop.set()
+        self._thread.join()
+        self.write()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        """Record the current stack of every thread but this one."""
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            self.stacks[self._collapse(
+                names.get(ident, str(ident)), ident, frame)] += 1
+        self.samples += 1
+
+    def _collapse(self, thread_name, ident, frame):
+        stack = _stack(frame)
+        names = [_frame_name(frame) for frame in stack]
+        return ';'.join([thread_name, _label(ident, stack)] + names)
+
+    def write(self):
+        try:
+            directory = os.path.dirname(self.path) or '.'
+            os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'w') as f:
+                for stack, count in sorted(self.stacks.items()):
+                    f.write('%s %d\n' % (stack.replace(' ', '_'), count))
+        except OSError:
+            log.exception("Unable to write profile to %s", self.path)
+            return
+        log.info("Wrote %d samples to %s", self.samples, self.path)
@@ -0,0 +1,66 @@
+# Copyright The Hubtty Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Snapshots of the repository list for a fast first paint.
+
+Counting the open and unreviewed pull requests of every repository is
+the slowest part of drawing the first screen on a large database.  With
+the ``startup-snapshot`` option, the rows of the repository list and
+the number of held pull requests are saved at exit, shown as is on the
+next launch, and replaced by the real data once it has been loaded in
+the background.
+"""
+
+import json
+import logging
+import os
+import tempfile
+
+# Bumped whenever the layout of the snapshot changes; older snapshots
+# are ignored.
+VERSION = 1
+
+log = logging.getLogger(__name__)
+
+
+def save(path, data):
+    """Atomically write the snapshot *data* (a dict) to *path*."""
+    data = dict(data, version=VERSION)
+    directory = os.path.dirname(path) or '.'
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    except OSError:
+        log.exception("Unable to save snapshot to %s", path)
+
+
+def load(path):
+    """Return the snapshot stored in *path*, or None if there is none.
+
+    Unreadable, corrupt or outdated snapshots are ignored.
+    """
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        log.warning("Ignoring unreadable snapshot %s", path, exc_info=True)
+        return None
+    if not isinstance(data, dict) or data.get('version') != VERSION:
+        return None
+    return data
@@ -22,3 +22,6 @@ LOW_PRIORITY = 2
 
 # HTTP request timeout in seconds
 TIMEOUT = 30
+
+# Maximum number of results the GitHub Search API returns for a query
+SEARCH_RESULT_LIMIT = 1000
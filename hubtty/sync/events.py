@@ -20,31 +20,21 @@ synchronization.
 """
 
 from dataclasses import dataclass, field
-from typing import Set, TYPE_CHECKING
+from typing import Optional, Set
 
-if TYPE_CHECKING:
-    from hubtty.db import PullRequest, Session
+# Parts of a pull request which an event may report as changed; each
+# has a matching ``<section>_changed`` flag on pull request events.
+SECTIONS = ('details', 'state', 'held', 'review_flag',
+            'commits', 'messages', 'checks', 'labels')
 
 
 class UpdateEvent:
     """Base class for sync update events."""
 
-    def updateRelatedPullRequests(self, session: 'Session', pr: 'PullRequest') -> None:
-        """Update the related_pr_keys set with PRs related to this one.
-
-        Args:
-            session: Database session.
-            pr: The pull request to find related PRs for.
-        """
-        related_pr_keys: Set[int] = set()
-        related_pr_keys.add(pr.key)
-        for commit in pr.commits:
-            parent = pr.getCommitBySha(commit.parent)
-            if parent:
-                related_pr_keys.add(parent.pull_request.key)
-            for child in session.getCommitsByParent(commit.commit):
-                related_pr_keys.add(child.pull_request.key)
-        self.related_pr_keys = related_pr_keys
+    def changedSections(self) -> Set[str]:
+        """Return the :data:`SECTIONS` this event reports as changed."""
+        return {section for section in SECTIONS
+                if getattr(self, section + '_changed', False)}
 
 
 @dataclass
@@ -63,10 +53,21 @@ class PullRequestAddedEvent(UpdateEvent):
 
     repository_key: int
     pr_key: int
-    related_pr_keys: Set[int] = field(default_factory=set)
     review_flag_changed: bool = True
     state_changed: bool = True
     held_changed: bool = False
+    details_changed: bool = True
+    commits_changed: bool = True
+    messages_changed: bool = True
+    checks_changed: bool = True
+    labels_changed: bool = True
+    new_message_keys: Set[int] = field(default_factory=set)
+    changed_checks: Set[str] = field(default_factory=set)
+    labels_added: Set[str] = field(default_factory=set)
+    labels_removed: Set[str] = field(default_factory=set)
+    new_head_sha: Optional[str] = None
+    old_state: Optional[str] = None
+    new_state: Optional[str] = None
 
     def __repr__(self) -> str:
         return (
@@ -77,14 +78,37 @@ class PullRequestAddedEvent(UpdateEvent):
 
 @dataclass
 class PullRequestUpdatedEvent(UpdateEvent):
-    """Event emitted when an existing pull request is updated."""
+    """Event emitted when an existing pull request is updated.
+
+    The ``*_changed`` flags tell which parts of the pull request may
+    have changed (``details`` being its own fields, such as the title
+    or size).  Those for the pull request's children default to True
+    so that an event which does not say assumes that everything did.
+
+    Where known, the change set gives details: the keys of new
+    messages, the names of created, modified or deleted checks, the
+    names of added and removed labels, the new head commit and the
+    state transition.  An empty change set means nothing is known,
+    not that nothing changed.
+    """
 
     repository_key: int
     pr_key: int
-    related_pr_keys: Set[int] = field(default_factory=set)
     review_flag_changed: bool = False
     state_changed: bool = False
     held_changed: bool = False
+    details_changed: bool = True
+    commits_changed: bool = True
+    messages_changed: bool = True
+    checks_changed: bool = True
+    labels_changed: bool = True
+    new_message_keys: Set[int] = field(default_factory=set)
+    changed_checks: Set[str] = field(default_factory=set)
+    labels_added: Set[str] = field(default_factory=set)
+    labels_removed: Set[str] = field(default_factory=set)
+    new_head_sha: Optional[str] = None
+    old_state: Optional[str] = None
+    new_state: Optional[str] = None
 
     def __repr__(self) -> str:
         return (
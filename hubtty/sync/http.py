@@ -15,16 +15,22 @@
 
 """HTTP client for GitHub API communication."""
 
+import collections
+import concurrent.futures
+import itertools
 import json
 import logging
 import re
 import time
 from collections import namedtuple
-from typing import Any, Callable, Dict, Optional, TYPE_CHECKING
+from typing import (Any, Callable, Dict, Iterator, List, Optional, Set,
+                    TYPE_CHECKING)
 
 import requests
 
-from .constants import TIMEOUT
+from hubtty import metrics
+from . import transport
+from .constants import SEARCH_RESULT_LIMIT, TIMEOUT
 from .exceptions import OfflineError, RestrictedError, RateLimitError
 
 if TYPE_CHECKING:
@@ -32,6 +38,9 @@ if TYPE_CHECKING:
 
 SearchResult = namedtuple('SearchResult', ['items', 'total_count'])
 
+# The page number in a GitHub pagination link.
+_page_re = re.compile(r'(?<=[?&])page=\d+')
+
 
 class HTTPClient:
     """Handles all HTTP communication with the GitHub API.
@@ -51,11 +60,17 @@ class HTTPClient:
         self.app = app
         self.user_agent = user_agent
         self.github_api_version = github_api_version
-        self.session = requests.Session()
+        # Requests sent and connections opened, per host
+        self.connection_stats = transport.ConnectionStats()
+        self.session = transport.make_session(app.config, self.connection_stats)
         self.session.headers.update({'Authorization': 'token ' + app.config.token})
         self.log = logging.getLogger('hubtty.sync')
         # ETag cache: path -> (etag_value, cached_response)
         self._etag_cache: Dict[str, tuple] = {}
+        # Paths whose last conditional request got 304 Not Modified
+        self._not_modified: Set[str] = set()
+        # Number of pages fetched at once once the last page is known
+        self.pagination_parallelism = app.config.pagination_parallelism
 
     def url(self, path: str) -> str:
         """Convert a path to a full URL.
@@ -258,23 +273,138 @@ class HTTPClient:
         )
         time.sleep(sleep_time)
 
-    def get(
+    def _fetch(self, url: str, headers: Dict[str, str]) -> requests.Response:
+        """GET *url*, waiting out any rate limit, and return the response.
+
+        Args:
+            url: The URL to request.
+            headers: Headers to send.
+
+        Returns:
+            The first response which is not rate limited.
+        """
+        while True:
+            self.log.debug('GET: %s', url)
+            r = self.session.get(url, timeout=TIMEOUT, headers=headers)
+            metrics.get_metrics().request('GET', url, r.status_code,
+                                          len(r.content))
+
+            # CRITICAL: Check rate limits BEFORE calling response_callback
+            # This allows us to handle rate limit responses before they become exceptions
+            if not self._should_handle_rate_limit(r):
+                return r
+            self._wait_for_rate_limit(r, url)
+
+    @staticmethod
+    def _page_urls(response: requests.Response) -> Optional[List[str]]:
+        """Return the URLs of all the pages after *response*.
+
+        GitHub numbers the pages of most listings, and the ``next`` and
+        ``last`` links then only differ by their ``page`` parameter.
+
+        Args:
+            response: A page of a paginated listing.
+
+        Returns:
+            The URLs of the following pages in order, or None if they
+            cannot be derived from the links of *response*.
+        """
+        next_url = response.links.get('next', {}).get('url')
+        last_url = response.links.get('last', {}).get('url')
+        if not next_url or not last_url:
+            return None
+        next_page = _page_re.search(next_url)
+        last_page = _page_re.search(last_url)
+        if (next_page is None or last_page is None or
+                _page_re.sub('page=', next_url) !=
+                _page_re.sub('page=', last_url)):
+            return None
+        first = int(next_page.group(0)[len('page='):])
+        last = int(last_page.group(0)[len('page='):])
+        return [_page_re.sub('page=%d' % page, next_url)
+                for page in range(first, last + 1)]
+
+    def _prefetch(
+        self, urls: List[str], headers: Dict[str, str]
+    ) -> Iterator[requests.Response]:
+        """Yield the responses for *urls* in order, fetching ahead.
+
+        Up to ``pagination_parallelism`` requests are in flight while
+        the caller processes the current page.  Requests which have not
+        started are cancelled when the caller stops iterating.
+        """
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.pagination_parallelism,
+            thread_name_prefix='hubtty-pages')
+        urls_iter = iter(urls)
+        pending = collections.deque(
+            executor.submit(self._fetch, url, headers)
+            for url in itertools.islice(urls_iter, self.pagination_parallelism))
+        try:
+            while pending:
+                r = pending.popleft().result()
+                for url in itertools.islice(urls_iter, 1):
+                    pending.append(executor.submit(self._fetch, url, headers))
+                yield r
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _responses(
+        self, first: requests.Response, headers: Dict[str, str]
+    ) -> Iterator[requests.Response]:
+        """Yield *first* and then the responses for the following pages.
+
+        Once *first* reveals the last page, the remaining pages are
+        fetched concurrently (see :meth:`_prefetch`), provided the rate
+        limit allows for all of them; otherwise ``next`` links are
+        followed one page at a time.
+
+        Args:
+            first: The response for the first page.
+            headers: Headers to send for the following pages.
+        """
+        yield first
+        r = first
+        urls = self._page_urls(first)
+        if urls and len(urls) > 1 and self.pagination_parallelism > 1:
+            remaining = int(first.headers.get('X-RateLimit-Remaining',
+                                              len(urls)))
+            if remaining >= len(urls):
+                for r in self._prefetch(urls, headers):
+                    yield r
+        # The listing may have grown since the last page was computed.
+        while 'next' in r.links:
+            r = self._fetch(r.links['next']['url'], headers)
+            yield r
+
+    def iter_pages(
         self,
         path: str,
         headers: Optional[Dict[str, str]] = None,
         response_callback: Optional[Callable[[requests.Response], None]] = None,
         use_etag: bool = False,
-    ) -> Any:
-        """Perform a GET request with automatic pagination.
+    ) -> Iterator[Any]:
+        """Perform a GET request, yielding each page of the result.
+
+        Pages are requested as the caller asks for them, so a caller
+        which has seen enough can stop iterating and the remaining pages
+        are not fetched.  Once the first page reveals the last one, up
+        to ``pagination_parallelism`` of the following pages are fetched
+        ahead, while the caller processes the current one; they are
+        still yielded in order.  Search results and check run listings are
+        unwrapped to the list of items they contain.
 
         When *use_etag* is ``True`` the client will:
 
         * Send ``If-None-Match`` with the cached ETag (if any) on the
           first page request.
-        * On ``304 Not Modified`` return the previously-cached full
-          response — this costs **zero** against the GitHub rate limit.
+        * On ``304 Not Modified`` yield the previously-cached full
+          response as a single page — this costs **zero** against the
+          GitHub rate limit.
         * On ``200 OK`` store the new ETag and full (assembled) response
-          in an in-memory cache for subsequent conditional requests.
+          in an in-memory cache for subsequent conditional requests,
+          once the last page has been fetched.  A result which was not
+          read to the end is not cached.
 
         Args:
             path: API path to request.
@@ -282,14 +412,12 @@ class HTTPClient:
             response_callback: Custom response validator (defaults to checkResponse).
             use_etag: Enable conditional requests via ETag / If-None-Match.
 
-        Returns:
-            Parsed JSON response, or list of results if paginated.
+        Yields:
+            The parsed JSON of each page.
         """
-        url = self.url(path)
-        ret = None
-        done = False
         is_first_page = True
         first_page_etag = None
+        assembled = None
 
         default_headers = {
             **self._base_headers(),
@@ -300,82 +428,112 @@ class HTTPClient:
         if not response_callback:
             response_callback = self.checkResponse
 
-        # Build per-page extra headers.  On the first page we may
-        # include If-None-Match; subsequent pages never do.
+        # On the first page we may include If-None-Match; subsequent
+        # pages never do.
         extra = dict(headers or {})
         cached_data = None
         if use_etag and path in self._etag_cache:
             cached_etag, cached_data = self._etag_cache[path]
             extra['If-None-Match'] = cached_etag
+        self._not_modified.discard(path)
+
+        first = self._fetch(self.url(path), {**default_headers, **extra})
+        if 'If-None-Match' in extra:
+            metrics.get_metrics().etag(first.status_code == 304)
+
+        # Handle 304 Not Modified — yield cached data immediately.
+        # 304 responses don't count against the GitHub rate limit.
+        if use_etag and first.status_code == 304:
+            self.log.debug('304 Not Modified (ETag cache hit): %s', path)
+            self._not_modified.add(path)
+            yield cached_data
+            return
 
-        while not done:
-            self.log.debug('GET: %s', url)
-
-            r = self.session.get(
-                url,
-                timeout=TIMEOUT,
-                headers={**default_headers, **extra},
-            )
-
-            # CRITICAL: Check rate limits BEFORE calling response_callback
-            # This allows us to handle rate limit responses before they become exceptions
-            if self._should_handle_rate_limit(r):
-                self._wait_for_rate_limit(r, url)
-                continue  # Retry the request
-
-            # Handle 304 Not Modified — return cached data immediately.
-            # 304 responses don't count against the GitHub rate limit.
-            if use_etag and r.status_code == 304 and is_first_page:
-                self.log.debug('304 Not Modified (ETag cache hit): %s', path)
-                return cached_data
-
+        for r in self._responses(first, {**default_headers, **(headers or {})}):
             # Now validate response (will raise exceptions for non-rate-limit errors)
             response_callback(r)
 
-            # Process successful response
-            if r.status_code == 200:
-                result = json.loads(r.text)
-                # Unwrap dict-wrapped paginated responses so that
-                # results from multiple pages are correctly merged
-                # into a single flat list.
-                if isinstance(result, dict) and 'items' in result:
-                    if is_first_page:
-                        self._last_search_total_count = result.get(
-                            'total_count')
-                    result = result.get('items', [])
-                elif isinstance(result, dict) and 'check_runs' in result:
-                    result = result.get('check_runs', [])
-                if isinstance(ret, list):
-                    ret.extend(result)
-                else:
-                    ret = result
+            first_page = is_first_page
+            is_first_page = False
+
+            if r.status_code != 200:
+                continue
+
+            # Let json detect the encoding of the raw body rather than
+            # decoding it to a str first.
+            result = json.loads(r.content)
+            # Unwrap dict-wrapped paginated responses so that
+            # results from multiple pages can be merged into a
+            # single flat list.
+            if isinstance(result, dict) and 'items' in result:
+                if first_page:
+                    self._last_search_total_count = result.get(
+                        'total_count')
+                result = result.get('items', [])
+            elif isinstance(result, dict) and 'check_runs' in result:
+                result = result.get('check_runs', [])
+            if self.log.isEnabledFor(logging.DEBUG):
                 if len(result) if isinstance(result, list) else result:
                     self.log.debug('200 OK, Received: %s', result)
                 else:
                     self.log.debug('200 OK, No body.')
 
+            if use_etag:
                 # Capture ETag from first page
-                if use_etag and is_first_page:
+                if first_page:
                     first_page_etag = r.headers.get('ETag')
+                if isinstance(assembled, list):
+                    assembled.extend(result)
+                else:
+                    assembled = list(result) if isinstance(result, list) else result
 
-            # After the first page, strip If-None-Match so that
-            # subsequent pages are unconditional fetches.
-            if is_first_page:
-                is_first_page = False
-                extra = dict(headers or {})
-
-            # Check for pagination
-            if 'next' in r.links.keys():
-                url = r.links['next']['url']
-            else:
-                done = True
+            yield result
 
         # Store the fully-assembled result in the ETag cache.
         if use_etag and first_page_etag is not None:
-            self._etag_cache[path] = (first_page_etag, ret)
+            self._etag_cache[path] = (first_page_etag, assembled)
+
+    def get(
+        self,
+        path: str,
+        headers: Optional[Dict[str, str]] = None,
+        response_callback: Optional[Callable[[requests.Response], None]] = None,
+        use_etag: bool = False,
+    ) -> Any:
+        """Perform a GET request with automatic pagination.
 
+        All pages are fetched and merged; see :meth:`iter_pages` for the
+        handling of *use_etag*.
+
+        Args:
+            path: API path to request.
+            headers: Additional headers to include.
+            response_callback: Custom response validator (defaults to checkResponse).
+            use_etag: Enable conditional requests via ETag / If-None-Match.
+
+        Returns:
+            Parsed JSON response, or list of results if paginated.
+        """
+        ret = None
+        for result in self.iter_pages(path, headers, response_callback,
+                                      use_etag):
+            if isinstance(ret, list):
+                ret.extend(result)
+            else:
+                ret = result
         return ret
 
+    def wasNotModified(self, path: str) -> bool:
+        """Return whether the last GET of *path* was answered from the ETag cache.
+
+        Args:
+            path: API path previously requested with ``use_etag=True``.
+
+        Returns:
+            True if the server replied ``304 Not Modified``.
+        """
+        return path in self._not_modified
+
     def _mutating_request(
         self,
         method: str,
@@ -422,6 +580,8 @@ class HTTPClient:
                 timeout=TIMEOUT,
                 headers={**default_headers, **(headers or {})}
             )
+            metrics.get_metrics().request(method, url, r.status_code,
+                                          len(r.content))
 
             # Check rate limits before validation
             if self._should_handle_rate_limit(r):
@@ -523,11 +683,13 @@ class HTTPClient:
         """
         self._mutating_request('delete', path, data, headers, response_callback)
 
-    def query(self, query: str) -> SearchResult:
+    def query(self, query: str, stop_if_truncated: bool = False) -> SearchResult:
         """Execute a GitHub search query.
 
         Args:
             query: Search query string.
+            stop_if_truncated: Stop after the first page if the total
+                count shows that the results will be truncated anyway.
 
         Returns:
             SearchResult with *items* (list) and *total_count* (int or None).
@@ -537,5 +699,11 @@ class HTTPClient:
         self._last_search_total_count = None
         q = f'search/issues?per_page=100&q={query}'
         self.log.debug('Query: %s', q)
-        items = self.get(q)
+        items = []
+        for page in self.iter_pages(q):
+            items.extend(page)
+            if (stop_if_truncated
+                    and self._last_search_total_count is not None
+                    and self._last_search_total_count > SEARCH_RESULT_LIMIT):
+                break
         return SearchResult(items, self._last_search_total_count)
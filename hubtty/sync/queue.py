@@ -19,7 +19,7 @@ import time
 
 from collections import OrderedDict, deque
 from threading import Condition
-from typing import Any, List, Type, TypeVar
+from typing import Any, Dict, List, Type, TypeVar
 
 T = TypeVar('T')
 
@@ -150,6 +150,11 @@ class MultiQueue:
             queued = {pri: list(q) for pri, q in self.queues.items()}
         return running, queued
 
+    def depths(self) -> Dict[int, int]:
+        """Return the number of queued items at each priority level."""
+        with self.condition:
+            return {pri: len(q) for pri, q in self.queues.items()}
+
     def complete(self, item: T) -> None:
         """Mark an item as complete, removing it from the incomplete list.
 
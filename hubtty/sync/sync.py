@@ -15,6 +15,7 @@
 
 """Main Sync orchestrator class."""
 
+import collections
 import os
 import queue
 import threading
@@ -25,6 +26,8 @@ import requests
 import requests.utils
 
 import hubtty.version
+from hubtty import metrics
+from hubtty import sampling
 from .constants import HIGH_PRIORITY, NORMAL_PRIORITY, LOW_PRIORITY
 from .queue import MultiQueue
 from .http import HTTPClient
@@ -76,6 +79,8 @@ class Sync(HTTPClient):
         self.account_id: Optional[int] = None
         self.queue = MultiQueue([HIGH_PRIORITY, NORMAL_PRIORITY, LOW_PRIORITY])
         self.result_queue: queue.Queue = queue.Queue()
+        # Running totals of sync work, shown in the sync tasks dialog
+        self.counters: collections.Counter = collections.Counter()
 
         # Submit initial account sync task
         self.submitTask(SyncOwnAccountTask(priority=HIGH_PRIORITY))
@@ -99,7 +104,8 @@ class Sync(HTTPClient):
 
     def _start_periodic_sync(self) -> None:
         """Start the periodic sync thread."""
-        self.periodic_thread = threading.Thread(target=self.periodicSync)
+        self.periodic_thread = threading.Thread(target=self.periodicSync,
+                                                name='periodic sync')
         self.periodic_thread.daemon = True
         self.periodic_thread.start()
 
@@ -127,6 +133,7 @@ class Sync(HTTPClient):
         if not self.offline:
             if not self.queue.put(task, task.priority):
                 task.complete(False)
+            metrics.get_metrics().observeQueue(self.queue.depths())
         else:
             task.complete(False)
 
@@ -154,7 +161,10 @@ class Sync(HTTPClient):
             task = self.queue.get()
         self.log.debug('Run: %s', task)
         try:
-            task.run(self)
+            name = type(task).__name__
+            with metrics.get_metrics().timed('task', name), \
+                    sampling.activity(name):
+                task.run(self)
             task.complete(True)
             self.queue.complete(task)
             if task.followup:
@@ -15,8 +15,9 @@
 
 """Shared helper functions for CI check synchronization."""
 
+import datetime
 import logging
-from typing import Any, Dict, List, TYPE_CHECKING
+from typing import Any, Dict, List, Set, TYPE_CHECKING
 
 import dateutil.parser
 
@@ -26,6 +27,17 @@ if TYPE_CHECKING:
 log = logging.getLogger(__name__)
 
 
+def value_differs(old: Any, new: Any) -> bool:
+    """Return whether a stored value differs from a remote one.
+
+    Timestamps are stored without a timezone (in UTC), so they are
+    compared with the timezone of the remote value dropped.
+    """
+    if isinstance(old, datetime.datetime) and isinstance(new, datetime.datetime):
+        return old.replace(tzinfo=None) != new.replace(tzinfo=None)
+    return old != new
+
+
 def check_result_from_check_run(remote_check: Dict[str, Any]) -> Dict[str, Any]:
     """Convert a GitHub check run to internal format.
 
@@ -90,20 +102,26 @@ def check_result_from_status(remote_check: Dict[str, Any]) -> Dict[str, Any]:
     return check
 
 
-def update_checks(session, commit, remote_checks_data: List[Dict[str, Any]]) -> None:
+def update_checks(session, commit,
+                  remote_checks_data: List[Dict[str, Any]]) -> Set[str]:
     """Update checks for a commit.
 
     Args:
         session: Database session.
         commit: The commit to update checks for.
         remote_checks_data: List of check data from GitHub.
+
+    Returns:
+        The names of the checks which were created, deleted or modified.
     """
+    changed = set()
     # Delete outdated checks
     remote_check_names = [c['name'] for c in remote_checks_data]
     for check in commit.checks:
         if check.name not in remote_check_names:
             log.info("Deleted check %s", check.key)
             session.delete(check)
+            changed.add(check.name)
 
     local_checks = {c.name: c for c in commit.checks}
     for check_data in remote_checks_data:
@@ -119,17 +137,40 @@ def update_checks(session, commit, remote_checks_data: List[Dict[str, Any]]) ->
                 check_data['state'], created, created
             )
             local_checks[check_data['name']] = check
-        check.updated = dateutil.parser.parse(check_data['updated'])
-        check.state = check_data['state']
-        check.url = check_data['url']
-        check.message = check_data['message']
-
+            changed.add(check.name)
+        values = dict(
+            updated=dateutil.parser.parse(check_data['updated']),
+            state=check_data['state'],
+            url=check_data['url'],
+            message=check_data['message'],
+        )
         started = check_data.get('started')
         if started:
-            check.started = dateutil.parser.parse(check_data['started'])
+            values['started'] = dateutil.parser.parse(started)
         finished = check_data.get('finished')
         if finished:
-            check.finished = dateutil.parser.parse(check_data['finished'])
+            values['finished'] = dateutil.parser.parse(finished)
+        for name, value in values.items():
+            if value_differs(getattr(check, name), value):
+                setattr(check, name, value)
+                changed.add(check.name)
+    return changed
+
+
+def check_paths(repository_name: str, commit_sha: str) -> List[str]:
+    """Return the API paths fetch_checks() requests for a commit.
+
+    Args:
+        repository_name: Full repository name (e.g. 'owner/repo').
+        commit_sha: The commit SHA to fetch checks for.
+
+    Returns:
+        The commit status path followed by the check runs path.
+    """
+    return [
+        f'repos/{repository_name}/commits/{commit_sha}/status',
+        f'repos/{repository_name}/commits/{commit_sha}/check-runs?per_page=100',
+    ]
 
 
 def fetch_checks(sync: 'Sync', repository_name: str,
@@ -156,20 +197,15 @@ def fetch_checks(sync: 'Sync', repository_name: str,
     # when both exist, since check-runs carry richer data
     # (started/finished timestamps, etc.).
     checks_by_name: Dict[str, Dict[str, Any]] = {}
+    status_path, check_runs_path = check_paths(repository_name, commit_sha)
 
-    remote_commit_status = sync.get(
-        f'repos/{repository_name}/commits/{commit_sha}/status',
-        use_etag=use_etag,
-    )
+    remote_commit_status = sync.get(status_path, use_etag=use_etag)
     if remote_commit_status is not None:
         for check in remote_commit_status['statuses']:
             result = check_result_from_status(check)
             checks_by_name[result['name']] = result
 
-    remote_commit_check_runs = sync.get(
-        f'repos/{repository_name}/commits/{commit_sha}/check-runs?per_page=100',
-        use_etag=use_etag,
-    )
+    remote_commit_check_runs = sync.get(check_runs_path, use_etag=use_etag)
     if remote_commit_check_runs is not None:
         for check in remote_commit_check_runs:
             result = check_result_from_check_run(check)
@@ -27,9 +27,11 @@ from ..task import Task
 from ..constants import LOW_PRIORITY
 from ..events import RepositoryAddedEvent, PullRequestAddedEvent, PullRequestUpdatedEvent
 from .check_helpers import (
+    check_paths,
     fetch_checks,
     has_pending_checks,
     update_checks,
+    value_differs,
 )
 
 if TYPE_CHECKING:
@@ -100,19 +102,21 @@ class SyncPullRequestTask(Task):
         from .repository import SyncRepositoryBranchesTask, SyncRepositoryLabelsTask
 
         app = sync.app
-        remote_pr = sync.get(f'repos/{self.pr_id}')
-        remote_commits = sync.get(f'repos/{self.pr_id}/commits?per_page=100',
-                                   use_etag=True)
-        # Limit to 50, as github seems to struggle sending more comments
-        # https://github.com/hubtty/hubtty/issues/59
-        remote_pr_comments = sync.get(f'repos/{self.pr_id}/comments?per_page=50',
-                                      use_etag=True)
-        remote_pr_reviews = sync.get(f'repos/{self.pr_id}/reviews?per_page=100',
-                                     use_etag=True)
-        remote_issue_comments = sync.get(
+        sync.counters['pull_request_syncs'] += 1
+        # Conditional requests, which tell whether anything changed
+        # since the last sync.
+        paths = [
+            f'repos/{self.pr_id}',
+            f'repos/{self.pr_id}/commits?per_page=100',
+            # Limit to 50, as github seems to struggle sending more comments
+            # https://github.com/hubtty/hubtty/issues/59
+            f'repos/{self.pr_id}/comments?per_page=50',
+            f'repos/{self.pr_id}/reviews?per_page=100',
             f'repos/{self.pr_id}/comments?per_page=100'.replace('/pulls/', '/issues/'),
-            use_etag=True,
-        )
+        ]
+        (remote_pr, remote_commits, remote_pr_comments, remote_pr_reviews,
+         remote_issue_comments) = [sync.get(path, use_etag=True)
+                                   for path in paths]
 
         repository_name = remote_pr['base']['repo']['full_name']
 
@@ -120,17 +124,22 @@ class SyncPullRequestTask(Task):
         # info.  Git commits are immutable so once we have the file
         # list for a SHA we never need to re-fetch it.
         known_commit_shas = set()
+        local_updated = None
         with app.db.getSession() as session:
             pr_local = session.getPullRequestByPullRequestID(self.pr_id)
             if pr_local:
                 for c in pr_local.commits:
                     if c.files:
                         known_commit_shas.add(c.sha)
+                if not pr_local.outdated:
+                    local_updated = pr_local.updated
 
         # Get commit details (skip commits we already have files for)
+        unknown_commits = False
         for commit in remote_commits:
             if commit['sha'] in known_commit_shas:
                 continue
+            unknown_commits = True
             remote_commit_details = sync.get(
                 f'repos/{repository_name}/commits/{commit["sha"]}',
                 use_etag=True,
@@ -143,6 +152,23 @@ class SyncPullRequestTask(Task):
             last_commit['_hubtty_checks'] = fetch_checks(
                 sync, repository_name, last_commit['sha']
             )
+            paths += check_paths(repository_name, last_commit['sha'])
+
+        # If GitHub reports nothing new and the local copy is complete
+        # and up to date, there is nothing to write.
+        if (local_updated is not None
+                and not self.force_fetch
+                and not unknown_commits
+                and not value_differs(
+                    local_updated,
+                    dateutil.parser.parse(remote_pr['updated_at']))
+                and all(sync.wasNotModified(path) for path in paths)):
+            sync.counters['pull_request_syncs_skipped'] += 1
+            self.log.debug("Pull request %s is unchanged, skipping",
+                           self.pr_id)
+            self._recheckPendingChecks(sync, remote_pr['state'],
+                                       repository_name, remote_commits)
+            return
 
         fetches = defaultdict(list)
         with app.db.getSession() as session:
@@ -204,30 +230,47 @@ class SyncPullRequestTask(Task):
                 )
                 result = PullRequestAddedEvent(pr.repository.key, pr.key)
             else:
-                result = PullRequestUpdatedEvent(pr.repository.key, pr.key)
-            app.repository_cache.clear(pr.repository)
-            self.results.append(result)
-            pr.author = account
+                # Start with an empty change set, filled in as the
+                # local copy is updated.
+                result = PullRequestUpdatedEvent(
+                    pr.repository.key, pr.key, details_changed=False,
+                    commits_changed=False, messages_changed=False,
+                    checks_changed=False, labels_changed=False)
             if pr.state != remote_pr['state']:
+                result.old_state = pr.state
+                result.new_state = remote_pr['state']
                 pr.state = remote_pr['state']
                 result.state_changed = True
-            pr.title = remote_pr['title']
-            pr.body = (remote_pr.get('body', '') or '').replace('\r', '')
-            pr.updated = dateutil.parser.parse(remote_pr['updated_at'])
-            pr.additions = remote_pr['additions']
-            pr.deletions = remote_pr['deletions']
-            pr.merged = remote_pr['merged']
-            pr.mergeable = remote_pr.get('mergeable') or False
-            pr.draft = remote_pr['draft']
+            values = dict(
+                author=account,
+                title=remote_pr['title'],
+                body=(remote_pr.get('body', '') or '').replace('\r', ''),
+                updated=dateutil.parser.parse(remote_pr['updated_at']),
+                additions=remote_pr['additions'],
+                deletions=remote_pr['deletions'],
+                merged=remote_pr['merged'],
+                mergeable=remote_pr.get('mergeable') or False,
+                draft=remote_pr['draft'],
+            )
+            for name, value in values.items():
+                if value_differs(getattr(pr, name), value):
+                    setattr(pr, name, value)
+                    result.details_changed = True
 
             for label in remote_pr['labels']:
                 l = session.getLabel(label['id'])
                 if l and l not in pr.labels:
                     pr.addLabel(l)
+                    result.labels_changed = True
+                    result.labels_added.add(l.name)
             remote_label_ids = [label['id'] for label in remote_pr['labels']]
             for label in pr.labels:
                 if label.id not in remote_label_ids:
                     pr.removeLabel(label)
+                    result.labels_changed = True
+                    result.labels_removed.add(label.name)
+
+            old_head_sha = pr.commits[-1].sha if pr.commits else None
 
             repo = gitrepo.get_repo(pr.repository.name, app.config)
             for remote_commit in remote_commits:
@@ -248,6 +291,7 @@ class SyncPullRequestTask(Task):
                         remote_commit['sha'],
                         parent_sha
                     )
+                    result.commits_changed = True
                     self.log.info(
                         "Created new commit %s for pull request %s in local DB.",
                         commit.key, self.pr_id
@@ -269,12 +313,16 @@ class SyncPullRequestTask(Task):
                             file.get('previous_filename'),
                             inserted, deleted,
                         )
+                        result.commits_changed = True
 
                 # Commit checks
                 if '_hubtty_checks' in remote_commit:
-                    update_checks(
+                    changed_checks = update_checks(
                         session, commit, remote_commit['_hubtty_checks']
                     )
+                    if changed_checks:
+                        result.checks_changed = True
+                        result.changed_checks |= changed_checks
 
             # Commit reviews
             remote_pr_reviews.extend(remote_issue_comments)
@@ -311,14 +359,20 @@ class SyncPullRequestTask(Task):
                         associated_commit_id, remote_review['id'], account, created,
                         (remote_review.get('body', '') or '').replace('\r', '')
                     )
+                    result.messages_changed = True
+                    result.new_message_keys.add(message.key)
                     self.log.info(
                         "Created new review message %s for pull request %s in local DB.",
                         message.key, pr.pr_id
                     )
                 else:
+                    body = (remote_review.get('body', '') or '').replace('\r', '')
                     if message.author != account:
                         message.author = account
-                    message.body = (remote_review.get('body', '') or '').replace('\r', '')
+                        result.messages_changed = True
+                    if message.message != body:
+                        message.message = body
+                        result.messages_changed = True
 
                 review_state = remote_review.get('state')
                 if review_state and remote_review.get('commit_id'):
@@ -352,12 +406,14 @@ class SyncPullRequestTask(Task):
 
                     if approval:
                         # Only update approval if it hasn't been changed locally
-                        if not approval.draft:
+                        if not approval.draft and approval.state != review_state:
                             approval.state = review_state
+                            result.messages_changed = True
                     else:
                         pr.createApproval(
                             account, review_state, remote_review.get('commit_id')
                         )
+                        result.messages_changed = True
                         self.log.info(
                             "Created new approval for %s from %s commit %s.",
                             pr.pr_id, account.username, remote_review.get('commit_id')
@@ -409,20 +465,20 @@ class SyncPullRequestTask(Task):
                         "Created new comment %s for pull request %s in local DB.",
                         comment.key, pr.pr_id
                     )
+                    result.messages_changed = True
                 else:
-                    if comment.author != account:
-                        comment.author = account
-                    if comment.updated != updated:
-                        comment.updated = updated
-                    if comment.commit_id != remote_comment.get('commit_id'):
-                        comment.commit_id = remote_comment.get('commit_id')
-                    if comment.line != remote_comment.get('line'):
-                        comment.line = remote_comment.get('line')
-                    if comment.file_key != file_id:
-                        comment.file_key = file_id
-                    comment.body = (
-                        remote_comment.get('body', '') or ''
-                    ).replace('\r', '')
+                    values = dict(
+                        author=account,
+                        updated=updated,
+                        commit_id=remote_comment.get('commit_id'),
+                        line=remote_comment.get('line'),
+                        file_key=file_id,
+                        message=(remote_comment.get('body', '') or '').replace('\r', ''),
+                    )
+                    for name, value in values.items():
+                        if value_differs(getattr(comment, name), value):
+                            setattr(comment, name, value)
+                            result.messages_changed = True
 
             # Delete commits that no longer belong to the pull request
             # Do it at the end so that we don't inadvertently delete
@@ -431,33 +487,46 @@ class SyncPullRequestTask(Task):
             for commit in pr.commits:
                 if commit.sha not in remote_commits_sha:
                     session.delete(commit)
+                    result.commits_changed = True
+            if remote_commits and remote_commits[-1]['sha'] != old_head_sha:
+                result.new_head_sha = remote_commits[-1]['sha']
 
             pr.outdated = False
 
-            # If any checks are still pending, or if no checks have
-            # been reported yet (CI may not have started), schedule a
-            # lightweight re-check so we pick up CI results without
-            # waiting for another full PR sync.
-            if len(remote_commits) > 0 and pr.state == 'open':
-                checks_data = last_commit.get('_hubtty_checks', [])
-                if (not checks_data
-                        or has_pending_checks(
-                            checks_data,
-                            frozenset(sync.app.config.ignore_pending_checks))):
-                    self.log.info(
-                        "Pull request %s has pending/no checks, scheduling re-check",
-                        self.pr_id
-                    )
-                    sync.submitTask(SyncPullRequestChecksTask(
-                        pr.pr_id,
-                        pr.repository.name,
-                        priority=LOW_PRIORITY,
-                    ))
+            # A sync which changed nothing needs no event.
+            if result.changedSections():
+                app.repository_cache.clear(pr.repository)
+                self.results.append(result)
+
+            self._recheckPendingChecks(sync, pr.state, pr.repository.name,
+                                       remote_commits)
 
         for url, refs in fetches.items():
             self.log.debug("Fetching from %s with refs %s", url, refs)
             repo.fetch(url, refs)
 
+    def _recheckPendingChecks(self, sync, state, repository_name,
+                              remote_commits):
+        # If any checks are still pending, or if no checks have
+        # been reported yet (CI may not have started), schedule a
+        # lightweight re-check so we pick up CI results without
+        # waiting for another full PR sync.
+        if len(remote_commits) > 0 and state == 'open':
+            checks_data = remote_commits[-1].get('_hubtty_checks', [])
+            if (not checks_data
+                    or has_pending_checks(
+                        checks_data,
+                        frozenset(sync.app.config.ignore_pending_checks))):
+                self.log.info(
+                    "Pull request %s has pending/no checks, scheduling re-check",
+                    self.pr_id
+                )
+                sync.submitTask(SyncPullRequestChecksTask(
+                    self.pr_id,
+                    repository_name,
+                    priority=LOW_PRIORITY,
+                ))
+
 
 @dataclass
 class SyncPullRequestChecksTask(Task):
@@ -513,10 +582,14 @@ class SyncPullRequestChecksTask(Task):
             if pr is None or not pr.commits:
                 return
             last_commit = pr.commits[-1]
-            update_checks(session, last_commit, checks_data)
+            changed_checks = update_checks(session, last_commit, checks_data)
 
         # Notify the UI
-        self.results.append(PullRequestUpdatedEvent(repository_key, pr_key))
+        if changed_checks:
+            self.results.append(PullRequestUpdatedEvent(
+                repository_key, pr_key, details_changed=False,
+                commits_changed=False, messages_changed=False,
+                labels_changed=False, changed_checks=changed_checks))
 
         # Re-submit if checks are still pending or not yet reported
         if (pr_state == 'open'
@@ -264,7 +264,9 @@ class SyncRepositoryTask(Task):
             base_query = query
             for repository_name in repositories:
                 query += f' repo:{repository_name}'
-            result = sync.query(query)
+            # Once the first page shows that the batched query will be
+            # truncated, the remaining pages are not worth fetching.
+            result = sync.query(query, stop_if_truncated=len(repositories) > 1)
             pull_requests = result.items
 
             if (result.total_count is not None
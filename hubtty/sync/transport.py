@@ -0,0 +1,221 @@
+# Copyright The Hubtty Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""HTTP sessions used to talk to the GitHub API.
+
+Sync sends many small requests to a handful of hosts, so the cost of
+opening connections (and of the TLS handshake in particular) adds up.
+By default a requests Session is used whose connection pool is sized
+from the configuration.  With the optional httpx package installed,
+HTTP/2 can be used instead, which multiplexes concurrent requests over
+a single connection per host.  Either way, connections are kept in the
+pool for reuse until they have been idle for ``http-keepalive``
+seconds.
+
+Both count the requests sent and the connections opened per host; the
+counts are shown in the sync tasks dialog.
+"""
+
+import collections
+import logging
+import threading
+import time
+import urllib.parse
+from typing import Any, Dict, Optional
+
+import requests
+import requests.adapters
+
+log = logging.getLogger('hubtty.sync')
+
+
+class ConnectionStats:
+    """Thread-safe per-host counts of requests and new connections."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, collections.Counter] = {}
+
+    def add(self, host: Optional[str], name: str, count: int = 1) -> None:
+        """Add *count* to the *name* counter of *host*."""
+        with self._lock:
+            self._hosts.setdefault(host or '', collections.Counter())[name] += count
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        """Return a copy of the counters, by host name."""
+        with self._lock:
+            return {host: dict(counter)
+                    for host, counter in sorted(self._hosts.items())}
+
+
+def _host(url: Any) -> Optional[str]:
+    return urllib.parse.urlsplit(str(url)).hostname
+
+
+def _pool_class(pool_class, stats: ConnectionStats, keepalive: int):
+    """Return a subclass of the urllib3 *pool_class* for hubtty.
+
+    Its connections count their (re)connections, and are closed once
+    they have been idle in the pool for more than *keepalive* seconds
+    (never if it is 0), to be reopened on their next use.
+    """
+    class CountingConnection(pool_class.ConnectionCls):
+        stats_host = None
+
+        def connect(self):
+            stats.add(self.stats_host or self.host, 'connections')
+            return super().connect()
+
+    class Pool(pool_class):
+        ConnectionCls = CountingConnection
+
+        def _new_conn(self):
+            conn = super()._new_conn()
+            conn.stats_host = self.host
+            return conn
+
+        def _get_conn(self, timeout=None):
+            conn = super()._get_conn(timeout)
+            idle_since = getattr(conn, 'idle_since', None)
+            if (keepalive and idle_since is not None and
+                time.monotonic() - idle_since > keepalive):
+                conn.close()
+            return conn
+
+        def _put_conn(self, conn):
+            if conn is not None:
+                conn.idle_since = time.monotonic()
+            super()._put_conn(conn)
+
+    Pool.__name__ = 'Hubtty' + pool_class.__name__
+    return Pool
+
+
+class PoolAdapter(requests.adapters.HTTPAdapter):
+    """An HTTPAdapter with tuned pooling that counts its connections.
+
+    *pool_maxsize* connections are kept open per host, for up to
+    *keepalive* seconds of inactivity.  This applies to connections
+    through a proxy as well.
+    """
+
+    def __init__(self, stats: ConnectionStats, pool_maxsize: int,
+                 keepalive: int) -> None:
+        # HTTPAdapter.__init__ creates the pool manager.
+        self.stats = stats
+        self.keepalive = keepalive
+        super().__init__(pool_maxsize=pool_maxsize)
+
+    def _setPoolClasses(self, manager):
+        if getattr(manager, 'hubtty_pools', False):
+            return
+        manager.pool_classes_by_scheme = {
+            scheme: _pool_class(pool_class, self.stats, self.keepalive)
+            for scheme, pool_class
+            in manager.pool_classes_by_scheme.items()}
+        manager.hubtty_pools = True
+
+    def init_poolmanager(self, connections, maxsize, block=False,
+                         **pool_kwargs):
+        super().init_poolmanager(connections, maxsize, block, **pool_kwargs)
+        self._setPoolClasses(self.poolmanager)
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        self._setPoolClasses(manager)
+        return manager
+
+    def send(self, request, **kwargs):
+        self.stats.add(_host(request.url), 'requests')
+        return super().send(request, **kwargs)
+
+
+class HTTP2Session:
+    """The subset of requests.Session used by hubtty, on top of httpx.
+
+    Responses are httpx responses, which offer the same ``status_code``,
+    ``headers``, ``links``, ``content`` and ``text`` attributes.
+    Transport errors are raised as their requests equivalents so that
+    sync handles them in the same way.  As with :class:`PoolAdapter`,
+    connections are closed after *keepalive* seconds of inactivity.
+    """
+
+    http_version = 'HTTP/2'
+
+    def __init__(self, stats: ConnectionStats, pool_maxsize: int,
+                 keepalive: int) -> None:
+        import httpx
+        self._httpx = httpx
+        self.stats = stats
+        self.client = httpx.Client(
+            http2=True,
+            limits=httpx.Limits(max_connections=pool_maxsize,
+                                max_keepalive_connections=pool_maxsize,
+                                keepalive_expiry=keepalive or None))
+        self.headers = self.client.headers
+
+    def request(self, method: str, url: str, data: Optional[bytes] = None,
+                timeout: Optional[float] = None,
+                headers: Optional[Dict[str, str]] = None) -> Any:
+        host = _host(url)
+        self.stats.add(host, 'requests')
+
+        def trace(event, info):
+            if event == 'connection.connect_tcp.complete':
+                self.stats.add(host, 'connections')
+
+        try:
+            return self.client.request(method, url, content=data,
+                                       timeout=timeout, headers=headers,
+                                       extensions={'trace': trace})
+        except self._httpx.TimeoutException as e:
+            raise requests.exceptions.ReadTimeout(str(e))
+        except self._httpx.TransportError as e:
+            raise requests.ConnectionError(str(e))
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request('PATCH', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+
+def make_session(config: Any, stats: ConnectionStats) -> Any:
+    """Return the HTTP session selected by *config*.
+
+    Falls back to HTTP/1.1 with a warning if HTTP/2 is requested but
+    httpx (with its http2 extra) is not installed.
+    """
+    if config.http2:
+        try:
+            return HTTP2Session(stats, config.http_pool_size,
+                                config.http_keepalive)
+        except ImportError:
+            log.warning("HTTP/2 requires the httpx package with HTTP/2 "
+                        "support (httpx[http2]); using HTTP/1.1")
+    session = requests.Session()
+    session.http_version = 'HTTP/1.1'
+    adapter = PoolAdapter(stats, config.http_pool_size, config.http_keepalive)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
@@ -14,12 +14,15 @@
 
 """Syntax highlighting for diff views using Pygments."""
 
+import bisect
 import functools
+import inspect
 import logging
+import threading
 
-from pygments import lex
+from pygments.lexer import ExtendedRegexLexer, RegexLexer
 from pygments.lexers import get_lexer_for_filename, TextLexer
-from pygments.token import Token
+from pygments.token import Error, Token, Whitespace
 
 log = logging.getLogger('hubtty.syntax')
 
@@ -94,7 +97,12 @@ _LIGHT_FG_ADJUST = {
 # Default maximum file size (bytes) to attempt highlighting.
 DEFAULT_MAX_FILE_SIZE = 512 * 1024
 
+# Approximate number of lines between the lexer state checkpoints kept
+# by LineHighlighter.
+CHECKPOINT_INTERVAL = 200
 
+
+@functools.lru_cache(maxsize=None)
 def _token_to_attr(token_type):
     """Map a Pygments token type to a palette attribute name.
 
@@ -110,6 +118,20 @@ def _token_to_attr(token_type):
     return None
 
 
+def get_lexer(filename):
+    """Return the Pygments lexer used for *filename*, or None."""
+    try:
+        # Keep leading and trailing blank lines so that line numbers
+        # match the file.
+        lexer = get_lexer_for_filename(filename, stripall=False,
+                                       stripnl=False)
+    except Exception:
+        return None
+    if isinstance(lexer, TextLexer):
+        return None
+    return lexer
+
+
 def highlight_file(filename, content, max_file_size=DEFAULT_MAX_FILE_SIZE):
     """Highlight *content* and return per-line urwid markup.
 
@@ -128,19 +150,22 @@ def highlight_file(filename, content, max_file_size=DEFAULT_MAX_FILE_SIZE):
 
     content = content.replace('\r\n', '\n').replace('\r', '\n')
 
-    try:
-        lexer = get_lexer_for_filename(filename, stripall=False)
-    except Exception:
+    lexer = get_lexer(filename)
+    if lexer is None:
         return {}
 
-    if isinstance(lexer, TextLexer):
-        return {}
+    return _lines_markup(lexer.get_tokens(content))
+
+
+def _lines_markup(tokens, current_line=1):
+    """Return per-line markup for ``(token_type, value)`` pairs.
 
+    The tokens start at the beginning of line *current_line*.
+    """
     lines = {}
-    current_line = 1
     current_markup = []
 
-    for token_type, value in lex(content, lexer):
+    for token_type, value in tokens:
         attr = _token_to_attr(token_type)
         parts = value.split('\n')
         for i, part in enumerate(parts):
@@ -166,6 +191,218 @@ def highlight_file(filename, content, max_file_size=DEFAULT_MAX_FILE_SIZE):
     return lines
 
 
+# ------------------------------------------------------------------
+# Incremental highlighting
+# ------------------------------------------------------------------
+
+def resumable(lexer):
+    """Whether *lexer* can resume lexing from a saved state.
+
+    That is the case for lexers driven by the RegexLexer state machine,
+    as long as they do not keep state of their own.
+    """
+    if not isinstance(lexer, RegexLexer) or lexer.filters:
+        return False
+    if isinstance(lexer, ExtendedRegexLexer):
+        return False
+    method = type(lexer).get_tokens_unprocessed
+    if method is RegexLexer.get_tokens_unprocessed:
+        return True
+    # Lexers that only post-process the tokens of RegexLexer accept
+    # the initial state stack.
+    return 'stack' in inspect.signature(method).parameters
+
+
+def _resume(lexer, text, pos, stack):
+    """Lex *text* from *pos* with the RegexLexer state *stack*.
+
+    Mirrors ``RegexLexer.get_tokens_unprocessed``, updating *stack* (a
+    list) in place.  In addition to ``(pos, token_type, value)``
+    tokens, ``(pos, None, None)`` is yielded whenever a match ends at
+    the start of a line: lexing can be resumed from there with a copy
+    of *stack*.
+    """
+    tokendefs = lexer._tokens
+    statetokens = tokendefs[stack[-1]]
+    while True:
+        if pos and text[pos - 1] == '\n':
+            yield pos, None, None
+        for rexmatch, action, new_state in statetokens:
+            m = rexmatch(text, pos)
+            if m:
+                if action is not None:
+                    if type(action) is type(Token):
+                        yield pos, action, m.group()
+                    else:
+                        yield from action(lexer, m)
+                pos = m.end()
+                if new_state is not None:
+                    if isinstance(new_state, tuple):
+                        for state in new_state:
+                            if state == '#pop':
+                                if len(stack) > 1:
+                                    stack.pop()
+                            elif state == '#push':
+                                stack.append(stack[-1])
+                            else:
+                                stack.append(state)
+                    elif isinstance(new_state, int):
+                        if abs(new_state) >= len(stack):
+                            del stack[1:]
+                        else:
+                            del stack[new_state:]
+                    elif new_state == '#push':
+                        stack.append(stack[-1])
+                    statetokens = tokendefs[stack[-1]]
+                break
+        else:
+            if pos >= len(text):
+                return
+            if text[pos] == '\n':
+                stack[:] = ['root']
+                statetokens = tokendefs['root']
+                yield pos, Whitespace, '\n'
+            else:
+                yield pos, Error, text[pos]
+            pos += 1
+
+
+def _until(tokens, end, offset=0):
+    """Yield ``(token_type, value)`` for the *tokens* before *end*."""
+    for pos, token_type, value in tokens:
+        if pos + offset >= end:
+            return
+        if token_type is not None:
+            yield token_type, value
+
+
+class LineHighlighter:
+    """Per-line markup of a file, highlighted as lines are requested.
+
+    Supports the lookups done on the mapping returned by
+    :func:`highlight_file` (``get``, ``in`` and indexing) but only
+    lexes the file as far as the lines asked for.  The lexer state is
+    saved at the first line start after every *interval* lines; the
+    markup of the lines between two such checkpoints is built when one
+    of them is first requested, resuming from the earlier checkpoint.
+
+    The lexer must be :func:`resumable`.  *on_finished*, if given, is
+    called with the highlighter once the checkpoints reach the end of
+    the text.
+    """
+
+    def __init__(self, lexer, content, interval=CHECKPOINT_INTERVAL,
+                 on_finished=None):
+        self.lexer = lexer
+        self.text = content.replace('\r\n', '\n').replace('\r', '\n')
+        self.interval = interval
+        # Lexers that post-process tokens are run themselves to build
+        # markup; checkpoints are found with _resume in either case.
+        self._wrapped = (type(lexer).get_tokens_unprocessed is not
+                         RegexLexer.get_tokens_unprocessed)
+        # Checkpoints: line number, offset of its start, state stack.
+        self._lines = [1]
+        self._offsets = [0]
+        self._stacks = [('root',)]
+        # Whether the checkpoints reach the end of the text.
+        self._finished = False
+        # Markup of the lines following each checkpoint.
+        self._blocks = {}
+        self._lock = threading.Lock()
+        self.on_finished = on_finished
+
+    def ready(self, lineno):
+        """Whether *lineno* can be highlighted without much lexing.
+
+        That is, without lexing more than about *interval* lines.
+        """
+        return self._finished or self._lines[-1] + self.interval > lineno
+
+    def prepare(self, lineno):
+        """Lex the text up to *lineno*, so that it becomes ready.
+
+        Returns the highlighter itself.
+        """
+        self._extend(lineno - self.interval)
+        return self
+
+    def _extend(self, lineno):
+        # Add checkpoints until one lies after lineno or the text ends.
+        # The lock is released after each one so that lookups of
+        # lines that are already covered are not held up.
+        while True:
+            with self._lock:
+                if self._finished or self._lines[-1] > lineno:
+                    return
+                self._addCheckpoint()
+                finished = self._finished
+            if finished and self.on_finished is not None:
+                self.on_finished(self)
+
+    def _addCheckpoint(self):
+        line = self._lines[-1]
+        pos = self._offsets[-1]
+        stack = list(self._stacks[-1])
+        target = line + self.interval
+        for token_pos, token_type, _ in _resume(self.lexer, self.text,
+                                                pos, stack):
+            if token_type is None and token_pos > pos:
+                line += self.text.count('\n', pos, token_pos)
+                pos = token_pos
+                if line >= target:
+                    self._lines.append(line)
+                    self._offsets.append(pos)
+                    self._stacks.append(tuple(stack))
+                    return
+        self._finished = True
+
+    def _block(self, index):
+        markup = self._blocks.get(index)
+        if markup is None:
+            start = self._offsets[index]
+            if index + 1 < len(self._offsets):
+                end = self._offsets[index + 1]
+            else:
+                end = len(self.text)
+            stack = self._stacks[index]
+            if self._wrapped:
+                tokens = _until(self.lexer.get_tokens_unprocessed(
+                    self.text[start:], stack=stack), end, start)
+            else:
+                tokens = _until(_resume(self.lexer, self.text, start,
+                                        list(stack)), end)
+            markup = _lines_markup(tokens, self._lines[index])
+            self._blocks[index] = markup
+        return markup
+
+    def lines(self):
+        """Return the markup of every line, as :func:`highlight_file` does."""
+        while not self._finished:
+            self._extend(self._lines[-1])
+        lines = {}
+        for index in range(len(self._offsets)):
+            with self._lock:
+                lines.update(self._block(index))
+        return lines
+
+    def get(self, lineno, default=None):
+        if lineno < 1:
+            return default
+        self._extend(lineno)
+        with self._lock:
+            index = bisect.bisect_right(self._lines, lineno) - 1
+            return self._block(index).get(lineno, default)
+
+    def __contains__(self, lineno):
+        return self.get(lineno) is not None
+
+    def __getitem__(self, lineno):
+        markup = self.get(lineno)
+        if markup is None:
+            raise KeyError(lineno)
+        return markup
+
+
 def _simplify_markup(markup):
     """Merge adjacent segments that share the same attribute."""
     if not markup:
@@ -230,6 +467,42 @@ def _chars_to_markup(chars):
     return result[0] if len(result) == 1 else result
 
 
+def _flatten_to_spans(markup, spans=None):
+    """Convert urwid markup to a flat ``[(attr, text), …]`` list.
+
+    Empty runs are dropped; adjacent runs may share an attribute.
+    """
+    if spans is None:
+        spans = []
+    if isinstance(markup, str):
+        if markup:
+            spans.append((None, markup))
+    elif isinstance(markup, tuple):
+        attr, text = markup
+        if isinstance(text, str):
+            if text:
+                spans.append((attr, text))
+        else:
+            _flatten_to_spans(text, spans)
+    elif isinstance(markup, list):
+        for item in markup:
+            _flatten_to_spans(item, spans)
+    return spans
+
+
+def _merged_attr(diff_attr, syn_attr):
+    """Return the attr for text styled *diff_attr* and *syn_attr*."""
+    if diff_attr and ('word' in diff_attr or diff_attr == 'trailing-ws'):
+        return diff_attr
+    if diff_attr in DIFF_LINE_STYLES and syn_attr:
+        return f'{syn_attr}-on-{diff_attr}'
+    if diff_attr:
+        return diff_attr
+    if syn_attr:
+        return syn_attr
+    return None
+
+
 def merge_syntax_with_diff(syntax_markup, diff_markup):
     """Overlay syntax colours onto diff markup for a changed line.
 
@@ -240,41 +513,52 @@ def merge_syntax_with_diff(syntax_markup, diff_markup):
       sits on the diff background.
     * Any other diff attr (e.g. ``context-line``) is replaced by the
       syntax attr directly.
+
+    Both markups are walked as runs of text in a single sweep, so the
+    cost grows with the number of runs rather than of characters.
     """
-    syn_chars = _flatten_to_chars(syntax_markup)
-    diff_chars = _flatten_to_chars(diff_markup)
+    syn_spans = _flatten_to_spans(syntax_markup)
+    diff_spans = _flatten_to_spans(diff_markup)
 
-    if not syn_chars or not diff_chars:
+    if not syn_spans or not diff_spans:
         return diff_markup
 
-    # Guard: the character-level merge assumes both sides represent
-    # the same text.  If they differ (encoding normalisation, "no
-    # newline" workaround, etc.) fall back to plain diff markup
-    # rather than silently mis-colouring characters.
-    syn_text = ''.join(c for _, c in syn_chars)
-    diff_text = ''.join(c for _, c in diff_chars)
-    if syn_text != diff_text:
+    # Guard: the merge assumes both sides represent the same text.
+    # If they differ (encoding normalisation, "no newline" workaround,
+    # etc.) fall back to plain diff markup rather than silently
+    # mis-colouring characters.
+    syn_text = ''.join(text for _, text in syn_spans)
+    text = ''.join(text for _, text in diff_spans)
+    if syn_text != text:
         log.warning('Syntax/diff text mismatch (len %d vs %d); '
-                   'skipping syntax merge', len(syn_text), len(diff_text))
+                   'skipping syntax merge', len(syn_text), len(text))
         return diff_markup
 
-    merged = []
-    for i, (diff_attr, char) in enumerate(diff_chars):
-        # syn_chars and diff_chars have equal length (same text)
-        syn_attr = syn_chars[i][0]
-
-        if diff_attr and ('word' in diff_attr or diff_attr == 'trailing-ws'):
-            merged.append((diff_attr, char))
-        elif diff_attr in DIFF_LINE_STYLES and syn_attr:
-            merged.append((f'{syn_attr}-on-{diff_attr}', char))
-        elif diff_attr:
-            merged.append((diff_attr, char))
-        elif syn_attr:
-            merged.append((syn_attr, char))
+    # Runs of the result as [attr, start, end]; each step covers the
+    # overlap of the current syntax run and the current diff run.
+    runs = []
+    pos = 0
+    i = j = 0
+    syn_end = len(syn_spans[0][1])
+    diff_end = len(diff_spans[0][1])
+    while pos < len(text):
+        end = min(syn_end, diff_end)
+        attr = _merged_attr(diff_spans[j][0], syn_spans[i][0])
+        if runs and runs[-1][0] == attr:
+            runs[-1][2] = end
         else:
-            merged.append((None, char))
-
-    return _chars_to_markup(merged)
+            runs.append([attr, pos, end])
+        pos = end
+        if pos == syn_end and i + 1 < len(syn_spans):
+            i += 1
+            syn_end += len(syn_spans[i][1])
+        if pos == diff_end and j + 1 < len(diff_spans):
+            j += 1
+            diff_end += len(diff_spans[j][1])
+
+    result = [(attr, text[start:end]) if attr else text[start:end]
+              for attr, start, end in runs]
+    return result[0] if len(result) == 1 else result
 
 
 # ------------------------------------------------------------------
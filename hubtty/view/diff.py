@@ -13,17 +13,18 @@
 # under the License.
 
 import datetime
+import functools
 import logging
 import os
 
 import urwid
 
+from hubtty import generated
 from hubtty import gitrepo
 from hubtty import keymap
 from hubtty import markdown
 from hubtty import mywid
 from hubtty import sync
-from hubtty.generated import GeneratedFileFilter
 from hubtty.view import mouse_scroll_decorator
 
 
@@ -49,6 +50,10 @@ class BaseDiffLine(urwid.Button):
     def selectable(self):
         return True
 
+    def setLine(self, old, new):
+        """Replace the displayed text with the given line tuples."""
+        raise NotImplementedError
+
     def search(self, search, attribute):
         pass
 
@@ -98,6 +103,47 @@ class DiffContextButton(urwid.WidgetWrap):
     def next(self, button):
         self.view.expandChunk(self.diff, self.chunk, from_end=-10)
 
+class DiffFileButton(urwid.WidgetWrap):
+    """Stands in for the body of a file that has not been parsed yet.
+
+    Files below the size thresholds are loaded as soon as the button is
+    rendered, i.e. scrolled into view; larger ones wait for the user to
+    press it.
+    """
+    def selectable(self):
+        return True
+
+    def __init__(self, view, diff, auto):
+        focus_map={'context-button':'focused-context-button'}
+        if auto:
+            label = "Loading diff of %s lines" % (diff.patch_lines,)
+        else:
+            label = "Show diff of %s lines (%s KiB)" % (
+                diff.patch_lines, diff.patch_bytes // 1024)
+        button = mywid.FixedButton(('context-button', label),
+                                   on_press=self.load)
+        button = urwid.Columns([urwid.Text(''),
+                                ('pack', urwid.AttrMap(button, None,
+                                                       focus_map=focus_map)),
+                                urwid.Text('')],
+                               dividechars=4)
+        button = urwid.AttrMap(button, 'context-button')
+        super().__init__(button)
+        self.view = view
+        self.diff = diff
+        self.auto = auto
+        self._scheduled = False
+
+    def render(self, size, focus=False):
+        if self.auto and not self._scheduled:
+            self._scheduled = True
+            self.view.app.loop.set_alarm_in(
+                0, lambda loop, data: self.load(None))
+        return super().render(size, focus)
+
+    def load(self, button):
+        self.view.loadFile(self)
+
 class DiffCommitEntry(urwid.WidgetWrap):
     """An expandable commit entry for the diff view's commit summary."""
     _focus_map = {
@@ -116,12 +162,9 @@ class DiffCommitEntry(urwid.WidgetWrap):
         # Build the detail body: rendered commit message or placeholder.
         body_text = message.split('\n', 1)[1].rstrip() if '\n' in message else ''
         if body_text:
-            md = markdown.Renderer(app)
-            rendered = md.render(body_text)
+            md = markdown.Renderer(app, app.render_cache)
             context = {'repository': repository_name} if repository_name else None
-            for commentlink in app.config.commentlinks:
-                rendered = commentlink.run(app, rendered, context)
-            body_content = mywid.HyperText(rendered)
+            body_content = mywid.HyperText(md.renderMessage(body_text, context))
         else:
             body_content = urwid.Text(('md-emphasis', 'Empty commit message'))
         self.body = urwid.Padding(body_content, left=10)
@@ -191,6 +234,8 @@ class BaseDiffView(urwid.WidgetWrap, mywid.Searchable):
         self.new_commit_key = new_commit_key
         self._explicit_base_sha = base_sha
         self.hide_generated = app.config.hide_generated_files
+        self._diff_job = None
+        self._generated_filter = None
         self._init()
 
     def _init(self):
@@ -311,13 +356,14 @@ class BaseDiffView(urwid.WidgetWrap, mywid.Searchable):
             self.repository_name = new_commit.pull_request.repository.name
             self.sha = new_commit.sha
             self._files_with_comments = set()
-            repo_path = os.path.join(self.app.config.git_root,
-                                     self.repository_name)
-            self._generated_filter = GeneratedFileFilter(
-                repo_path=repo_path,
-                commit_sha=self.sha,
-                user_patterns=self.app.config.generated_files,
-            )
+            # Shown while the diff is computed in the background.
+            pending_paths = set()
+            summary_keys = {key for key, _, _ in self._commit_summary}
+            for c in pr.commits:
+                if c.key in summary_keys:
+                    pending_paths.update(f.path for f in c.files)
+            if old_commit is not None:
+                pending_paths.update(f.path for f in old_commit.files)
             for f in new_commit.files:
                 new_comments += f.current_comments
                 self.new_file_keys[f.path] = f.key
@@ -368,7 +414,6 @@ class BaseDiffView(urwid.WidgetWrap, mywid.Searchable):
                 comment_list.append((comment.key, message))
                 comment_lists[key] = comment_list
                 comment_filenames.add(path)
-        repo = gitrepo.get_repo(self.repository_name, self.app.config)
         self._w.contents.append((self.app.header, ('pack', 1)))
         self.file_reminder = self.makeFileReminder()
         self._w.contents.append((self.file_reminder, ('pack', 1)))
@@ -399,31 +444,80 @@ class BaseDiffView(urwid.WidgetWrap, mywid.Searchable):
                 lines.append(entry)
             lines.append(urwid.Text(''))
         self.file_diffs = [{}, {}]  # Mapping of fn -> DiffFile object (old, new)
-        # this is a list of files:
-        diffs = repo.diff(self.base_sha, self.sha,
-                          show_old_commit=show_old_commit,
-                          syntax_highlighting=self.app.config.syntax_highlighting,
-                          max_highlight_size=self.app.config.max_highlight_size)
+        self.comment_lists = comment_lists
+        self._comment_paths = set(comment_filenames)
+        self._files_start = len(lines)
+        pending_paths.discard('/COMMIT_MSG')
+        for path in sorted(pending_paths):
+            lines.append(urwid.Text([('filename', path),
+                                     ('context-button', '  loading...')]))
+        if not pending_paths:
+            lines.append(urwid.Text(('context-button', 'Loading diff...')))
+        listwalker = urwid.SimpleFocusListWalker(lines)
+        self.listbox = urwid.ListBox(listwalker)
+        self._w.contents.append((self.listbox, ('weight', 1)))
+        self.old_focus = 2
+        self.draft_comments = []
+        self._w.set_focus(self.old_focus)
+        self.app.status.update(title=self.title)
+        if self._diff_job is not None:
+            self._diff_job.cancel()
+        self._diff_job = self.app.runInBackground(
+            functools.partial(self._computeDiffs,
+                              repository_name=self.repository_name,
+                              base_sha=self.base_sha, sha=self.sha,
+                              show_old_commit=show_old_commit,
+                              comment_filenames=comment_filenames),
+            self._showDiffs, errback=self._showDiffError, owner=self)
+
+    def _computeDiffs(self, job, repository_name, base_sha, sha,
+                      show_old_commit, comment_filenames):
+        """Run git and parse the diff; called in a background thread."""
+        config = self.app.config
+        repo = gitrepo.get_repo(repository_name, config)
+        generated_filter = generated.get_filter(
+            repo.path, sha, config.generated_files)
+        # this is a list of files, parsed as they are displayed:
+        diffs = self.app.diff_cache.diff(
+            repo, base_sha, sha, lazy=True,
+            show_old_commit=show_old_commit,
+            syntax_highlighting=config.syntax_highlighting,
+            max_highlight_size=config.max_highlight_size)
         # Filter out synthetic /COMMIT_MSG entries that can appear in
         # combined (multi-commit) diffs.  Harmless for single-commit
         # diffs since git does not produce these entries.
         diffs = [d for d in diffs
                  if d.oldname != '/COMMIT_MSG'
                  and d.newname != '/COMMIT_MSG']
+        missing = set(comment_filenames)
         for diff in diffs:
-            comment_filenames.discard(diff.oldname)
-            comment_filenames.discard(diff.newname)
+            missing.discard(diff.oldname)
+            missing.discard(diff.newname)
+            # Files with comments are displayed parsed.
+            if (diff.oldname in comment_filenames or
+                diff.newname in comment_filenames):
+                if job.cancelled:
+                    return None
+                diff.parse()
         # There are comments referring to these files which do not
         # appear in the diff so we should create fake diff objects
         # that contain the full text.
-        for filename in comment_filenames:
-            diff = repo.getFile(self.base_sha, self.sha, filename,
-                                syntax_highlighting=self.app.config.syntax_highlighting,
-                                max_highlight_size=self.app.config.max_highlight_size)
+        for filename in missing:
+            if job.cancelled:
+                return None
+            diff = repo.getFile(base_sha, sha, filename,
+                                syntax_highlighting=config.syntax_highlighting,
+                                max_highlight_size=config.max_highlight_size)
             if diff:
                 diffs.append(diff)
             else:
-                self.log.debug("Unable to find file %s in commit %s", filename, self.sha)
+                self.log.debug("Unable to find file %s in commit %s", filename, sha)
+        return (diffs, generated_filter)
+
+    def _showDiffs(self, result):
+        diffs, self._generated_filter = result
+        comment_lists = self.comment_lists
+        lines = []
         for i, diff in enumerate(diffs):
             if i > 0:
                 lines.append(urwid.Text(''))
@@ -438,31 +532,85 @@ class BaseDiffView(urwid.WidgetWrap, mywid.Searchable):
             if (self.hide_generated and is_gen
                     and not self._has_comments(diff)):
                 continue
-            for chunk in diff.chunks:
-                if chunk.context:
-                    if not chunk.first:
-                        lines += self.makeLines(diff, chunk.lines[:10], comment_lists)
-                        del chunk.lines[:10]
-                    button = DiffContextButton(self, diff, chunk)
-                    chunk.button = button
-                    lines.append(button)
-                    if not chunk.last:
-                        lines += self.makeLines(diff, chunk.lines[-10:], comment_lists)
-                        del chunk.lines[-10:]
-                    chunk.calcRange()
-                    chunk.button.update()
-                    if not chunk.lines:
-                        lines.remove(button)
-                else:
-                    lines += self.makeLines(diff, chunk.lines, comment_lists)
-        listwalker = urwid.SimpleFocusListWalker(lines)
-        self.listbox = urwid.ListBox(listwalker)
-        self._w.contents.append((self.listbox, ('weight', 1)))
-        self.old_focus = 2
-        self.draft_comments = []
-        self._w.set_focus(self.old_focus)
+            lines += self.makeFileBody(diff, comment_lists)
+        self.listbox.body[self._files_start:] = lines
         self.handleUndisplayedComments(comment_lists)
-        self.app.status.update(title=self.title)
+
+    def _showDiffError(self, error):
+        self.listbox.body[self._files_start:] = [
+            urwid.Text(('error', 'Unable to display diff: %s' % (error,)))]
+
+    def makeFileBody(self, diff, comment_lists, force=False):
+        """Return the lines displaying the chunks of *diff*.
+
+        Unless *force* is set, a file that has not been parsed yet gets
+        a DiffFileButton instead, so that the work is only done once it
+        scrolls into view (or on request, for files above the size
+        thresholds).  Files with comments are always parsed up front.
+        """
+        if not (force or diff.parsed
+                or diff.oldname in self._comment_paths
+                or diff.newname in self._comment_paths):
+            config = self.app.config
+            auto = (diff.patch_lines <= config.max_diff_file_lines and
+                    diff.patch_bytes <= config.max_diff_file_size)
+            return [DiffFileButton(self, diff, auto)]
+        diff.parse()
+        lines = []
+        for chunk in diff.chunks:
+            if chunk.context:
+                # Git already supplies the lines around each hunk, so
+                # gaps between hunks start out collapsed.
+                if not (chunk.first or chunk.gap):
+                    lines += self.makeLines(diff, chunk.lines[:10], comment_lists)
+                    del chunk.lines[:10]
+                button = DiffContextButton(self, diff, chunk)
+                chunk.button = button
+                lines.append(button)
+                if not (chunk.last or chunk.gap):
+                    lines += self.makeLines(diff, chunk.lines[-10:], comment_lists)
+                    del chunk.lines[-10:]
+                chunk.calcRange()
+                chunk.button.update()
+                if not chunk.lines:
+                    lines.remove(button)
+            else:
+                lines += self.makeLines(diff, chunk.lines, comment_lists)
+        if diff.deferred_syntax is not None:
+            deferred = diff.deferred_syntax
+            self.app.runInBackground(
+                lambda job: deferred.result(),
+                functools.partial(self.applySyntax, diff), owner=self)
+        return lines
+
+    def applySyntax(self, diff, highlighted):
+        """Recolor *diff* with the lines of its *highlighted* version."""
+        if diff.deferred_syntax is None:
+            return
+        diff.deferred_syntax = None
+        diff.old_syntax = highlighted.old_syntax
+        diff.new_syntax = highlighted.new_syntax
+        # Lines behind context buttons are built from the file's
+        # syntax when they are displayed; refresh the ones on screen.
+        for widget in self.listbox.body:
+            if not isinstance(widget, BaseDiffLine):
+                continue
+            context = widget.context
+            if (context.old_fn != diff.oldname or
+                context.new_fn != diff.newname):
+                continue
+            line = diff.findLine(context.old_ln, context.new_ln)
+            if line is not None:
+                widget.setLine(*line)
+
+    def loadFile(self, button):
+        try:
+            index = self.listbox.body.index(button)
+        except ValueError:
+            # Already loaded, or the view has been rebuilt since.
+            return
+        self.listbox.body[index:index+1] = self.makeFileBody(
+            button.diff, self.comment_lists, force=True)
 
     def handleUndisplayedComments(self, comment_lists):
         # Handle comments that landed outside our default diff context
@@ -556,10 +704,11 @@ class BaseDiffView(urwid.WidgetWrap, mywid.Searchable):
 
     def interested(self, event):
         if not ((isinstance(event, sync.PullRequestAddedEvent) and
-                 self.pr_key in event.related_pr_keys)
+                 event.pr_key == self.pr_key)
                 or
                 (isinstance(event, sync.PullRequestUpdatedEvent) and
-                 self.pr_key in event.related_pr_keys)):
+                 event.pr_key == self.pr_key and
+                 event.changedSections() & {'commits', 'messages'})):
             #self.log.debug("Ignoring refresh diff due to event %s" % (event,))
             return False
         #self.log.debug("Refreshing diff due to event %s" % (event,))
@@ -579,7 +728,7 @@ class BaseDiffView(urwid.WidgetWrap, mywid.Searchable):
         if pos > 1:
             pos -= 1
         context = None
-        while True:
+        while pos > 0:
             item = self.listbox.body[pos]
             if hasattr(item, 'context'):
                 break
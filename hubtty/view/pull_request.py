@@ -15,23 +15,29 @@
 
 import collections
 import datetime
+import functools
 import logging
 import os
 import textwrap
 
 import urwid
 
+from hubtty import commentlink
+from hubtty import generated
 from hubtty import gitrepo
 from hubtty import keymap
 from hubtty import mywid
 from hubtty import sync
 from hubtty import markdown
-from hubtty.generated import GeneratedFileFilter
 from hubtty.view import side_diff as view_side_diff
 from hubtty.view import unified_diff as view_unified_diff
 from hubtty.view import mouse_scroll_decorator
 import hubtty.view
 
+# Parts of a pull request view which can be refreshed separately; each
+# has a matching "<section>_changed" flag in the sync events.
+REFRESH_SECTIONS = frozenset(['commits', 'messages', 'checks', 'labels'])
+
 class EditLabelsDialog(urwid.WidgetWrap, mywid.LineBoxTitlePropertyMixin):
     signals = ['save', 'cancel']
     def __init__(self, app, pr):
@@ -435,11 +441,8 @@ class CommitRow(urwid.WidgetWrap):
         if hide_generated:
             repo_path = os.path.join(app.config.git_root,
                                      self.repository_name)
-            generated_filter = GeneratedFileFilter(
-                repo_path=repo_path,
-                commit_sha=commit.sha,
-                user_patterns=app.config.generated_files,
-            )
+            generated_filter = generated.get_filter(
+                repo_path, commit.sha, app.config.generated_files)
         for rfile in commit.files:
             if rfile.status is None:
                 continue
@@ -483,19 +486,34 @@ class CommitRow(urwid.WidgetWrap):
         self.pile = urwid.Pile([padded_title])
         self._w = urwid.AttrMap(self.pile, None, focus_map=self.commit_focus_map)
         self.expanded = False
+        self.version = None
         self.update(commit)
         if expanded:
             self.expandContract(None)
 
-    def update(self, commit):
+    def update(self, commit, comment_counts=None):
+        """Update the title of the row if anything shown in it changed.
+
+        *comment_counts* is the ``(current, drafts)`` pair returned by
+        :meth:`DatabaseSession.getCommentCounts` for the commit; it is
+        computed from the files of the commit if not given.
+        """
+        if comment_counts is None:
+            num_current = sum([len(f.current_comments) for f in commit.files])
+            num_drafts = sum([len(f.draft_comments) for f in commit.files])
+        else:
+            num_current, num_drafts = comment_counts
+        show_drafts = bool(num_drafts) and not commit.pull_request.hasPendingMessage()
+        version = (commit.sha, commit.message, num_current, num_drafts, show_drafts)
+        if version == self.version:
+            return
+        self.version = version
         line = [('commit-sha', commit.sha[0:7]),
                 ('commit-name', ' %s' % commit.message.split('\n')[0])]
-        num_drafts = sum([len(f.draft_comments) for f in commit.files])
-        if num_drafts:
-            if not commit.pull_request.hasPendingMessage():
-                line.append(('commit-drafts', ' ({} draft{})'.format(
-                            num_drafts, num_drafts>1 and 's' or '')))
-        num_comments = sum([len(f.current_comments) for f in commit.files]) - num_drafts
+        if show_drafts:
+            line.append(('commit-drafts', ' ({} draft{})'.format(
+                        num_drafts, num_drafts>1 and 's' or '')))
+        num_comments = num_current - num_drafts
         if num_comments:
             line.append(('commit-comments', ' ({} inline comment{})'.format(
                         num_comments, num_comments>1 and 's' or '')))
@@ -539,7 +557,7 @@ class PullRequestMessageBox(mywid.HyperText):
         super().__init__('')
         self.pr_view = pr_view
         self.app = pr_view.app
-        self.md = markdown.Renderer(self.app)
+        self.md = markdown.Renderer(self.app, self.app.render_cache)
         self.refresh(pr, message)
 
     def formatReply(self):
@@ -613,15 +631,17 @@ class PullRequestMessageBox(mywid.HyperText):
             text.append(' ')
             text.append(link)
 
-        comment_text = self.md.render(message.message)
+        context = {'repository': self.pr_view.repository_name} if hasattr(self.pr_view, 'repository_name') else None
+        # The rendered message may be shared through the render cache,
+        # so build a new list rather than modifying it.
+        comment_text = self.md.renderMessage(message.message, context)
         if len(comment_text) > 0:
-            if isinstance(comment_text[0], tuple):
-                comment_text = ["\n"] + comment_text
+            if isinstance(comment_text[0], str):
+                comment_text = ["\n%s" % comment_text[0]] + comment_text[1:]
             else:
-                comment_text[0] = "\n%s" % comment_text[0]
-        context = {'repository': self.pr_view.repository_name} if hasattr(self.pr_view, 'repository_name') else None
-        for commentlink in self.app.config.commentlinks:
-            comment_text = commentlink.run(self.app, comment_text, context)
+                comment_text = ["\n"] + comment_text
+        else:
+            comment_text = []
 
         inline_comments = {}
         for comment in message.comments:
@@ -650,10 +670,7 @@ class PullRequestMessageBox(mywid.HyperText):
                 comment_text.append('\n  %s' % (location_str))
                 # Let's pass the rendered comment through commentlinks, but not
                 # location_str
-                rendered_comment = self.md.render(comment)
-                for commentlink in self.app.config.commentlinks:
-                    rendered_comment = commentlink.run(self.app, rendered_comment, context)
-                comment_text.extend(rendered_comment)
+                comment_text.extend(self.md.renderMessage(comment, context))
                 comment_text.append('\n')
 
         self.set_text(text+comment_text)
@@ -664,13 +681,16 @@ class PrDescriptionBox(mywid.HyperText):
         self.repository_name = repository_name
         super().__init__(message)
 
-    def set_text(self, text):
-        if len(text) == 0:
-            text = [text]
+    def setDescription(self, title, body):
+        """Display *title* followed by the rendered markup of *body*.
+
+        The body has already been through the commentlinks, which are
+        only run on the title here.
+        """
         context = {'repository': self.repository_name} if self.repository_name else None
-        for commentlink in self.app.config.commentlinks:
-            text = commentlink.run(self.app, text, context)
-        super().set_text(text)
+        scanner = commentlink.get_scanner(tuple(self.app.config.commentlinks))
+        text = scanner.run(self.app, ["%s\n\n" % title], context)
+        self.set_text(text + body)
 
 @mouse_scroll_decorator.ScrollByWheel
 class PullRequestView(urwid.WidgetWrap):
@@ -748,6 +768,8 @@ class PullRequestView(urwid.WidgetWrap):
         self.pr_key = pr_key
         self.commit_rows = {}
         self.message_rows = {}
+        self.message_versions = {}
+        self.result_systems = {}
         self.first_commit_key = None
         self.last_commit_key = None
         self.hide_comments = True
@@ -760,7 +782,7 @@ class PullRequestView(urwid.WidgetWrap):
         self.updated_label = urwid.Text('', wrap='clip')
         self.status_label = urwid.Text('', wrap='clip')
         self.permalink_label = mywid.TextButton('', on_press=self.openPermalink)
-        self.md = markdown.Renderer(self.app)
+        self.md = markdown.Renderer(self.app, self.app.render_cache)
         pr_info = []
         pr_info_map={'pr-data': 'focused-pr-data'}
         for l, v in [("Author", urwid.Padding(urwid.AttrMap(self.author_label, None,
@@ -803,13 +825,30 @@ class PullRequestView(urwid.WidgetWrap):
         self.listbox.body.append(urwid.Divider())
         self.listbox_patchset_start = len(self.listbox.body)
 
-        self.checkGitRepo()
         self.refresh()
         self.listbox.set_focus(0)
         self.grid.set_focus(1)
+        # Diffs can only be opened once the commits are known to be
+        # present locally.
+        self.commits_ready = False
+        self.commits_error = None
+        self.checkGitRepo()
+
+    def prefetchDiffs(self):
+        """Compute diffs for this and the next pull requests in the list."""
+        pr_keys = [self.pr_key]
+        widget = self.app.findPullRequestList()
+        if widget:
+            pr_keys += widget.getNextPullRequestKeys(
+                self.pr_key, self.app.config.diff_prefetch)
+        self.app.diff_prefetcher.prefetch(pr_keys)
 
     def checkGitRepo(self):
-        missing_commits = set()
+        """Make sure the commits of the pull request are present locally.
+
+        Git is queried (and missing commits fetched) in the background;
+        diffs can be opened, and are prefetched, once that is done.
+        """
         pr_number = None
         pr_id = None
         shas = set()
@@ -822,6 +861,21 @@ class PullRequestView(urwid.WidgetWrap):
                 shas.add(commit.parent)
                 shas.add(commit.sha)
         shas.discard(gitrepo.EMPTY_TREE_SHA)
+        self.app.runInBackground(
+            functools.partial(self._checkGitRepo,
+                              pr_repository_name=pr_repository_name,
+                              pr_number=pr_number, pr_id=pr_id, shas=shas),
+            self._gitRepoChecked, self._gitRepoCheckFailed, owner=self)
+
+    def _gitRepoChecked(self, result):
+        self.commits_ready = True
+        self.prefetchDiffs()
+
+    def _gitRepoCheckFailed(self, error):
+        self.commits_error = str(error)
+        self.app.error(self.commits_error)
+
+    def _checkGitRepo(self, job, pr_repository_name, pr_number, pr_id, shas):
         repo = gitrepo.get_repo(pr_repository_name, self.app.config)
         missing_commits = repo.checkCommits(shas)
         if missing_commits:
@@ -837,19 +891,52 @@ class PullRequestView(urwid.WidgetWrap):
                 raise hubtty.view.DisplayError("Git commits not present in local repository")
 
     def interested(self, event):
-        if not ((isinstance(event, sync.PullRequestAddedEvent) and
-                 self.pr_key in event.related_pr_keys)
-                or
-                (isinstance(event, sync.PullRequestUpdatedEvent) and
-                 self.pr_key in event.related_pr_keys)):
+        if not (isinstance(event, (sync.PullRequestAddedEvent,
+                                   sync.PullRequestUpdatedEvent)) and
+                event.pr_key == self.pr_key):
             self.log.debug("Ignoring refresh pull request due to event %s", event)
             return False
         self.log.debug("Refreshing pull request due to event %s", event)
         return True
 
-    def refresh(self):
+    def refreshEvents(self, events):
+        """Refresh the parts of the view affected by sync *events*."""
+        changes = set()
+        for event in events:
+            if isinstance(event, sync.PullRequestAddedEvent):
+                return self.refresh()
+            if event.pr_key != self.pr_key:
+                continue
+            changes |= event.changedSections() & REFRESH_SECTIONS
+        self.refresh(changes)
+
+    def _messageVersion(self, message):
+        # Everything a message box shows, to tell whether it needs
+        # to be rebuilt.
+        return (self.last_commit_key, message.account_key, message.created,
+                message.draft, message.pending, message.message,
+                tuple((c.key, c.file_key, c.updated, c.line, c.message)
+                      for c in message.comments))
+
+    def refresh(self, changes=None):
+        """Update the view from the database.
+
+        With *changes*, a subset of :data:`REFRESH_SECTIONS`, only the
+        pull request itself and those sections are updated, and only
+        what they need is loaded.  Rows of commits and messages are
+        only rebuilt if what they show has changed.
+        """
+        if changes is None:
+            changes = REFRESH_SECTIONS
+        # Messages depend on which commit is the last one.
+        refresh_messages = 'messages' in changes or 'commits' in changes
+        load = []
+        if 'commits' in changes:
+            load.append('commits')
+        if refresh_messages:
+            load += ['messages', 'approvals']
         with self.app.db.getSession() as session:
-            pr = session.getPullRequest(self.pr_key, lazy=False)
+            pr = session.getPullRequest(self.pr_key, load=load)
             # When we first open the pr, update its last_seen time.
             if not self.marked_seen:
                 pr.last_seen = datetime.datetime.utcnow()
@@ -889,17 +976,18 @@ class PullRequestView(urwid.WidgetWrap):
             self.author_label.text.set_text(('pr-data', author_string))
             self.repository_label.text.set_text(('pr-data', pr.repository.name))
             self.branch_label.set_text(('pr-data', pr.branch))
-            label_buttons = []
-            for x in pr.labels:
-                if label_buttons:
-                    label_buttons.append(', ')
-                label_name = "label_" + str(x.id)
-                link = mywid.Link(x.name, label_name, 'focused-pr-data')
-                urwid.connect_signal(
-                    link, 'selected',
-                    lambda link, x=x: self.searchLabel(x.name))
-                label_buttons.append(link)
-            self.labels_label.set_text(('pr-data', label_buttons or ''))
+            if 'labels' in changes:
+                label_buttons = []
+                for x in pr.labels:
+                    if label_buttons:
+                        label_buttons.append(', ')
+                    label_name = "label_" + str(x.id)
+                    link = mywid.Link(x.name, label_name, 'focused-pr-data')
+                    urwid.connect_signal(
+                        link, 'selected',
+                        lambda link, x=x: self.searchLabel(x.name))
+                    label_buttons.append(link)
+                self.labels_label.set_text(('pr-data', label_buttons or ''))
             self.created_label.set_text(('pr-data', str(self.app.time(pr.created))))
             self.updated_label.set_text(('pr-data', str(self.app.time(pr.updated))))
             stat = pr.draft and ('state-draft', 'Draft') or pr.state
@@ -907,122 +995,140 @@ class PullRequestView(urwid.WidgetWrap):
             self.permalink_url = str(pr.html_url)
             self.permalink_label.text.set_text(('pr-data', self.permalink_url))
             self.pr_description.repository_name = self.repository_name
-            self.pr_description.set_text(["%s\n\n" % pr.title] + self.md.render(pr.body))
-
-            review_states = ['Changes Requested', 'Comment', 'Approved']
-            approval_headers = [urwid.Text(('table-header', 'Name'))]
-            for state in review_states:
-                approval_headers.append(urwid.Text(('table-header', state)))
-            votes = mywid.Table(approval_headers)
-            approvals_for_account = {}
-            pending_message = pr.hasPendingMessage()
-            for approval in pr.approvals:
-                approvals = approvals_for_account.get(approval.reviewer.id)
-                if not approvals:
-                    approvals = {}
-                    row = []
-                    if self.app.isOwnAccount(approval.reviewer):
-                        style = 'reviewer-own-name'
-                    else:
-                        style = 'reviewer-name'
-                    row.append(urwid.Text((style, approval.reviewer_name)))
-                    for i, state in enumerate(review_states):
-                        w = urwid.Text('', align=urwid.CENTER)
-                        approvals[state] = w
-                        row.append(w)
-                    approvals_for_account[approval.reviewer.id] = approvals
-                    votes.addRow(row)
-                # Only set approval status if the review is for the current commit
-                if approval.sha == pr.commits[-1].sha:
-                    match approval.state:
-                        case 'APPROVED' | 'APPROVE':
-                            text = '✓'
-                            if approval.state == 'APPROVE' and not pending_message:
-                                text = '(' + text + ')'
-                            approvals['Approved'].set_text(('positive-label', text))
-                        case 'CHANGES_REQUESTED' | 'REQUEST_CHANGES':
-                            text = '✗'
-                            if approval.state == 'REQUEST_CHANGES' and not pending_message:
-                                text = '(' + text + ')'
-                            approvals['Changes Requested'].set_text(('negative-label', text))
-                        case _:
-                            text = '•'
-                            if approval.state == 'COMMENT' and not pending_message:
-                                text = '(' + text + ')'
-                            approvals['Comment'].set_text(text)
-            votes = urwid.Padding(votes, width='pack')
-
-            # TODO: update the existing table rather than replacing it
-            # wholesale.  It will become more important if the table
-            # gets selectable items (like clickable names).
-            self.grid.contents[2] = (votes, ('given', 80))
+            context = {'repository': self.repository_name} if self.repository_name else None
+            self.pr_description.setDescription(
+                pr.title, self.md.renderMessage(pr.body, context))
+
+            if refresh_messages:
+                review_states = ['Changes Requested', 'Comment', 'Approved']
+                approval_headers = [urwid.Text(('table-header', 'Name'))]
+                for state in review_states:
+                    approval_headers.append(urwid.Text(('table-header', state)))
+                votes = mywid.Table(approval_headers)
+                approvals_for_account = {}
+                pending_message = pr.hasPendingMessage()
+                for approval in pr.approvals:
+                    approvals = approvals_for_account.get(approval.reviewer.id)
+                    if not approvals:
+                        approvals = {}
+                        row = []
+                        if self.app.isOwnAccount(approval.reviewer):
+                            style = 'reviewer-own-name'
+                        else:
+                            style = 'reviewer-name'
+                        row.append(urwid.Text((style, approval.reviewer_name)))
+                        for i, state in enumerate(review_states):
+                            w = urwid.Text('', align=urwid.CENTER)
+                            approvals[state] = w
+                            row.append(w)
+                        approvals_for_account[approval.reviewer.id] = approvals
+                        votes.addRow(row)
+                    # Only set approval status if the review is for the current commit
+                    if approval.sha == pr.commits[-1].sha:
+                        match approval.state:
+                            case 'APPROVED' | 'APPROVE':
+                                text = '✓'
+                                if approval.state == 'APPROVE' and not pending_message:
+                                    text = '(' + text + ')'
+                                approvals['Approved'].set_text(('positive-label', text))
+                            case 'CHANGES_REQUESTED' | 'REQUEST_CHANGES':
+                                text = '✗'
+                                if approval.state == 'REQUEST_CHANGES' and not pending_message:
+                                    text = '(' + text + ')'
+                                approvals['Changes Requested'].set_text(('negative-label', text))
+                            case _:
+                                text = '•'
+                                if approval.state == 'COMMENT' and not pending_message:
+                                    text = '(' + text + ')'
+                                approvals['Comment'].set_text(text)
+                votes = urwid.Padding(votes, width='pack')
+
+                # TODO: update the existing table rather than replacing it
+                # wholesale.  It will become more important if the table
+                # gets selectable items (like clickable names).
+                self.grid.contents[2] = (votes, ('given', 80))
 
             # self.refreshDependencies(session, pr)
 
-            repo = gitrepo.get_repo(pr.repository.name, self.app.config)
             # The listbox has both commits and messages in it (and
             # may later contain the vote table and pull request header), so
             # keep track of the index separate from the loop.
             listbox_index = self.listbox_patchset_start
             self.first_commit_key = pr.commits[0].key
-            for commit in pr.commits:
-                self.last_commit_key = commit.key
-                row = self.commit_rows.get(commit.key)
-                if not row:
-                    row = CommitRow(self.app, self, repo, commit)
-                    self.listbox.body.insert(listbox_index, row)
-                    self.commit_rows[commit.key] = row
-                row.update(commit)
-                # Revisions are extremely unlikely to be deleted, skip
-                # that case.
-                listbox_index += 1
+            self.last_commit_key = pr.commits[-1].key
+            if 'commits' in changes:
+                repo = gitrepo.get_repo(pr.repository.name, self.app.config)
+                comment_counts = session.getCommentCounts(pr)
+                for commit in pr.commits:
+                    row = self.commit_rows.get(commit.key)
+                    if not row:
+                        row = CommitRow(self.app, self, repo, commit)
+                        self.listbox.body.insert(listbox_index, row)
+                        self.commit_rows[commit.key] = row
+                    row.update(commit, comment_counts.get(commit.key, (0, 0)))
+                    # Revisions are extremely unlikely to be deleted, skip
+                    # that case.
+                    listbox_index += 1
+            else:
+                listbox_index += len(pr.commits)
             if len(self.listbox.body) == listbox_index:
                 self.listbox.body.insert(listbox_index, urwid.Divider())
             listbox_index += 1
-            # Get the set of messages that should be displayed
-            display_messages = []
-            result_systems = {}
-            for message in pr.messages:
-                if (message.commit == pr.commits[-1] and
-                    message.author and message.author.name):
-                    for commentlink in self.app.config.commentlinks:
-                        results = commentlink.getTestResults(self.app, message.message,
-                                                            context={'repository': self.repository_name})
-                        if results:
-                            result_system = result_systems.get(message.author.name,
-                                                               collections.OrderedDict())
-                            result_systems[message.author.name] = result_system
-                            result_system.update(results)
-                skip = False
-                if self.hide_comments and message.author and message.author.username:
-                    for regex in self.app.config.hide_comments:
-                        if regex.match(message.author.username):
-                            skip = True
-                            break
-                if not skip:
-                    display_messages.append(message)
-            # The set of message keys currently displayed
-            unseen_keys = set(self.message_rows.keys())
-            # Make sure all of the messages that should be displayed are
-            for message in display_messages:
-                row = self.message_rows.get(message.key)
-                if not row:
-                    box = PullRequestMessageBox(self, pr, message)
-                    row = urwid.Padding(box, width=80)
-                    self.listbox.body.insert(listbox_index, row)
-                    self.message_rows[message.key] = row
-                else:
-                    unseen_keys.remove(message.key)
-                    if message.draft or message.created != row.original_widget.message_created:
-                        row.original_widget.refresh(pr, message)
-                listbox_index += 1
-            # Remove any messages that should not be displayed
-            for key in unseen_keys:
-                row = self.message_rows.get(key)
-                self.listbox.body.remove(row)
-                del self.message_rows[key]
-                listbox_index -= 1
-            self._updateTestResults(pr, result_systems)
+            if refresh_messages:
+                self._refreshMessages(pr, listbox_index)
+            if refresh_messages or 'checks' in changes:
+                self._updateTestResults(pr, self.result_systems)
+
+    def _refreshMessages(self, pr, listbox_index):
+        # Get the set of messages that should be displayed
+        display_messages = []
+        result_systems = {}
+        scanner = commentlink.get_scanner(tuple(self.app.config.commentlinks))
+        for message in pr.messages:
+            if (message.commit_key == self.last_commit_key and
+                message.author and message.author.name):
+                results = scanner.getTestResults(self.app, message.message,
+                                                 context={'repository': self.repository_name})
+                if results:
+                    result_system = result_systems.get(message.author.name,
+                                                       collections.OrderedDict())
+                    result_systems[message.author.name] = result_system
+                    result_system.update(results)
+            skip = False
+            if self.hide_comments and message.author and message.author.username:
+                for regex in self.app.config.hide_comments:
+                    if regex.match(message.author.username):
+                        skip = True
+                        break
+            if not skip:
+                display_messages.append(message)
+        self.result_systems = result_systems
+        # The set of message keys currently displayed
+        unseen_keys = set(self.message_rows.keys())
+        # Make sure all of the messages that should be displayed are,
+        # and rebuild those that changed.  Hidden messages are not
+        # rendered until they are displayed.
+        for message in display_messages:
+            version = self._messageVersion(message)
+            row = self.message_rows.get(message.key)
+            if not row:
+                box = PullRequestMessageBox(self, pr, message)
+                row = urwid.Padding(box, width=80)
+                self.listbox.body.insert(listbox_index, row)
+                self.message_rows[message.key] = row
+            else:
+                unseen_keys.remove(message.key)
+                if version != self.message_versions.get(message.key):
+                    row.original_widget.refresh(pr, message)
+            self.message_versions[message.key] = version
+            listbox_index += 1
+        # Remove any messages that should not be displayed
+        for key in unseen_keys:
+            row = self.message_rows.get(key)
+            self.listbox.body.remove(row)
+            del self.message_rows[key]
+            del self.message_versions[key]
+            listbox_index -= 1
 
     def _add_link(self, name, url):
         link = mywid.Link('{:<40}'.format(name[:38] + (name[38:] and '…')), 'link', 'focused-link')
@@ -1227,6 +1333,12 @@ class PullRequestView(urwid.WidgetWrap):
         return key
 
     def diff(self, commit_key, old_commit_key=None, base_sha=None):
+        if not self.commits_ready:
+            self.app.error(self.commits_error or
+                           "The commits of this pull request are being "
+                           "fetched; try again in a moment.",
+                           title='Fetching commits')
+            return
         if self.app.config.diff_view == 'unified':
             screen = view_unified_diff.UnifiedDiffView(
                 self.app, commit_key,
@@ -412,7 +412,9 @@ class PullRequestListView(urwid.WidgetWrap, mywid.Searchable):
                  isinstance(event, sync.PullRequestAddedEvent))
                 or
                 (isinstance(event, sync.PullRequestUpdatedEvent) and
-                 event.pr_key in self.pr_rows.keys())):
+                 event.pr_key in self.pr_rows.keys() and
+                 # Checks are neither shown nor searchable here.
+                 event.changedSections() - {'checks'})):
             self.log.debug("Ignoring refresh pull request list due to event %s", event)
             return False
         self.log.debug("Refreshing pull request list due to event %s", event)
@@ -473,6 +475,15 @@ class PullRequestListView(urwid.WidgetWrap, mywid.Searchable):
         for key in unseen_keys:
             row = self.pr_rows[key]
             del self.pr_rows[key]
+        self.prefetchDiffs()
+
+    def prefetchDiffs(self):
+        """Compute diffs for the focused and following pull requests."""
+        if not len(self.listbox.body):
+            return
+        pos = self.listbox.focus_position
+        rows = self.listbox.body[pos:pos + self.app.config.diff_prefetch + 1]
+        self.app.diff_prefetcher.prefetch([row.pr_key for row in rows])
 
     def chooseColumns(self):
         currently_enabled_columns = self.enabled_columns.copy()
@@ -516,6 +527,14 @@ class PullRequestListView(urwid.WidgetWrap, mywid.Searchable):
         row = self.listbox.body[i+1]
         return row.pr_key
 
+    def getNextPullRequestKeys(self, pr_key, count):
+        row = self.pr_rows.get(pr_key)
+        try:
+            i = self.listbox.body.index(row)
+        except ValueError:
+            return []
+        return [row.pr_key for row in self.listbox.body[i+1:i+1+count]]
+
     def getPrevPullRequestKey(self, pr_key):
         row = self.pr_rows.get(pr_key)
         try:
@@ -563,13 +582,17 @@ class PullRequestListView(urwid.WidgetWrap, mywid.Searchable):
         if pos < len(self.listbox.body)-1:
             pos += 1
             self.listbox.focus_position = pos
+            self.prefetchDiffs()
 
     def keypress(self, size, key):
         if self.searchKeypress(size, key):
             return None
 
+        old_focus = self.listbox.focus
         if not self.app.input_buffer:
             key = super().keypress(size, key)
+        if self.listbox.focus is not old_focus:
+            self.prefetchDiffs()
         keys = self.app.input_buffer + [key]
         commands = self.app.config.keymap.getCommands(keys)
         ret = self.handleCommands(commands)
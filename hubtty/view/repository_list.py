@@ -15,6 +15,8 @@
 
 import logging
 import os
+import types
+
 import urwid
 
 import hubtty.search
@@ -79,7 +81,7 @@ class RepositoryRow(urwid.Button):
             name = ' '+name
         self.name.set_text(name)
 
-    def __init__(self, app, repository, topic, callback=None):
+    def __init__(self, app, repository, topic, callback=None, counts=None):
         super().__init__('', on_press=callback,
                                          user_data=(repository.key, repository.name))
         self.app = app
@@ -105,15 +107,20 @@ class RepositoryRow(urwid.Button):
                 ])
         self.row_style = urwid.AttrMap(col, '')
         self._w = urwid.AttrMap(self.row_style, None, focus_map=self.repository_focus_map)
-        self.update(repository)
+        self.update(repository, counts)
 
     def search(self, search, attribute):
         return self.name.search(search, attribute)
 
-    def update(self, repository):
-        cache = self.app.repository_cache.get(repository)
+    def update(self, repository, counts=None):
+        # The counts come from the repository cache unless given (as
+        # when showing a snapshot).
+        if counts is None:
+            counts = self.app.repository_cache.get(repository)
+        self.subscribed = repository.subscribed
+        self.counts = dict(counts)
         if repository.subscribed:
-            if cache['unreviewed_prs'] > 0:
+            if counts['unreviewed_prs'] > 0:
                 style = 'unreviewed-repository'
             else:
                 style = 'subscribed-repository'
@@ -123,8 +130,8 @@ class RepositoryRow(urwid.Button):
         if self.mark:
             style = 'marked-repository'
         self.row_style.set_attr_map({None: style})
-        self.unreviewed_prs.set_text('%i ' % cache['unreviewed_prs'])
-        self.open_prs.set_text('%i ' % cache['open_prs'])
+        self.unreviewed_prs.set_text('%i ' % counts['unreviewed_prs'])
+        self.open_prs.set_text('%i ' % counts['open_prs'])
 
     def toggleMark(self):
         self.mark = not self.mark
@@ -177,6 +184,7 @@ class TopicRow(urwid.Button):
 
     def update(self, topic, unreviewed_prs=None, open_prs=None):
         self._setName(topic.name)
+        self.counts = dict(unreviewed_prs=unreviewed_prs, open_prs=open_prs)
         if unreviewed_prs is None:
             self.unreviewed_prs.set_text('')
         else:
@@ -249,7 +257,7 @@ class RepositoryListView(urwid.WidgetWrap, mywid.Searchable):
         return {'repository': row.repository_name,
                 'repo_path': repo_path}
 
-    def __init__(self, app):
+    def __init__(self, app, snapshot=None):
         super().__init__(urwid.Pile([]))
         self.log = logging.getLogger('hubtty.view.repository_list')
         self.searchInit()
@@ -261,7 +269,10 @@ class RepositoryListView(urwid.WidgetWrap, mywid.Searchable):
         self.open_topics = set()
         self.listbox = urwid.ListBox(urwid.SimpleFocusListWalker([]))
         self.header = RepositoryListHeader()
-        self.refresh()
+        if snapshot is None:
+            self.refresh()
+        else:
+            self.showSnapshot(snapshot)
         self._w.contents.append((app.header, ('pack', 1)))
         self._w.contents.append((urwid.Divider(),('pack', 1)))
         self._w.contents.append((urwid.AttrWrap(self.header, 'table-header'), ('pack', 1)))
@@ -294,7 +305,7 @@ class RepositoryListView(urwid.WidgetWrap, mywid.Searchable):
         else:
             del self.topic_rows[row.topic_key]
 
-    def _repositoryRow(self, i, repository, topic):
+    def _repositoryRow(self, i, repository, topic, counts=None):
         # Ensure that the row at i is the given repository.  If the row
         # already exists somewhere in the list, delete all rows
         # between i and the row and then update the row.  If the row
@@ -311,11 +322,12 @@ class RepositoryListView(urwid.WidgetWrap, mywid.Searchable):
                 break
             self._deleteRow(current_row)
         if not row:
-            row = RepositoryRow(self.app, repository, topic, self.onSelect)
+            row = RepositoryRow(self.app, repository, topic, self.onSelect,
+                                counts)
             self.listbox.body.insert(i, row)
             self.repository_rows[key] = row
         else:
-            row.update(repository)
+            row.update(repository, counts)
         return i+1
 
     def _topicRow(self, i, topic):
@@ -336,7 +348,7 @@ class RepositoryListView(urwid.WidgetWrap, mywid.Searchable):
             row.update(topic)
         return i + 1
 
-    def refresh(self):
+    def _setTitle(self):
         if self.subscribed:
             self.title = 'Subscribed repositories'
             self.short_title = self.title[:]
@@ -346,6 +358,46 @@ class RepositoryListView(urwid.WidgetWrap, mywid.Searchable):
             self.title = 'All repositories'
             self.short_title = self.title[:]
         self.app.status.update(title=self.title)
+
+    def getSnapshot(self):
+        """Return the rows shown as snapshot data (see :mod:`hubtty.snapshot`).
+
+        Returns None unless the list is filtered as when it is first
+        opened, since that is how a snapshot is shown.
+        """
+        if not (self.subscribed and self.unreviewed) or self.open_topics:
+            return None
+        rows = []
+        for row in self.listbox.body:
+            if isinstance(row, TopicRow):
+                rows.append(dict(type='topic', key=row.topic_key,
+                                 name=row.topic_name, **row.counts))
+            else:
+                rows.append(dict(type='repository', key=row.repository_key,
+                                 name=row.repository_name,
+                                 subscribed=row.subscribed, **row.counts))
+        return dict(rows=rows)
+
+    def showSnapshot(self, snapshot):
+        """Show the rows of a snapshot without querying the database."""
+        self._setTitle()
+        i = 0
+        for data in snapshot['rows']:
+            counts = dict(unreviewed_prs=data['unreviewed_prs'],
+                          open_prs=data['open_prs'])
+            if data['type'] == 'topic':
+                topic = types.SimpleNamespace(key=data['key'],
+                                              name=data['name'])
+                i = self._topicRow(i, topic)
+                self.topic_rows[topic.key].update(topic, **counts)
+            else:
+                repository = types.SimpleNamespace(
+                    key=data['key'], name=data['name'],
+                    subscribed=data['subscribed'])
+                i = self._repositoryRow(i, repository, None, counts)
+
+    def refresh(self):
+        self._setTitle()
         with self.app.db.getSession() as session:
             i = 0
             for repository in session.getRepositories(topicless=True,
@@ -120,6 +120,10 @@ class SideDiffLine(BaseDiffLine):
         map.update(build_syntax_focus_map())
         self._w = urwid.AttrMap(col, None, focus_map=map)
 
+    def setLine(self, old, new):
+        for widget, (ln, action, line) in zip(self.text_widgets, (old, new)):
+            widget.set_text(line)
+
     def search(self, search, attribute):
         ret = False
         for w in self.text_widgets:
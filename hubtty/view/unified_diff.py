@@ -97,6 +97,13 @@ class UnifiedDiffLine(BaseDiffLine):
         map.update(build_syntax_focus_map())
         self._w = urwid.AttrMap(col, None, focus_map=map)
 
+    def setLine(self, old, new):
+        if self.oldnew == gitrepo.OLD:
+            (ln, action, line) = old
+        else:
+            (ln, action, line) = new
+        self.text_widget.set_text(line)
+
     def search(self, search, attribute):
         return self.text_widget.search(search, attribute)
 
@@ -14,6 +14,8 @@
 
 """Shared test fixtures for sync tests."""
 
+import collections
+
 import pytest
 from unittest.mock import Mock, MagicMock
 
@@ -49,4 +51,6 @@ def mock_sync(mock_app):
     sync.delete = Mock()
     sync.query = Mock(return_value=SearchResult([], None))
     sync.submitTask = Mock()
+    sync.wasNotModified = Mock(return_value=False)
+    sync.counters = collections.Counter()
     return sync
@@ -14,6 +14,7 @@
 
 """Tests for check_helpers module."""
 
+import datetime
 from unittest.mock import Mock
 
 import dateutil.parser
@@ -609,3 +610,24 @@ class TestUpdateChecks:
         commit.createCheck.assert_called_once()
         assert created_check.state == 'success'
         assert created_check.url == 'http://new'
+
+    def test_reports_changes(self):
+        """The return value names the checks which were modified."""
+        session = Mock()
+        existing = self._make_check('ci/test', 'success')
+        existing.url = 'http://x'
+        existing.message = 'ok'
+        # Stored timestamps have no timezone.
+        existing.updated = datetime.datetime(2024, 1, 1, 10, 5)
+        commit = self._make_commit([existing])
+        checks_data = [{
+            'name': 'ci/test', 'state': 'success', 'url': 'http://x',
+            'message': 'ok',
+            'created': '2024-01-01T10:00:00Z',
+            'updated': '2024-01-01T10:05:00Z',
+        }]
+        assert update_checks(session, commit, checks_data) == set()
+
+        checks_data[0]['state'] = 'failure'
+        assert update_checks(session, commit, checks_data) == {'ci/test'}
+        assert existing.state == 'failure'
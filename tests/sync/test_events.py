@@ -34,6 +34,10 @@ class TestRepositoryAddedEvent:
         event = RepositoryAddedEvent(repository_key=456)
         assert 'repository_key:456' in repr(event)
 
+    def test_no_changed_sections(self):
+        """Repository events do not report pull request changes."""
+        assert RepositoryAddedEvent(repository_key=1).changedSections() == set()
+
 
 class TestPullRequestAddedEvent:
     """Tests for PullRequestAddedEvent."""
@@ -50,7 +54,6 @@ class TestPullRequestAddedEvent:
         assert event.review_flag_changed is True
         assert event.state_changed is True
         assert event.held_changed is False
-        assert event.related_pr_keys == set()
 
     def test_repr(self):
         """repr includes key information."""
@@ -75,7 +78,24 @@ class TestPullRequestUpdatedEvent:
         assert event.review_flag_changed is False
         assert event.state_changed is False
         assert event.held_changed is False
-        assert event.related_pr_keys == set()
+
+    def test_changed_sections_default_to_all(self):
+        """Without details, every section of the PR counts as changed."""
+        event = PullRequestUpdatedEvent(repository_key=1, pr_key=2)
+        assert event.commits_changed is True
+        assert event.messages_changed is True
+        assert event.checks_changed is True
+        assert event.labels_changed is True
+
+    def test_changed_sections(self):
+        """changedSections() lists the parts flagged as changed."""
+        event = PullRequestUpdatedEvent(
+            repository_key=1, pr_key=2, details_changed=False,
+            commits_changed=False, messages_changed=False,
+            labels_changed=False, state_changed=True,
+            changed_checks={'ci/test'})
+        assert event.changedSections() == {'state', 'checks'}
+        assert event.changed_checks == {'ci/test'}
 
     def test_custom_flags(self):
         """Flags can be set on creation."""
@@ -18,6 +18,7 @@ import pytest
 from unittest.mock import Mock, patch
 import json
 
+from hubtty import metrics
 from hubtty.sync.http import HTTPClient, SearchResult
 from hubtty.sync.exceptions import OfflineError, RateLimitError, RestrictedError
 
@@ -28,6 +29,10 @@ def mock_app():
     app = Mock()
     app.config.api_url = 'https://api.github.com/'
     app.config.token = 'test-token'
+    app.config.pagination_parallelism = 4
+    app.config.http_pool_size = 10
+    app.config.http_keepalive = 60
+    app.config.http2 = False
     app.error = Mock()
     return app
 
@@ -151,7 +156,7 @@ class TestHTTPGet:
         """GET returns parsed JSON."""
         response = Mock()
         response.status_code = 200
-        response.text = '{"id": 1, "name": "test"}'
+        response.content = b'{"id": 1, "name": "test"}'
         response.headers = {'X-RateLimit-Remaining': '100'}
         response.links = {}
 
@@ -164,7 +169,7 @@ class TestHTTPGet:
         """GET with search results extracts 'items' key."""
         response = Mock()
         response.status_code = 200
-        response.text = '{"total_count": 2, "items": [{"id": 1}, {"id": 2}]}'
+        response.content = b'{"total_count": 2, "items": [{"id": 1}, {"id": 2}]}'
         response.headers = {'X-RateLimit-Remaining': '100'}
         response.links = {}
 
@@ -178,14 +183,14 @@ class TestHTTPGet:
         # First response with 'next' link
         r1 = Mock()
         r1.status_code = 200
-        r1.text = '[{"id": 1}]'
+        r1.content = b'[{"id": 1}]'
         r1.headers = {'X-RateLimit-Remaining': '100'}
         r1.links = {'next': {'url': 'https://api.github.com/page2'}}
 
         # Second response without 'next' link
         r2 = Mock()
         r2.status_code = 200
-        r2.text = '[{"id": 2}]'
+        r2.content = b'[{"id": 2}]'
         r2.headers = {'X-RateLimit-Remaining': '99'}
         r2.links = {}
 
@@ -200,7 +205,7 @@ class TestHTTPGet:
         """GET includes custom headers."""
         response = Mock()
         response.status_code = 200
-        response.text = '{}'
+        response.content = b'{}'
         response.headers = {'X-RateLimit-Remaining': '100'}
         response.links = {}
 
@@ -216,7 +221,7 @@ class TestHTTPGet:
 
         r1 = Mock()
         r1.status_code = 200
-        r1.text = '{"id": 1}'
+        r1.content = b'{"id": 1}'
         r1.headers = {
             'X-RateLimit-Remaining': '0',
             'X-RateLimit-Reset': str(int(time.time()) + 1)
@@ -225,7 +230,7 @@ class TestHTTPGet:
 
         r2 = Mock()
         r2.status_code = 200
-        r2.text = '{"id": 1}'
+        r2.content = b'{"id": 1}'
         r2.headers = {'X-RateLimit-Remaining': '100'}
         r2.links = {}
 
@@ -240,14 +245,14 @@ class TestHTTPGet:
         # First response: rate limited with no reset time
         r1 = Mock()
         r1.status_code = 200
-        r1.text = '{"id": 1}'
+        r1.content = b'{"id": 1}'
         r1.headers = {'X-RateLimit-Remaining': '0'}
         r1.links = {}
 
         # Second response: success after waiting
         r2 = Mock()
         r2.status_code = 200
-        r2.text = '{"id": 1}'
+        r2.content = b'{"id": 1}'
         r2.headers = {'X-RateLimit-Remaining': '100'}
         r2.links = {}
 
@@ -263,7 +268,7 @@ class TestHTTPGet:
         # First response: 429 with retry-after
         r1 = Mock()
         r1.status_code = 429
-        r1.text = '{"message": "API rate limit exceeded"}'
+        r1.content = b'{"message": "API rate limit exceeded"}'
         r1.headers = {'Retry-After': '30', 'X-RateLimit-Remaining': '0'}
         r1.links = {}
         r1.url = 'https://api.github.com/repos/test'
@@ -271,7 +276,7 @@ class TestHTTPGet:
         # Second response: success
         r2 = Mock()
         r2.status_code = 200
-        r2.text = '{"id": 1}'
+        r2.content = b'{"id": 1}'
         r2.headers = {'X-RateLimit-Remaining': '100'}
         r2.links = {}
 
@@ -292,7 +297,7 @@ class TestHTTPGet:
         # First response: 429 with reset time
         r1 = Mock()
         r1.status_code = 429
-        r1.text = '{"message": "API rate limit exceeded"}'
+        r1.content = b'{"message": "API rate limit exceeded"}'
         r1.headers = {
             'X-RateLimit-Reset': str(reset_time),
             'X-RateLimit-Remaining': '0',
@@ -303,7 +308,7 @@ class TestHTTPGet:
         # Second response: success
         r2 = Mock()
         r2.status_code = 200
-        r2.text = '{"id": 1}'
+        r2.content = b'{"id": 1}'
         r2.headers = {'X-RateLimit-Remaining': '100'}
         r2.links = {}
 
@@ -327,7 +332,7 @@ class TestHTTPGet:
         # First response: 403 with rate limit headers
         r1 = Mock()
         r1.status_code = 403
-        r1.text = '{"message": "API rate limit exceeded"}'
+        r1.content = b'{"message": "API rate limit exceeded"}'
         r1.headers = {
             'X-RateLimit-Remaining': '0',
             'X-RateLimit-Reset': str(reset_time),
@@ -338,7 +343,7 @@ class TestHTTPGet:
         # Second response: success
         r2 = Mock()
         r2.status_code = 200
-        r2.text = '{"id": 1}'
+        r2.content = b'{"id": 1}'
         r2.headers = {'X-RateLimit-Remaining': '100'}
         r2.links = {}
 
@@ -355,7 +360,7 @@ class TestHTTPGet:
         # First response: 429 with no timing headers
         r1 = Mock()
         r1.status_code = 429
-        r1.text = '{"message": "You have exceeded a secondary rate limit"}'
+        r1.content = b'{"message": "You have exceeded a secondary rate limit"}'
         r1.headers = {}
         r1.links = {}
         r1.url = 'https://api.github.com/repos/test'
@@ -363,7 +368,7 @@ class TestHTTPGet:
         # Second response: success
         r2 = Mock()
         r2.status_code = 200
-        r2.text = '{"id": 1}'
+        r2.content = b'{"id": 1}'
         r2.headers = {'X-RateLimit-Remaining': '100'}
         r2.links = {}
 
@@ -380,6 +385,7 @@ class TestHTTPGet:
         response = Mock()
         response.status_code = 429
         response.text = '{"message": "API rate limit exceeded"}'
+        response.content = b'{"message": "API rate limit exceeded"}'
         response.headers = {
             'Retry-After': '45',
             'X-RateLimit-Remaining': '0',
@@ -425,7 +431,7 @@ class TestHTTPGet:
         # First response: rate limited with reset time in past
         r1 = Mock()
         r1.status_code = 200
-        r1.text = '{"id": 1}'
+        r1.content = b'{"id": 1}'
         r1.headers = {
             'X-RateLimit-Remaining': '0',
             'X-RateLimit-Reset': str(reset_time),
@@ -435,7 +441,7 @@ class TestHTTPGet:
         # Second response: success
         r2 = Mock()
         r2.status_code = 200
-        r2.text = '{"id": 1}'
+        r2.content = b'{"id": 1}'
         r2.headers = {'X-RateLimit-Remaining': '100'}
         r2.links = {}
 
@@ -457,6 +463,7 @@ class TestHTTPPost:
         response = Mock()
         response.status_code = 201
         response.text = '{"success": true}'
+        response.content = b'{"success": true}'
 
         with patch.object(http_client.session, 'post', return_value=response) as mock_post:
             result = http_client.post('repos/test', {'key': 'value'})
@@ -471,6 +478,7 @@ class TestHTTPPost:
         response = Mock()
         response.status_code = 201
         response.text = '{}'
+        response.content = b'{}'
 
         with patch.object(http_client.session, 'post', return_value=response) as mock_post:
             http_client.post('repos/test', {})
@@ -483,6 +491,7 @@ class TestHTTPPost:
         response = Mock()
         response.status_code = 201
         response.text = ''
+        response.content = b''
 
         with patch.object(http_client.session, 'post', return_value=response):
             result = http_client.post('repos/test', {})
@@ -499,6 +508,7 @@ class TestHTTPPost:
         r1 = Mock()
         r1.status_code = 429
         r1.text = '{"message": "API rate limit exceeded"}'
+        r1.content = b'{"message": "API rate limit exceeded"}'
         r1.headers = {
             'X-RateLimit-Remaining': '0',
             'X-RateLimit-Reset': str(reset_time),
@@ -509,6 +519,7 @@ class TestHTTPPost:
         r2 = Mock()
         r2.status_code = 201
         r2.text = '{"id": 123}'
+        r2.content = b'{"id": 123}'
         r2.headers = {'X-RateLimit-Remaining': '100'}
 
         with patch.object(http_client.session, 'post', side_effect=[r1, r2]):
@@ -529,6 +540,7 @@ class TestHTTPPost:
         r = Mock()
         r.status_code = 429
         r.text = '{"message": "API rate limit exceeded"}'
+        r.content = b'{"message": "API rate limit exceeded"}'
         r.headers = {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': str(reset_time)}
         r.url = 'https://api.github.com/repos/test'
 
@@ -546,6 +558,7 @@ class TestHTTPPut:
         response = Mock()
         response.status_code = 200
         response.text = ''
+        response.content = b''
         response.headers = {'X-RateLimit-Remaining': '100'}
 
         with patch.object(http_client.session, 'put', return_value=response) as mock_put:
@@ -560,6 +573,7 @@ class TestHTTPPut:
         response = Mock()
         response.status_code = 200
         response.text = '{"ignored": true}'
+        response.content = b'{"ignored": true}'
         response.headers = {'X-RateLimit-Remaining': '100'}
 
         with patch.object(http_client.session, 'put', return_value=response):
@@ -576,6 +590,7 @@ class TestHTTPPatch:
         response = Mock()
         response.status_code = 200
         response.text = ''
+        response.content = b''
         response.headers = {'X-RateLimit-Remaining': '100'}
 
         with patch.object(http_client.session, 'patch', return_value=response) as mock_patch:
@@ -594,6 +609,7 @@ class TestHTTPDelete:
         response = Mock()
         response.status_code = 200
         response.text = ''
+        response.content = b''
         response.headers = {'X-RateLimit-Remaining': '100'}
 
         with patch.object(http_client.session, 'delete', return_value=response) as mock_delete:
@@ -607,19 +623,20 @@ class TestHTTPDelete:
 class TestQuery:
     """Tests for query method."""
 
-    def test_query_calls_get(self, http_client):
-        """query() calls get with correct path."""
-        with patch.object(http_client, 'get', return_value=[]) as mock_get:
+    def test_query_calls_iter_pages(self, http_client):
+        """query() pages through the search with correct path."""
+        with patch.object(http_client, 'iter_pages',
+                          return_value=iter([[]])) as mock_iter:
             http_client.query('type:pr state:open')
 
-        mock_get.assert_called_once()
-        call_arg = mock_get.call_args[0][0]
+        mock_iter.assert_called_once()
+        call_arg = mock_iter.call_args[0][0]
         assert 'search/issues' in call_arg
         assert 'type:pr' in call_arg
 
     def test_query_returns_search_result(self, http_client):
         """query() returns a SearchResult namedtuple."""
-        with patch.object(http_client, 'get', return_value=[]):
+        with patch.object(http_client, 'iter_pages', return_value=iter([])):
             result = http_client.query('type:pr state:open')
 
         assert isinstance(result, SearchResult)
@@ -630,11 +647,11 @@ class TestQuery:
         """query() captures total_count from the search response."""
         response = Mock()
         response.status_code = 200
-        response.text = json.dumps({
+        response.content = json.dumps({
             'total_count': 1523,
             'incomplete_results': False,
             'items': [{'id': 1}, {'id': 2}],
-        })
+        }).encode()
         response.headers = {'X-RateLimit-Remaining': '100'}
         response.links = {}
 
@@ -649,11 +666,11 @@ class TestQuery:
         """total_count equals len(items) when results are not truncated."""
         response = Mock()
         response.status_code = 200
-        response.text = json.dumps({
+        response.content = json.dumps({
             'total_count': 2,
             'incomplete_results': False,
             'items': [{'id': 1}, {'id': 2}],
-        })
+        }).encode()
         response.headers = {'X-RateLimit-Remaining': '100'}
         response.links = {}
 
@@ -670,7 +687,7 @@ class TestETagSupport:
         """use_etag defaults to False; no If-None-Match header."""
         response = Mock()
         response.status_code = 200
-        response.text = '{"id": 1}'
+        response.content = b'{"id": 1}'
         response.headers = {'X-RateLimit-Remaining': '100'}
         response.links = {}
 
@@ -685,7 +702,7 @@ class TestETagSupport:
         """First request with use_etag=True has no If-None-Match."""
         response = Mock()
         response.status_code = 200
-        response.text = '{"id": 1}'
+        response.content = b'{"id": 1}'
         response.headers = {
             'X-RateLimit-Remaining': '100',
             'ETag': '"abc123"',
@@ -704,7 +721,7 @@ class TestETagSupport:
         """ETag and response are cached after a 200 with use_etag."""
         response = Mock()
         response.status_code = 200
-        response.text = '{"id": 1}'
+        response.content = b'{"id": 1}'
         response.headers = {
             'X-RateLimit-Remaining': '100',
             'ETag': '"abc123"',
@@ -729,6 +746,7 @@ class TestETagSupport:
 
         response = Mock()
         response.status_code = 304
+        response.content = b''
         response.headers = {'X-RateLimit-Remaining': '100'}
         response.links = {}
 
@@ -741,6 +759,27 @@ class TestETagSupport:
         sent_headers = mock_get.call_args.kwargs['headers']
         assert sent_headers['If-None-Match'] == '"abc123"'
 
+    def test_etag_metrics(self, http_client):
+        """Requests and conditional request hits are counted."""
+        http_client._etag_cache['repos/test'] = ('"abc123"', {"id": 1})
+        response = Mock()
+        response.status_code = 304
+        response.content = b''
+        response.headers = {'X-RateLimit-Remaining': '100'}
+        response.links = {}
+
+        m = metrics.reset()
+        with patch.object(http_client.session, 'get',
+                          return_value=response):
+            http_client.get('repos/test', use_etag=True)
+            http_client.get('repos/other', use_etag=True)
+
+        snapshot = m.snapshot()
+        assert snapshot['etag']['hits'] == 1
+        assert snapshot['etag']['misses'] == 0
+        assert snapshot['requests'][0]['count'] == 2
+        assert snapshot['requests'][0]['status'] == {'304': 2}
+
     def test_etag_200_updates_cache(self, http_client):
         """200 after a cached ETag updates the cache."""
         # Seed the cache with old data
@@ -750,7 +789,7 @@ class TestETagSupport:
 
         response = Mock()
         response.status_code = 200
-        response.text = '{"id": 2, "updated": true}'
+        response.content = b'{"id": 2, "updated": true}'
         response.headers = {
             'X-RateLimit-Remaining': '100',
             'ETag': '"new-etag"',
@@ -774,7 +813,7 @@ class TestETagSupport:
 
         response = Mock()
         response.status_code = 200
-        response.text = '{"id": 2}'
+        response.content = b'{"id": 2}'
         response.headers = {'X-RateLimit-Remaining': '100'}
         response.links = {}
 
@@ -790,7 +829,7 @@ class TestETagSupport:
         """ETag from first page caches the full paginated result."""
         r1 = Mock()
         r1.status_code = 200
-        r1.text = '[{"id": 1}]'
+        r1.content = b'[{"id": 1}]'
         r1.headers = {
             'X-RateLimit-Remaining': '100',
             'ETag': '"page1-etag"',
@@ -799,7 +838,7 @@ class TestETagSupport:
 
         r2 = Mock()
         r2.status_code = 200
-        r2.text = '[{"id": 2}]'
+        r2.content = b'[{"id": 2}]'
         r2.headers = {'X-RateLimit-Remaining': '99'}
         r2.links = {}
 
@@ -819,6 +858,7 @@ class TestETagSupport:
 
         response = Mock()
         response.status_code = 304
+        response.content = b''
         response.headers = {'X-RateLimit-Remaining': '100'}
         response.links = {}
 
@@ -837,7 +877,7 @@ class TestETagSupport:
 
         r1 = Mock()
         r1.status_code = 200
-        r1.text = '[{"id": 1}]'
+        r1.content = b'[{"id": 1}]'
         r1.headers = {
             'X-RateLimit-Remaining': '100',
             'ETag': '"new-etag"',
@@ -846,7 +886,7 @@ class TestETagSupport:
 
         r2 = Mock()
         r2.status_code = 200
-        r2.text = '[{"id": 2}]'
+        r2.content = b'[{"id": 2}]'
         r2.headers = {'X-RateLimit-Remaining': '99'}
         r2.links = {}
 
@@ -865,7 +905,7 @@ class TestETagSupport:
         """Response without ETag header does not cache."""
         response = Mock()
         response.status_code = 200
-        response.text = '{"id": 1}'
+        response.content = b'{"id": 1}'
         response.headers = {'X-RateLimit-Remaining': '100'}
         response.links = {}
 
@@ -879,7 +919,7 @@ class TestETagSupport:
         """Different paths have independent cache entries."""
         r1 = Mock()
         r1.status_code = 200
-        r1.text = '{"branch": "main"}'
+        r1.content = b'{"branch": "main"}'
         r1.headers = {
             'X-RateLimit-Remaining': '100',
             'ETag': '"etag-branches"',
@@ -888,7 +928,7 @@ class TestETagSupport:
 
         r2 = Mock()
         r2.status_code = 200
-        r2.text = '[{"name": "bug"}]'
+        r2.content = b'[{"name": "bug"}]'
         r2.headers = {
             'X-RateLimit-Remaining': '99',
             'ETag': '"etag-labels"',
@@ -907,3 +947,195 @@ class TestETagSupport:
     def test_etag_cache_empty_on_init(self, http_client):
         """ETag cache starts empty."""
         assert http_client._etag_cache == {}
+
+    def test_was_not_modified(self, http_client):
+        """wasNotModified() reports whether the last GET was a 304."""
+        http_client._etag_cache['repos/test'] = ('"abc123"', {"id": 1})
+        response = Mock()
+        response.status_code = 304
+        response.content = b''
+        response.headers = {'X-RateLimit-Remaining': '100'}
+        response.links = {}
+
+        assert not http_client.wasNotModified('repos/test')
+        with patch.object(http_client.session, 'get', return_value=response):
+            http_client.get('repos/test', use_etag=True)
+        assert http_client.wasNotModified('repos/test')
+
+        response.status_code = 200
+        response.content = b'{"id": 2}'
+        response.headers['ETag'] = '"def456"'
+        with patch.object(http_client.session, 'get', return_value=response):
+            http_client.get('repos/test', use_etag=True)
+        assert not http_client.wasNotModified('repos/test')
+
+
+def _page(content, next_url=None, etag=None):
+    response = Mock()
+    response.status_code = 200
+    response.content = content
+    response.headers = {'X-RateLimit-Remaining': '100'}
+    if etag:
+        response.headers['ETag'] = etag
+    response.links = {'next': {'url': next_url}} if next_url else {}
+    return response
+
+
+class TestPaging:
+    """Tests for the iter_pages generator."""
+
+    def test_iter_pages_yields_each_page(self, http_client):
+        """iter_pages() yields the parsed pages in order."""
+        pages = [_page(b'[{"id": 1}]', 'https://api.github.com/page2'),
+                 _page(b'[{"id": 2}, {"id": 3}]')]
+        with patch.object(http_client.session, 'get', side_effect=pages):
+            result = list(http_client.iter_pages('repos/test'))
+
+        assert result == [[{"id": 1}], [{"id": 2}, {"id": 3}]]
+
+    def test_partial_result_not_cached(self, http_client):
+        """The ETag is only cached once every page has been read."""
+        pages = [_page(b'[{"id": 1}]', 'https://api.github.com/page2',
+                       etag='"page1-etag"'),
+                 _page(b'[{"id": 2}]')]
+        with patch.object(http_client.session, 'get', side_effect=pages):
+            next(http_client.iter_pages('repos/test', use_etag=True))
+
+        assert 'repos/test' not in http_client._etag_cache
+
+    def test_etag_cache_independent_of_pages(self, http_client):
+        """Changing a yielded page does not alter the cached result."""
+        pages = [_page(b'[{"id": 1}]', 'https://api.github.com/page2',
+                       etag='"page1-etag"'),
+                 _page(b'[{"id": 2}]')]
+        with patch.object(http_client.session, 'get', side_effect=pages):
+            result = http_client.get('repos/test', use_etag=True)
+
+        result.append({"id": 3})
+        assert http_client._etag_cache['repos/test'][1] == [
+            {"id": 1}, {"id": 2}]
+
+    def test_received_body_not_logged_without_debug(self, http_client):
+        """The response body is only formatted when debug logging is on."""
+        http_client.log = Mock()
+        http_client.log.isEnabledFor.return_value = False
+        with patch.object(http_client.session, 'get',
+                          return_value=_page(b'[{"id": 1}]')):
+            http_client.get('repos/test')
+
+        for call in http_client.log.debug.call_args_list:
+            assert 'Received' not in call.args[0]
+
+    def test_query_stops_if_truncated(self, http_client):
+        """A search over the result cap can stop after its first page."""
+        first = _page(json.dumps({
+            'total_count': 2500,
+            'items': [{'id': 1}],
+        }).encode(), 'https://api.github.com/page2')
+        with patch.object(http_client.session, 'get',
+                          side_effect=[first]) as mock_get:
+            result = http_client.query('type:pr', stop_if_truncated=True)
+
+        assert mock_get.call_count == 1
+        assert result == SearchResult([{'id': 1}], 2500)
+
+
+class TestPrefetch:
+    """Pages after the first are fetched concurrently once `last` is known."""
+
+    BASE = 'https://api.github.com/repos/test/pulls?per_page=1&page=%d'
+
+    def _pages(self, count, remaining='100'):
+        pages = {}
+        for page in range(1, count + 1):
+            r = _page(json.dumps([{'id': page}]).encode())
+            r.headers['X-RateLimit-Remaining'] = remaining
+            if page < count:
+                r.links = {'next': {'url': self.BASE % (page + 1)},
+                           'last': {'url': self.BASE % count}}
+            pages[self.BASE % page] = r
+        return pages
+
+    def _get(self, pages, requested):
+        def get(url, **kwargs):
+            requested.append(url)
+            if url == 'https://api.github.com/repos/test/pulls':
+                url = self.BASE % 1
+            return pages[url]
+        return get
+
+    def test_page_urls(self, http_client):
+        """The following pages are derived from the next and last links."""
+        r = _page(b'[]')
+        r.links = {'next': {'url': self.BASE % 2},
+                   'last': {'url': self.BASE % 4}}
+        assert http_client._page_urls(r) == [
+            self.BASE % 2, self.BASE % 3, self.BASE % 4]
+
+    def test_page_urls_cursor_pagination(self, http_client):
+        """Listings without numbered pages are followed link by link."""
+        r = _page(b'[]')
+        r.links = {'next': {'url': 'https://api.github.com/x?after=abc'}}
+        assert http_client._page_urls(r) is None
+
+    def test_pages_in_order(self, http_client):
+        """Prefetched pages are yielded in order."""
+        requested = []
+        with patch.object(http_client.session, 'get',
+                          side_effect=self._get(self._pages(6), requested)):
+            result = http_client.get('repos/test/pulls')
+
+        assert [item['id'] for item in result] == [1, 2, 3, 4, 5, 6]
+        assert sorted(requested[1:]) == [self.BASE % p for p in range(2, 7)]
+
+    def test_sequential_when_low_on_quota(self, http_client):
+        """Pages are not fetched ahead if the rate limit cannot cover them."""
+        requested = []
+        pages = self._pages(4, remaining='2')
+        with patch.object(http_client.session, 'get',
+                          side_effect=self._get(pages, requested)), \
+                patch.object(http_client, '_prefetch') as mock_prefetch:
+            result = http_client.get('repos/test/pulls')
+
+        mock_prefetch.assert_not_called()
+        assert [item['id'] for item in result] == [1, 2, 3, 4]
+
+    def test_stopping_early_limits_prefetch(self, http_client):
+        """Only pages within the parallelism window are requested ahead."""
+        http_client.pagination_parallelism = 2
+        requested = []
+        with patch.object(http_client.session, 'get',
+                          side_effect=self._get(self._pages(5), requested)):
+            pages = http_client.iter_pages('repos/test/pulls')
+            next(pages)
+            next(pages)
+            pages.close()
+
+        assert self.BASE % 5 not in requested
+
+    def test_rate_limited_page_is_retried(self, http_client):
+        """Each prefetched page still waits out rate limits."""
+        pages = self._pages(3)
+        limited = Mock()
+        limited.status_code = 429
+        limited.content = b''
+        limited.headers = {'Retry-After': '1'}
+        limited.links = {}
+        responses = {self.BASE % 3: [limited, pages[self.BASE % 3]]}
+        requested = []
+        get = self._get(pages, requested)
+
+        def side_effect(url, **kwargs):
+            if responses.get(url):
+                requested.append(url)
+                return responses[url].pop(0)
+            return get(url, **kwargs)
+
+        with patch.object(http_client.session, 'get',
+                          side_effect=side_effect), \
+                patch('hubtty.sync.http.time.sleep') as mock_sleep:
+            result = http_client.get('repos/test/pulls')
+
+        mock_sleep.assert_called_once_with(1)
+        assert [item['id'] for item in result] == [1, 2, 3]
+        assert requested.count(self.BASE % 3) == 2
@@ -14,7 +14,8 @@
 
 """Tests for pull request synchronization tasks."""
 
-from unittest.mock import Mock, MagicMock, patch
+import datetime
+from unittest.mock import ANY, Mock, MagicMock, patch
 
 from hubtty.sync.tasks.pull_request import (
     SyncPullRequestTask,
@@ -463,6 +464,152 @@ class TestSyncPullRequestChecksScheduling:
             f"Expected no check re-poll task for closed PR, got {len(submitted)}"
 
 
+def _make_synced_pr():
+    """A local PR matching what _make_remote_pr() and SHA_A describe."""
+    commit = Mock()
+    commit.sha = SHA_A
+    commit.checks = []
+    pr = Mock()
+    pr.key = 100
+    pr.pr_id = PR_ID
+    pr.number = 1
+    pr.repository = Mock(key=1)
+    pr.repository.name = REPO
+    # Compares equal to whichever account the sync looks up.
+    pr.author = ANY
+    pr.state = 'open'
+    pr.title = 'Test PR'
+    pr.body = 'desc'
+    pr.updated = datetime.datetime(2025, 1, 2)
+    pr.additions = 10
+    pr.deletions = 2
+    pr.merged = False
+    pr.mergeable = True
+    pr.draft = False
+    pr.held = False
+    pr.labels = []
+    pr.commits = [commit]
+    pr.getCommitBySha = lambda sha: commit if sha == SHA_A else None
+    pr.createCommit.return_value = Mock(checks=[])
+    return pr
+
+
+class TestSyncPullRequestChangeSet:
+    """Verify the change set reported by SyncPullRequestTask."""
+
+    def _run(self, mock_sync, remote_pr, remote_commits):
+        _setup_sync(mock_sync, remote_pr, remote_commits,
+                    {SHA_B: _make_commit_detail(SHA_B)},
+                    local_pr=_make_synced_pr(),
+                    local_commits_with_files={SHA_A},
+                    statuses=[])
+        task = SyncPullRequestTask(PR_ID)
+        task._syncPullRequest(mock_sync)
+        return task.results
+
+    @patch('hubtty.sync.tasks.pull_request.gitrepo')
+    def test_no_event_when_unchanged(self, mock_gitrepo, mock_sync):
+        """A sync which finds nothing new emits no event."""
+        results = self._run(mock_sync, _make_remote_pr(),
+                            _make_remote_commits(SHA_A))
+        assert results == []
+
+    @patch('hubtty.sync.tasks.pull_request.gitrepo')
+    def test_reports_state_transition(self, mock_gitrepo, mock_sync):
+        """Changed fields and the state transition are reported."""
+        remote_pr = _make_remote_pr()
+        remote_pr['title'] = 'New title'
+        remote_pr['state'] = 'closed'
+        [event] = self._run(mock_sync, remote_pr,
+                            _make_remote_commits(SHA_A))
+        assert event.changedSections() == {'details', 'state'}
+        assert (event.old_state, event.new_state) == ('open', 'closed')
+        assert event.new_head_sha is None
+
+    @patch('hubtty.sync.tasks.pull_request.gitrepo')
+    def test_reports_new_head(self, mock_gitrepo, mock_sync):
+        """A pushed commit is reported with the new head SHA."""
+        [event] = self._run(mock_sync, _make_remote_pr(),
+                            _make_remote_commits(SHA_A, SHA_B))
+        assert event.changedSections() == {'commits'}
+        assert event.new_head_sha == SHA_B
+
+
+class TestSyncPullRequestSkipUnchanged:
+    """Verify that syncs finding nothing new skip the database update."""
+
+    def _run(self, mock_sync, not_modified=True, outdated=False,
+             updated_at='2025-01-02T00:00:00Z'):
+        remote_pr = _make_remote_pr()
+        remote_pr['updated_at'] = updated_at
+        local_pr = _make_synced_pr()
+        local_pr.outdated = outdated
+        _setup_sync(mock_sync, remote_pr, _make_remote_commits(SHA_A), {},
+                    local_pr=local_pr)
+        # Both sessions see the same, fully synced, pull request.
+        sessions = []
+        session = MagicMock()
+        session.getPullRequestByPullRequestID.return_value = local_pr
+
+        def get_session():
+            sessions.append(session)
+            cm = MagicMock()
+            cm.__enter__ = Mock(return_value=session)
+            cm.__exit__ = Mock(return_value=False)
+            return cm
+
+        mock_sync.app.db.getSession = get_session
+        mock_sync.wasNotModified = Mock(return_value=not_modified)
+        for commit in local_pr.commits:
+            commit.files = [Mock()]
+        task = SyncPullRequestTask(PR_ID)
+        task._syncPullRequest(mock_sync)
+        self.sessions = sessions
+        return task
+
+    def _wrote(self, mock_sync):
+        # The pre-fetch read is followed by a session for the update.
+        return len(self.sessions) > 1
+
+    @patch('hubtty.sync.tasks.pull_request.gitrepo')
+    def test_skips_when_not_modified(self, mock_gitrepo, mock_sync):
+        """All 304s and an unchanged update time skip the sync."""
+        task = self._run(mock_sync)
+        assert task.results == []
+        assert not self._wrote(mock_sync)
+        assert mock_sync.counters['pull_request_syncs_skipped'] == 1
+        assert mock_sync.counters['pull_request_syncs'] == 1
+
+    @patch('hubtty.sync.tasks.pull_request.gitrepo')
+    def test_pending_checks_rechecked_when_skipped(self, mock_gitrepo,
+                                                   mock_sync):
+        """An unchanged pull request still has its pending checks polled."""
+        self._run(mock_sync)
+        assert mock_sync.counters['pull_request_syncs_skipped'] == 1
+        [task] = [call.args[0] for call in mock_sync.submitTask.call_args_list
+                  if isinstance(call.args[0], SyncPullRequestChecksTask)]
+        assert task.pr_id == PR_ID
+
+    @patch('hubtty.sync.tasks.pull_request.gitrepo')
+    def test_syncs_when_modified(self, mock_gitrepo, mock_sync):
+        """A response with new data is applied."""
+        self._run(mock_sync, not_modified=False)
+        assert self._wrote(mock_sync)
+        assert mock_sync.counters['pull_request_syncs_skipped'] == 0
+
+    @patch('hubtty.sync.tasks.pull_request.gitrepo')
+    def test_syncs_when_updated(self, mock_gitrepo, mock_sync):
+        """A newer update time than stored is applied."""
+        self._run(mock_sync, updated_at='2025-01-03T00:00:00Z')
+        assert self._wrote(mock_sync)
+
+    @patch('hubtty.sync.tasks.pull_request.gitrepo')
+    def test_syncs_when_outdated(self, mock_gitrepo, mock_sync):
+        """A pull request whose last sync failed is synced again."""
+        self._run(mock_sync, outdated=True)
+        assert self._wrote(mock_sync)
+
+
 def _make_checks_task_pr(state='open'):
     """Create a minimal mock PR for SyncPullRequestChecksTask tests."""
     commit = Mock()
@@ -568,3 +715,35 @@ class TestSyncPullRequestChecksTaskRun:
 
         assert task.followup is None, \
             "Expected no followup for a closed PR"
+
+    @patch('hubtty.sync.tasks.pull_request.update_checks')
+    @patch('hubtty.sync.tasks.pull_request.fetch_checks')
+    def test_event_reports_only_checks(
+            self, mock_fetch, mock_update, mock_sync):
+        """The emitted event only reports the changed checks."""
+        mock_fetch.return_value = []
+        mock_update.return_value = {'ci/test'}
+        pr_mock = _make_checks_task_pr(state='closed')
+        _setup_checks_task_sync(mock_sync, pr_mock)
+
+        task = SyncPullRequestChecksTask(PR_ID, REPO, attempt=0)
+        task.run(mock_sync)
+
+        [event] = task.results
+        assert event.changedSections() == {'checks'}
+        assert event.changed_checks == {'ci/test'}
+
+    @patch('hubtty.sync.tasks.pull_request.update_checks')
+    @patch('hubtty.sync.tasks.pull_request.fetch_checks')
+    def test_no_event_when_checks_unchanged(
+            self, mock_fetch, mock_update, mock_sync):
+        """Polling checks which did not change emits no event."""
+        mock_fetch.return_value = []
+        mock_update.return_value = set()
+        pr_mock = _make_checks_task_pr(state='closed')
+        _setup_checks_task_sync(mock_sync, pr_mock)
+
+        task = SyncPullRequestChecksTask(PR_ID, REPO, attempt=0)
+        task.run(mock_sync)
+
+        assert task.results == []
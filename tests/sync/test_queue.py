@@ -135,6 +135,17 @@ class TestMultiQueueSize:
         q.put("low", LOW_PRIORITY)
         assert q.qsize() == 3
 
+    def test_depths(self):
+        """depths() counts the queued items of each priority."""
+        q = MultiQueue([HIGH_PRIORITY, NORMAL_PRIORITY, LOW_PRIORITY])
+        q.put("running", NORMAL_PRIORITY)
+        q.get()
+        q.put("high", HIGH_PRIORITY)
+        q.put("low 1", LOW_PRIORITY)
+        q.put("low 2", LOW_PRIORITY)
+        assert q.depths() == {HIGH_PRIORITY: 1, NORMAL_PRIORITY: 0,
+                              LOW_PRIORITY: 2}
+
 
 class TestMultiQueueFind:
     """Tests for find functionality."""
@@ -28,6 +28,10 @@ def mock_app():
     app = Mock()
     app.config.api_url = "https://api.github.com/"
     app.config.token = "test-token"
+    app.config.pagination_parallelism = 4
+    app.config.http_pool_size = 10
+    app.config.http_keepalive = 60
+    app.config.http2 = False
     app.config.expire_age = "2 months"
     app.error = Mock()
     app.db.getSession = Mock()
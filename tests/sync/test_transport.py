@@ -0,0 +1,202 @@
+# Copyright The Hubtty Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Tests for the HTTP session factory and connection stats."""
+
+import http.server
+import sys
+import threading
+import types
+from unittest.mock import patch
+
+import pytest
+import requests
+
+from hubtty.sync import transport
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'[]'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:%d/' % httpd.server_port
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _config(**kw):
+    return types.SimpleNamespace(**{
+        'http2': False, 'http_pool_size': 10, 'http_keepalive': 60, **kw})
+
+
+class TestPoolAdapter:
+    """The default session reuses connections and counts them."""
+
+    def test_connections_are_reused(self, server):
+        stats = transport.ConnectionStats()
+        session = transport.make_session(_config(), stats)
+        for _ in range(3):
+            assert session.get(server + 'repos').status_code == 200
+        assert stats.snapshot() == {
+            '127.0.0.1': {'requests': 3, 'connections': 1}}
+
+    def test_pool_size(self):
+        session = transport.make_session(_config(http_pool_size=32),
+                                         transport.ConnectionStats())
+        assert session.get_adapter('https://api.github.com/')._pool_maxsize == 32
+
+    def test_idle_connections_expire(self, server):
+        stats = transport.ConnectionStats()
+        session = transport.make_session(_config(http_keepalive=5), stats)
+        with patch.object(transport.time, 'monotonic') as monotonic:
+            for now in (100, 104, 110):
+                monotonic.return_value = now
+                assert session.get(server + 'repos').status_code == 200
+        # The connection was idle for 4 seconds, then for 6.
+        assert stats.snapshot() == {
+            '127.0.0.1': {'requests': 3, 'connections': 2}}
+
+    def test_keepalive_disabled(self, server):
+        stats = transport.ConnectionStats()
+        session = transport.make_session(_config(http_keepalive=0), stats)
+        with patch.object(transport.time, 'monotonic') as monotonic:
+            for now in (100, 10000):
+                monotonic.return_value = now
+                assert session.get(server + 'repos').status_code == 200
+        assert stats.snapshot()['127.0.0.1']['connections'] == 1
+
+    def test_proxy_connections(self, server):
+        stats = transport.ConnectionStats()
+        session = transport.make_session(_config(http_keepalive=5), stats)
+        proxies = {'http': server}
+        with patch.object(transport.time, 'monotonic') as monotonic:
+            for now in (100, 101, 110):
+                monotonic.return_value = now
+                response = session.get('http://github.invalid/repos',
+                                       proxies=proxies)
+                assert response.status_code == 200
+        # Requests are counted for the target host, connections for the
+        # proxy they are made to.
+        assert stats.snapshot() == {
+            'github.invalid': {'requests': 3},
+            '127.0.0.1': {'connections': 2}}
+
+
+class TestHTTP2:
+    """HTTP/2 is only used when httpx is available."""
+
+    def test_falls_back_without_httpx(self):
+        with patch.dict(sys.modules, {'httpx': None}):
+            session = transport.make_session(_config(http2=True),
+                                             transport.ConnectionStats())
+        assert session.http_version == 'HTTP/1.1'
+
+    def test_http2_session(self, server):
+        pytest.importorskip('httpx')
+        pytest.importorskip('h2')
+        stats = transport.ConnectionStats()
+        session = transport.make_session(
+            _config(http2=True, http_pool_size=32), stats)
+        assert session.http_version == 'HTTP/2'
+        for _ in range(3):
+            assert session.get(server + 'repos').status_code == 200
+        assert stats.snapshot() == {
+            '127.0.0.1': {'requests': 3, 'connections': 1}}
+
+
+class _FakeClient:
+    """Stands in for httpx.Client, answering with *handler*."""
+
+    handler = None
+
+    def __init__(self, http2, limits):
+        self.http2 = http2
+        self.limits = limits
+        self.headers = {}
+
+    def request(self, method, url, content, timeout, headers, extensions):
+        return self.handler(method, url, extensions['trace'])
+
+
+def _fake_httpx(handler):
+    class TransportError(Exception):
+        pass
+
+    class TimeoutException(TransportError):
+        pass
+
+    client = type('Client', (_FakeClient,), {'handler': staticmethod(handler)})
+    return types.SimpleNamespace(
+        Client=client, Limits=types.SimpleNamespace,
+        TransportError=TransportError, TimeoutException=TimeoutException)
+
+
+class TestHTTP2Session:
+    """HTTP2Session adapts httpx to what sync expects of requests."""
+
+    def _session(self, handler, **kw):
+        httpx = _fake_httpx(handler)
+        stats = transport.ConnectionStats()
+        with patch.dict(sys.modules, {'httpx': httpx}):
+            session = transport.make_session(_config(http2=True, **kw), stats)
+        return httpx, stats, session
+
+    def test_limits(self):
+        _, _, session = self._session(None, http_pool_size=32)
+        assert session.client.http2
+        assert session.client.limits.max_connections == 32
+        assert session.client.limits.keepalive_expiry == 60
+        _, _, session = self._session(None, http_keepalive=0)
+        assert session.client.limits.keepalive_expiry is None
+
+    def test_stats(self):
+        def handler(method, url, trace):
+            if url.endswith('/first'):
+                trace('connection.connect_tcp.complete', {})
+            return types.SimpleNamespace(status_code=200)
+        _, stats, session = self._session(handler)
+        session.get('https://api.github.com/first')
+        session.post('https://api.github.com/second')
+        assert stats.snapshot() == {
+            'api.github.com': {'requests': 2, 'connections': 1}}
+
+    def test_timeout(self):
+        def handler(method, url, trace):
+            raise httpx.TimeoutException('timed out')
+        httpx, _, session = self._session(handler)
+        with pytest.raises(requests.exceptions.ReadTimeout):
+            session.get('https://api.github.com/')
+
+    def test_transport_error(self):
+        def handler(method, url, trace):
+            raise httpx.TransportError('connection reset')
+        httpx, _, session = self._session(handler)
+        with pytest.raises(requests.ConnectionError):
+            session.get('https://api.github.com/')
@@ -0,0 +1,181 @@
+# Copyright The Hubtty Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Tests for running view work off the UI thread."""
+
+import concurrent.futures
+import functools
+import logging
+import queue
+import threading
+import types
+from unittest import mock
+
+from hubtty.app import App, BackgroundJob
+import hubtty.view
+
+
+def _make_harness():
+    """Create a minimal stand-in with the attributes the runner needs."""
+    obj = types.SimpleNamespace()
+    obj.log = logging.getLogger('hubtty.test')
+    obj.job_queue = queue.Queue()
+    obj.job_pipe = 99  # dummy fd
+    obj.background_jobs = set()
+    obj.errors = []
+    obj.error = obj.errors.append
+    obj.screens = []
+    obj.frame = types.SimpleNamespace(body=None)
+    return obj
+
+
+def _deliver(harness, job):
+    """Run *job* synchronously and hand its result to the main thread."""
+    harness.background_jobs.add(job)
+    with mock.patch('hubtty.app.os.write') as mock_write:
+        App._runBackgroundWorker(harness, job)
+    mock_write.assert_called_once_with(99, b'job\n')
+    App._jobPipeInput(harness)
+
+
+class TestBackgroundJobs:
+    """Results of background jobs are delivered through the job pipe."""
+
+    def test_result_delivered(self):
+        harness = _make_harness()
+        results = []
+        job = BackgroundJob(lambda job: 42, results.append, None, None)
+        _deliver(harness, job)
+        assert results == [42]
+        assert not harness.background_jobs
+
+    def test_cancelled_result_discarded(self):
+        harness = _make_harness()
+        results = []
+        job = BackgroundJob(lambda job: 42, results.append, None, None)
+        job.cancel()
+        _deliver(harness, job)
+        assert results == []
+
+    def test_error_goes_to_errback(self):
+        harness = _make_harness()
+        errors = []
+
+        def fail(job):
+            raise ValueError('boom')
+
+        job = BackgroundJob(fail, None, errors.append, None)
+        _deliver(harness, job)
+        assert [str(e) for e in errors] == ['boom']
+
+    def test_display_error_shown_without_errback(self):
+        harness = _make_harness()
+
+        def fail(job):
+            raise hubtty.view.DisplayError('missing commits')
+
+        _deliver(harness, BackgroundJob(fail, None, None, None))
+        assert harness.errors == ['missing commits']
+
+    def test_jobs_of_closed_screens_are_cancelled(self):
+        harness = _make_harness()
+        current, previous, closed = object(), object(), object()
+        harness.frame.body = current
+        harness.screens = [previous]
+        jobs = [BackgroundJob(None, None, None, owner)
+                for owner in (current, previous, closed, None)]
+        harness.background_jobs.update(jobs)
+        App._cancelOrphanedJobs(harness)
+        assert [job.cancelled for job in jobs] == [False, False, True, False]
+
+    def test_workers_are_bounded(self):
+        harness = _make_harness()
+        harness._runBackgroundWorker = functools.partial(
+            App._runBackgroundWorker, harness)
+        harness.job_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=2)
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def work(job):
+            with lock:
+                running.append(job)
+                peak.append(len(running))
+            threading.Event().wait(0.01)
+            with lock:
+                running.remove(job)
+            return job
+
+        results = []
+        with mock.patch('hubtty.app.os.write'):
+            jobs = [App.runInBackground(harness, work, results.append)
+                    for _ in range(10)]
+            harness.job_executor.shutdown(wait=True)
+        App._jobPipeInput(harness)
+        assert max(peak) <= 2
+        assert sorted(map(id, results)) == sorted(map(id, jobs))
+        assert not harness.background_jobs
+
+    def test_check_git_repo_job_arguments(self):
+        from hubtty.view.pull_request import PullRequestView
+        pr = types.SimpleNamespace(
+            repository=types.SimpleNamespace(name='org/repo'), number=7,
+            pr_id='org/repo/pulls/7',
+            commits=[types.SimpleNamespace(parent='a' * 40, sha='b' * 40)])
+        db = mock.MagicMock()
+        session = db.getSession.return_value.__enter__.return_value
+        session.getPullRequest.return_value = pr
+        funcs = []
+        view = types.SimpleNamespace(
+            pr_key=1, _checkGitRepo=mock.Mock(),
+            _gitRepoChecked=None, _gitRepoCheckFailed=None,
+            app=types.SimpleNamespace(
+                db=db, runInBackground=lambda func, callback, errback, owner:
+                funcs.append(func)))
+        PullRequestView.checkGitRepo(view)
+        job = BackgroundJob(funcs[0], None, None, view)
+        job.func(job)
+        view._checkGitRepo.assert_called_once_with(
+            job, pr_repository_name='org/repo', pr_number=7,
+            pr_id='org/repo/pulls/7', shas={'a' * 40, 'b' * 40})
+
+    def test_diffs_wait_for_commits(self):
+        from hubtty.view.pull_request import PullRequestView
+        app = mock.Mock()
+        app.config.diff_view = 'unified'
+        view = types.SimpleNamespace(
+            app=app, commits_ready=False, commits_error=None,
+            prefetchDiffs=mock.Mock())
+        with mock.patch('hubtty.view.pull_request.view_unified_diff'):
+            PullRequestView.diff(view, 1)
+            assert not app.changeScreen.called
+            assert app.error.call_args.kwargs['title'] == 'Fetching commits'
+            PullRequestView._gitRepoChecked(view, None)
+            PullRequestView.diff(view, 1)
+        assert app.changeScreen.called
+        view.prefetchDiffs.assert_called_once_with()
+
+    def test_diffs_disabled_when_commits_are_missing(self):
+        from hubtty.view.pull_request import PullRequestView
+        app = mock.Mock()
+        view = types.SimpleNamespace(app=app, commits_ready=False,
+                                     commits_error=None)
+        error = hubtty.view.DisplayError(
+            "Git commits not present in local repository")
+        PullRequestView._gitRepoCheckFailed(view, error)
+        PullRequestView.diff(view, 1)
+        assert not app.changeScreen.called
+        assert app.error.call_args_list[-1].args == (
+            "Git commits not present in local repository",)
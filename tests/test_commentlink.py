@@ -14,9 +14,9 @@
 
 """Tests for commentlink patterns (issue/PR auto-linking)."""
 
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
-from hubtty.commentlink import CommentLink
+from hubtty.commentlink import CommentLink, Scanner
 from hubtty import mywid
 
 
@@ -267,3 +267,136 @@ class TestNonStringChunks:
         links = _link_objects(result[1:])
         assert len(links) == 1
         assert links[0].text == '#1'
+
+
+# ---------------------------------------------------------------------------
+# Single-pass scanner
+# ---------------------------------------------------------------------------
+
+TEST_RESULT_CONFIG = {
+    'match': r"^- (?P<job>\S+) (?P<url>\S+) : (?P<result>\w+)",
+    'test-result': "{job}",
+    'replacements': [
+        dict(link=dict(text="{job}", url="{url}")),
+        dict(text=" {result}")],
+}
+
+
+class TestScanner:
+    def _commentlinks(self):
+        return [CommentLink(TEST_RESULT_CONFIG),
+                CommentLink(CROSS_REPO_CONFIG),
+                CommentLink(SAME_REPO_CONFIG)]
+
+    def test_matches_sequential_run(self):
+        commentlinks = self._commentlinks()
+        app = _mock_app()
+        context = {'repository': 'o/r'}
+        chunks = ['See a/b#1, #2 and #3', ('md-strong', 'x'), '', 'c/d#4']
+        expected = chunks
+        for cl in commentlinks:
+            expected = cl.run(app, expected, context)
+        result = Scanner(commentlinks).run(app, chunks, context)
+
+        def texts(markup):
+            return [item.text if isinstance(item, mywid.Link) else item
+                    for item in markup]
+        assert texts(result) == texts(expected)
+
+    def test_groups_with_the_same_name_are_kept_apart(self):
+        scanner = Scanner(self._commentlinks())
+        matches = scanner.scan('x/y#5 #6')
+        assert [(i, data) for _, _, i, data in matches] == [
+            (1, {'cross_repo': 'x/y', 'number': '5'}),
+            (2, {'number': '6'})]
+
+    def test_missing_context_keeps_text(self):
+        cl = CommentLink(dict(match=r"#(?P<number>\d+)",
+                              replacements=[dict(text="{repository}")]))
+        result = Scanner([cl]).run(_mock_app(), ['a #1 b'], None)
+        assert ''.join(result) == 'a #1 b'
+
+    def test_test_results_match_per_commentlink(self):
+        commentlinks = self._commentlinks()
+        app = _mock_app()
+        text = ('Build finished, see #3.\n\n'
+                '- unit https://ci/1 : SUCCESS\n'
+                '- lint https://ci/2 : FAILURE\n')
+        expected = {}
+        for cl in commentlinks:
+            expected.update(cl.getTestResults(app, text))
+        results = Scanner(commentlinks).getTestResults(app, text)
+        assert list(results) == list(expected) == ['unit', 'lint']
+        assert results['lint'][1] == (None, ' FAILURE')
+
+    def test_scans_are_cached(self):
+        scanner = Scanner(self._commentlinks())
+        assert scanner.scan('see #1') is scanner.scan('see #1')
+
+    def test_earlier_commentlink_wins_overlap(self):
+        """The URL of a test result is not linked separately."""
+        url = CommentLink(dict(match=r"(?P<url>https?://\S*)",
+                               replacements=[dict(text="url")]))
+        scanner = Scanner([CommentLink(TEST_RESULT_CONFIG), url])
+        matches = scanner.scan('- unit https://ci/1 : SUCCESS https://x')
+        assert [(start, i) for start, _, i, _ in matches] == [(0, 0), (30, 1)]
+
+    def test_configuration_order_wins_over_position(self):
+        """An earlier commentlink wins even where a later one starts first."""
+        first = CommentLink(dict(match=r"#(?P<n>\d+)",
+                                 replacements=[dict(text="A{n}")]))
+        second = CommentLink(dict(match=r"PR #(?P<n>\d+)",
+                                  replacements=[dict(text="B{n}")]))
+        app = _mock_app()
+        chunks = ['see PR #12, PR 3']
+        expected = second.run(app, first.run(app, chunks))
+        result = Scanner([first, second]).run(app, chunks)
+        assert result == expected
+        assert result[:3] == ['see PR ', (None, 'A12'), ', PR 3']
+
+    def test_test_results_ignore_display_precedence(self):
+        """A link configured first does not hide test results."""
+        url = CommentLink(dict(match=r"(?P<url>https?://\S+)",
+                               replacements=[dict(text="url")]))
+        commentlinks = [url, CommentLink(TEST_RESULT_CONFIG)]
+        text = ('- unit https://ci/1 : SUCCESS\n'
+                '- lint https://ci/2 : FAILURE\n')
+        results = Scanner(commentlinks).getTestResults(_mock_app(), text)
+        assert list(results) == ['unit', 'lint']
+
+    def test_patterns_are_combined(self):
+        scanner = Scanner(self._commentlinks())
+        assert scanner._combined is not None
+        assert [i for _, _, i, _ in scanner.scan('a/b#1 #2')] == [1, 2]
+
+    def test_uncombinable_patterns(self):
+        """Patterns with global flags are matched one by one instead."""
+        shout = CommentLink(dict(match=r"(?i)fixme",
+                                 replacements=[dict(text="!")]))
+        scanner = Scanner([CommentLink(SAME_REPO_CONFIG), shout])
+        assert scanner._combined is None
+        matches = scanner.scan('FIXME #1')
+        assert [(start, i) for start, _, i, _ in matches] == [(0, 1), (6, 0)]
+
+    def test_run_uses_cached_scan(self):
+        scanner = Scanner(self._commentlinks())
+        scanner.run(_mock_app(), ['see #1'], {'repository': 'o/r'})
+        with patch.object(scanner, '_find') as find:
+            scanner.run(_mock_app(), ['see #1'], {'repository': 'o/r'})
+        assert not find.called
+
+    def test_backreferences_of_later_commentlinks(self):
+        cl = CommentLink(dict(match=r"(?P<c>\w)(\w)\2",
+                              replacements=[dict(text="{c}")]))
+        scanner = Scanner([CommentLink(CROSS_REPO_CONFIG), cl])
+        assert scanner._combined is not None
+        matches = scanner.scan('xab abb')
+        assert [(start, i) for start, _, i, _ in matches] == [(4, 1)]
+
+    def test_backreferences(self):
+        cl = CommentLink(dict(match=r"(\w)\1",
+                              replacements=[dict(text="double")]))
+        scanner = Scanner([cl, CommentLink(SAME_REPO_CONFIG)])
+        result = scanner.run(_mock_app(), ['aa #1'], {'repository': 'o/r'})
+        assert result[0] == (None, 'double')
+        assert _link_texts(result) == [' ', '#1']
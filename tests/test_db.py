@@ -0,0 +1,134 @@
+# Copyright The Hubtty Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Tests for opening and migrating the database, and query tracing."""
+
+import logging
+import threading
+import types
+from unittest.mock import patch
+
+import alembic.command
+import alembic.config
+import alembic.script
+import pytest
+
+import sqlalchemy.exc
+from sqlalchemy import text
+
+from hubtty import db
+from hubtty import sampling
+from hubtty import search
+
+
+def _open(path, **kw):
+    app = types.SimpleNamespace()
+    return db.Database(app, 'sqlite:///%s' % path,
+                       search.SearchCompiler(lambda: None), **kw)
+
+
+class TestMigrate:
+    """Alembic only runs when the schema is not at the head revision."""
+
+    def test_head_revision_is_current(self):
+        """HEAD_REVISION names the latest migration script."""
+        config = alembic.config.Config()
+        config.set_main_option('script_location', 'hubtty:alembic')
+        script = alembic.script.ScriptDirectory.from_config(config)
+        assert script.get_current_head() == db.HEAD_REVISION
+
+    def test_new_database_is_migrated(self, tmp_path):
+        database = _open(tmp_path / 'hubtty.db')
+        with database.engine.connect() as conn:
+            assert database.getRevision(conn) == db.HEAD_REVISION
+
+    def test_current_database_skips_alembic(self, tmp_path):
+        _open(tmp_path / 'hubtty.db')
+        with patch.object(alembic.command, 'upgrade') as upgrade:
+            _open(tmp_path / 'hubtty.db')
+        assert not upgrade.called
+
+    def test_outdated_database_is_upgraded(self, tmp_path):
+        database = _open(tmp_path / 'hubtty.db')
+        with database.engine.begin() as conn:
+            conn.execute(text(
+                "UPDATE alembic_version SET version_num = 'f3a1b2c4d5e6'"))
+        with patch.object(alembic.command, 'upgrade') as upgrade:
+            _open(tmp_path / 'hubtty.db')
+        assert upgrade.called
+
+
+class FakeView:
+    def __init__(self, database):
+        self.database = database
+
+    def refresh(self):
+        with self.database.getSession() as session:
+            session.getRepositories()
+
+
+class TestQueryTracing:
+    """SQL statements are counted, timed and attributed."""
+
+    def test_session_counts(self, tmp_path):
+        database = _open(tmp_path / 'hubtty.db')
+        stats = database.queryStats()
+        start = stats.snapshot()
+        with database.getSession() as session:
+            session.getRepositories()
+            session.getRepositories()
+        assert session.queries >= 2
+        assert session.query_time > 0
+        count, seconds = stats.since(start)
+        assert count == session.queries
+        assert seconds == pytest.approx(session.query_time)
+
+    def test_stats_are_per_thread(self, tmp_path):
+        database = _open(tmp_path / 'hubtty.db')
+        stats = database.queryStats()
+        thread = threading.Thread(target=FakeView(database).refresh)
+        start = stats.snapshot()
+        thread.start()
+        thread.join()
+        assert stats.since(start) == (0, 0.0)
+
+    def test_slow_query_origin(self, tmp_path, caplog):
+        database = _open(tmp_path / 'hubtty.db', slow_query_threshold=0)
+        with caplog.at_level(logging.WARNING, logger='hubtty.db'):
+            FakeView(database).refresh()
+            with sampling.activity('SyncRepositoryTask'):
+                with database.getSession() as session:
+                    session.getRepositories()
+        messages = [r.getMessage() for r in caplog.records]
+        assert any('from FakeView.refresh: SELECT' in m for m in messages)
+        assert any('from SyncRepositoryTask: SELECT' in m for m in messages)
+
+    def test_failed_statement(self, tmp_path):
+        database = _open(tmp_path / 'hubtty.db')
+        stats = database.queryStats()
+        with pytest.raises(sqlalchemy.exc.OperationalError):
+            with database.getSession() as session:
+                session.session().execute(text('SELECT * FROM missing'))
+        start = stats.snapshot()
+        with database.getSession() as session:
+            session.getRepositories()
+        count, seconds = stats.since(start)
+        assert count == session.queries >= 1
+        assert 0 < seconds < 60
+
+    def test_fast_queries_not_logged(self, tmp_path, caplog):
+        database = _open(tmp_path / 'hubtty.db', slow_query_threshold=60)
+        with caplog.at_level(logging.WARNING, logger='hubtty.db'):
+            FakeView(database).refresh()
+        assert not caplog.records
@@ -0,0 +1,189 @@
+# Copyright The Hubtty Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Tests for the diff cache and prefetcher."""
+
+import threading
+import types
+from unittest import mock
+
+from hubtty.diffcache import DiffCache, DiffPrefetcher
+from hubtty.gitrepo import DiffFile
+
+
+def _make_file(nlines):
+    f = DiffFile()
+    f.oldname = f.newname = 'file.txt'
+    f.old_lineno = f.new_lineno = 1
+    for i in range(nlines):
+        f.addContextLine('line %d' % i)
+    f.finalize()
+    f.patch_lines = nlines
+    return f
+
+
+class FakeRepo:
+    def __init__(self, path='/repo', nlines=10):
+        self.path = path
+        self.nlines = nlines
+        self.calls = []
+
+    def iterDiff(self, old, new, **options):
+        self.calls.append((old, new, options))
+        yield _make_file(self.nlines)
+
+
+class TestDiffCache:
+    """DiffCache stores diffs and hands out independent copies."""
+
+    def test_second_lookup_is_cached(self):
+        cache = DiffCache()
+        repo = FakeRepo()
+        cache.diff(repo, 'a', 'b', syntax_highlighting=True)
+        cache.diff(repo, 'a', 'b', syntax_highlighting=True)
+        assert len(repo.calls) == 1
+        assert cache.hits == 1
+        assert cache.misses == 1
+
+    def test_options_are_part_of_key(self):
+        cache = DiffCache()
+        repo = FakeRepo()
+        cache.diff(repo, 'a', 'b', syntax_highlighting=True)
+        cache.diff(repo, 'a', 'b', syntax_highlighting=False)
+        assert len(repo.calls) == 2
+
+    def test_copies_are_independent(self):
+        """Consuming chunk lines in a view does not alter the cache."""
+        cache = DiffCache()
+        repo = FakeRepo(nlines=30)
+        files = cache.diff(repo, 'a', 'b')
+        chunk = files[0].chunks[0]
+        del chunk.lines[:10]
+        chunk.button = object()
+        again = cache.diff(repo, 'a', 'b')
+        assert len(again[0].chunks[0].lines) == 30
+        assert not hasattr(again[0].chunks[0], 'button')
+
+    def test_evicts_least_recently_used(self):
+        cache = DiffCache(max_lines=25)
+        repo = FakeRepo(nlines=10)
+        cache.diff(repo, 'a', 'b')
+        cache.diff(repo, 'c', 'd')
+        cache.diff(repo, 'a', 'b')  # refresh a..b
+        cache.diff(repo, 'e', 'f')
+        assert DiffCache.key(repo, 'a', 'b') in cache
+        assert DiffCache.key(repo, 'c', 'd') not in cache
+        assert cache.lines == 20
+
+    def test_oversized_diff_not_cached(self):
+        cache = DiffCache(max_lines=5)
+        repo = FakeRepo(nlines=10)
+        files = cache.diff(repo, 'a', 'b')
+        assert len(files[0].chunks[0].lines) == 10
+        assert len(cache) == 0
+
+    def test_concurrent_requests_compute_once(self):
+        cache = DiffCache()
+        started = threading.Event()
+        release = threading.Event()
+
+        class SlowRepo(FakeRepo):
+            def iterDiff(self, old, new, **options):
+                started.set()
+                release.wait(5)
+                return super().iterDiff(old, new, **options)
+
+        repo = SlowRepo()
+        t = threading.Thread(target=cache.diff, args=(repo, 'a', 'b'))
+        t.start()
+        started.wait(5)
+        waiter = threading.Thread(target=cache.diff, args=(repo, 'a', 'b'))
+        waiter.start()
+        release.set()
+        t.join(5)
+        waiter.join(5)
+        assert len(repo.calls) == 1
+
+
+    def test_lazy_files_are_parsed_once(self):
+        """Copies of an unparsed file share the parsing work."""
+        parsed = []
+
+        def parser(f):
+            parsed.append(f)
+            f.addContextLine('text')
+            f.finalize()
+
+        class LazyRepo(FakeRepo):
+            def iterDiff(self, old, new, **options):
+                f = DiffFile()
+                f.patch_lines = 1
+                f._parser = parser
+                yield f
+
+        cache = DiffCache()
+        repo = LazyRepo()
+        first = cache.diff(repo, 'a', 'b', lazy=True)[0]
+        assert not first.parsed
+        assert len(first.parse().chunks) == 1
+        second = cache.diff(repo, 'a', 'b', lazy=True)[0]
+        assert len(second.parse().chunks) == 1
+        assert len(cache.diff(repo, 'a', 'b')[0].chunks) == 1
+        assert len(parsed) == 1
+
+
+class TestDiffPrefetcher:
+    """DiffPrefetcher queues work and drops superseded requests."""
+
+    def _make(self, count=3):
+        app = types.SimpleNamespace()
+        prefetcher = DiffPrefetcher(app, DiffCache(), count, 5000)
+        # Keep the worker from starting so the queue can be inspected.
+        prefetcher.thread = object()
+        return prefetcher
+
+    def test_disabled(self):
+        prefetcher = self._make(count=0)
+        prefetcher.prefetch([1, 2, 3])
+        assert prefetcher.queue.empty()
+
+    def test_queues_focused_and_following(self):
+        prefetcher = self._make(count=2)
+        prefetcher.prefetch([1, 2, 3, 4])
+        jobs = [prefetcher.queue.get_nowait() for _ in range(3)]
+        assert prefetcher.queue.empty()
+        assert [(pr_key, head) for _, pr_key, head in jobs] == [
+            (1, True), (2, False), (3, False)]
+
+    def test_superseded_jobs_are_skipped(self):
+        prefetcher = self._make()
+        prefetcher.prefetch([1])
+        stale = prefetcher.queue.get_nowait()
+        prefetcher.prefetch([2])
+        prefetcher._getWanted = mock.Mock(return_value=[('repo', 'a', 'b')])
+        prefetcher._process(*stale)
+        assert prefetcher.cache.misses == 0
+        assert not prefetcher._getWanted.called
+
+    def test_superseded_while_querying(self):
+        prefetcher = self._make()
+        prefetcher.prefetch([1])
+        job = prefetcher.queue.get_nowait()
+
+        def get_wanted(pr_key, head):
+            prefetcher.prefetch([2])
+            return [('repo', 'a', 'b')]
+        prefetcher._getWanted = get_wanted
+        prefetcher._process(*job)
+        assert prefetcher.cache.misses == 0
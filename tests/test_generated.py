@@ -16,11 +16,15 @@
 
 import textwrap
 
+import git
+
 from hubtty.generated import (
     BUILTIN_GENERATED_PATTERNS,
     GeneratedFileFilter,
+    _PatternSet,
     _glob_to_regex,
     _match_pattern,
+    get_filter,
     parse_gitattributes,
     read_gitattributes,
 )
@@ -300,3 +304,73 @@ class TestGeneratedFileFilter:
     def test_all_builtin_patterns_are_strings(self):
         for p in BUILTIN_GENERATED_PATTERNS:
             assert isinstance(p, str)
+
+
+# ---------------------------------------------------------------------------
+# Compiled patterns and shared filters
+# ---------------------------------------------------------------------------
+
+class TestPatternSet:
+    """Compiled pattern sets match like the patterns one by one."""
+
+    PATTERNS = BUILTIN_GENERATED_PATTERNS + [
+        '*.snap', 'gen_*.py', 'docs/*.json', '**/fixtures/*', 'a[bc].txt',
+        'build/', ' spaced.txt ', '', 'bad/[x', '*',
+    ]
+    PATHS = [
+        'package-lock.json', 'web/yarn.lock', 'app.min.js', 'min.js',
+        '.min.js', 'x.Designer.cs', 'vendor/a/b.go', 'src/vendor.go',
+        'gen_api.py', 'src/gen_api.py', 'docs/api.json',
+        'docs/sub/api.json', 'tests/fixtures/data.bin', 'fixtures/x',
+        'ab.txt', 'ad.txt', 'build', 'build/out.o', 'spaced.txt',
+        'bad/[x', 'README.md', '/COMMIT_MSG',
+    ]
+
+    def test_matches_like_match_pattern(self):
+        for count in range(len(self.PATTERNS)):
+            patterns = self.PATTERNS[:count]
+            compiled = _PatternSet(patterns)
+            for path in self.PATHS:
+                expected = any(_match_pattern(p, path) for p in patterns)
+                assert compiled.match(path) == expected, (patterns, path)
+
+    def test_suffix_index(self):
+        compiled = _PatternSet(['*.min.js', '*_pb2.py'])
+        assert compiled.suffixes == {'.min.js', '_pb2.py'}
+        assert compiled.basename_re is None
+
+
+class TestGetFilter:
+    """Filters are shared by commits with the same .gitattributes."""
+
+    def _commit(self, repo, tmp_path, attributes):
+        if attributes is not None:
+            (tmp_path / '.gitattributes').write_text(attributes)
+            repo.index.add(['.gitattributes'])
+        return repo.index.commit('commit').hexsha
+
+    def test_cached_by_blob(self, tmp_path):
+        repo = git.Repo.init(str(tmp_path))
+        with repo.config_writer() as cw:
+            cw.set_value('user', 'name', 'Test')
+            cw.set_value('user', 'email', 'test@example.com')
+        none = self._commit(repo, tmp_path, None)
+        first = self._commit(repo, tmp_path, '*.snap linguist-generated\n')
+        (tmp_path / 'other.txt').write_text('x')
+        repo.index.add(['other.txt'])
+        same = repo.index.commit('same attributes').hexsha
+        changed = self._commit(repo, tmp_path, '*.gen linguist-generated\n')
+        repo.close()
+        path = str(tmp_path)
+        assert get_filter(path, first) is get_filter(path, same)
+        assert get_filter(path, first) is not get_filter(path, changed)
+        assert get_filter(path, first) is not get_filter(path, first, ['*.x'])
+        assert get_filter(path, first).is_generated('a.snap')
+        assert not get_filter(path, none).is_generated('a.snap')
+        assert get_filter(path, changed).is_generated('a.gen')
+
+    def test_results_are_memoized(self):
+        filt = GeneratedFileFilter()
+        assert filt.is_generated('yarn.lock')
+        filt._generated = None
+        assert filt.is_generated('yarn.lock')
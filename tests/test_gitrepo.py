@@ -3,7 +3,7 @@
 import git
 import pytest
 
-from hubtty.gitrepo import Repo
+from hubtty.gitrepo import DiffFile, Repo
 
 
 @pytest.fixture
@@ -107,3 +107,140 @@ class TestFetchDetachesCheckedOutBranch:
         underlying = git.Repo(working_path)
         assert not underlying.head.is_detached
         assert underlying.active_branch.name == "main"
+
+
+@pytest.fixture
+def long_file_repo(tmp_path):
+    """A repository whose second commit changes line 50 of 100."""
+    path = str(tmp_path / 'long')
+    r = git.Repo.init(path)
+    with r.config_writer() as cw:
+        cw.set_value('user', 'name', 'Test')
+        cw.set_value('user', 'email', 'test@example.com')
+    lines = ['line %d\n' % i for i in range(1, 101)]
+    shas = []
+    for content in (lines, lines[:49] + ['changed\n'] + lines[50:]):
+        with open(tmp_path / 'long' / 'file.txt', 'w') as f:
+            f.writelines(content)
+        r.index.add(['file.txt'])
+        shas.append(r.index.commit('change').hexsha)
+    r.git.mv('file.txt', 'renamed.txt')
+    shas.append(r.index.commit('rename').hexsha)
+    r.close()
+    return path, shas
+
+
+class TestDiffGaps:
+    """Unchanged lines outside the git context are read on demand."""
+
+    def _file(self, repo, old, new):
+        r = Repo(None, repo)
+        return r.diff(old, new, syntax_highlighting=False)[-1]
+
+    def test_chunks(self, long_file_repo):
+        path, (first, second, _) = long_file_repo
+        f = self._file(path, first, second)
+        kinds = [(c.gap, c.context) for c in f.chunks]
+        assert kinds == [(True, True), (False, True), (False, False),
+                         (False, True), (True, True)]
+        assert f.chunks[0].range == [[1, 39], [1, 39]]
+        assert f.chunks[-1].range == [[61, 100], [61, 100]]
+        assert f.chunks[0].first and f.chunks[-1].last
+
+    def test_expand_from_either_end(self, long_file_repo):
+        path, (first, second, _) = long_file_repo
+        gap = self._file(path, first, second).chunks[0]
+        head = gap.lines[:2]
+        assert head == [((1, ' ', 'line 1'), (1, ' ', 'line 1')),
+                        ((2, ' ', 'line 2'), (2, ' ', 'line 2'))]
+        del gap.lines[:2]
+        assert gap.lines[-1][1] == (39, ' ', 'line 39')
+        del gap.lines[-10:]
+        gap.calcRange()
+        assert gap.range == [[3, 29], [3, 29]]
+        assert gap.indexOfLine(1, 3) == 0
+        assert gap.indexOfLine(1, 30) is None
+
+    def test_copies_are_independent(self, long_file_repo):
+        path, (first, second, _) = long_file_repo
+        f = self._file(path, first, second)
+        copy = f.copy()
+        del copy.chunks[0].lines[:]
+        assert len(f.chunks[0].lines) == 39
+        assert copy.chunks[0].lines.diff is copy
+
+    def test_rename_only(self, long_file_repo):
+        path, (_, second, third) = long_file_repo
+        f = self._file(path, second, third)
+        assert [c.gap for c in f.chunks] == [True]
+        assert len(f.chunks[0].lines) == 100
+        assert f.chunks[0].lines[49][1] == (50, ' ', 'changed')
+
+    def test_lazy_copy(self, long_file_repo):
+        path, (first, second, _) = long_file_repo
+        r = Repo(None, path)
+        f = list(r.iterDiff(first, second, syntax_highlighting=False))[-1]
+        copy = f.copy().parse()
+        assert copy.chunks[0].lines[0][1] == (1, ' ', 'line 1')
+
+
+class TestLineStore:
+    """Chunk lines are built from the compact per-file storage."""
+
+    def _file(self):
+        f = DiffFile()
+        f.old_lineno = f.new_lineno = 1
+        f.addContextLine('one')
+        f.addContextLine('two')
+        f.addDiffLines(['three', 'four'], ['THREE'])
+        f.addContextLine('five')
+        f.finalize()
+        return f
+
+    def test_lines(self):
+        f = self._file()
+        context, changed, after = f.chunks
+        assert context.lines[:] == [((1, ' ', 'one'), (1, ' ', 'one')),
+                                    ((2, ' ', 'two'), (2, ' ', 'two'))]
+        assert changed.lines[1] == ((4, '-', ('removed-line', 'four')),
+                                    (None, '', ''))
+        assert after.lines[-1] == ((5, ' ', 'five'), (4, ' ', 'five'))
+        assert changed.range == [[3, 4], [3, 3]]
+
+    def test_index_of_line(self):
+        _, changed, after = self._file().chunks
+        assert changed.indexOfLine(0, 4) == 1
+        assert changed.indexOfLine(1, 4) is None
+        assert after.indexOfLine(1, 4) == 0
+
+    def test_intraline_is_computed_on_demand(self):
+        f = self._file()
+        calls = []
+
+        def compare(old, new):
+            calls.append((old, new))
+            return ([('removed-line', l) for l in old],
+                    [('added-line', l) for l in new])
+        f.store.compare = compare
+        changed = f.chunks[1]
+        assert calls == []
+        changed.lines[:]
+        changed.lines[:]
+        assert calls == [(['three', 'four'], ['THREE'])]
+
+    def test_copies_share_storage(self):
+        f = self._file()
+        copy = f.copy()
+        del copy.chunks[0].lines[:1]
+        assert copy.store is f.store
+        assert len(f.chunks[0].lines) == 2
+        assert copy.chunks[0].lines[0][1] == (2, ' ', 'two')
+
+    def test_find_line(self):
+        f = self._file()
+        f.new_syntax = {3: [('keyword', 'THREE')]}
+        assert f.findLine(None, 3) is None
+        assert f.findLine(3, 3)[1] == (
+            3, '+', ('keyword-on-added-line', 'THREE'))
+        assert f.findLine(2, 2)[0] == (2, ' ', 'two')
+        assert f.findLine(9, 9) is None
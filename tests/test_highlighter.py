@@ -0,0 +1,215 @@
+# Copyright The Hubtty Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Tests for the cached, parallel syntax highlighter."""
+
+import concurrent.futures
+import os
+import threading
+
+import git
+import pytest
+
+from hubtty.gitrepo import Repo
+from hubtty.highlighter import Highlighter, lexer_name
+from hubtty.syntax import LineHighlighter, highlight_file
+
+CODE = 'def foo():\n    return 42\n'
+SHA = '0123456789abcdef0123456789abcdef01234567'
+
+
+class TestHighlighter:
+    """Highlighter caches results by blob SHA and lexer."""
+
+    def test_lexer_name(self):
+        assert lexer_name('a/b/example.py') == 'Python'
+        assert lexer_name('notes.unknown-extension') is None
+
+    def test_result_matches_highlight_file(self):
+        result = Highlighter(incremental=False).submit(
+            SHA, 'example.py', lambda: CODE).result()
+        assert result == highlight_file('example.py', CODE)
+
+    def test_incremental(self):
+        result = Highlighter().submit(SHA, 'example.py', lambda: CODE).result()
+        assert isinstance(result, LineHighlighter)
+        expected = highlight_file('example.py', CODE)
+        assert [result.get(i) for i in (1, 2)] == [expected[1], expected[2]]
+
+    def test_not_resumable_is_highlighted_whole(self):
+        result = Highlighter().submit(
+            SHA, 'example.json', lambda: '{"a": 1}\n').result()
+        assert result == highlight_file('example.json', '{"a": 1}\n')
+
+    def test_second_request_is_cached(self):
+        h = Highlighter()
+        reads = []
+
+        def read():
+            reads.append(1)
+            return CODE
+        h.submit(SHA, 'example.py', read)
+        h.submit(SHA, 'other/path.py', read)
+        assert len(reads) == 1
+        assert (h.hits, h.misses) == (1, 1)
+
+    def test_lexer_is_part_of_key(self):
+        h = Highlighter()
+        h.submit(SHA, 'example.py', lambda: CODE)
+        h.submit(SHA, 'example.rb', lambda: CODE)
+        assert h.misses == 2
+
+    def test_unhighlighted_files_are_not_read(self):
+        def read():
+            raise AssertionError("should not be read")
+        assert Highlighter().submit(SHA, 'README', read).result() == {}
+
+    def test_disk_cache_survives_instances(self, tmp_path):
+        Highlighter(cache_dir=str(tmp_path), incremental=False).submit(
+            SHA, 'example.py', lambda: CODE)
+        h = Highlighter(cache_dir=str(tmp_path))
+
+        def read():
+            raise AssertionError("should come from the disk cache")
+        result = h.submit(SHA, 'example.py', read).result()
+        assert result == highlight_file('example.py', CODE)
+
+    def test_incremental_result_is_stored_once_finished(self, tmp_path):
+        h = Highlighter(cache_dir=str(tmp_path))
+        key = h.key(SHA, 'example.py')
+        result = h.submit(SHA, 'example.py', lambda: CODE).result()
+        assert not os.path.exists(h._path(key))
+        result.get(2)
+        for thread in threading.enumerate():
+            if thread.name == 'highlight cache':
+                thread.join()
+
+        def read():
+            raise AssertionError("should come from the disk cache")
+        result = Highlighter(cache_dir=str(tmp_path)).submit(
+            SHA, 'example.py', read).result()
+        assert result == highlight_file('example.py', CODE)
+
+    def test_pending_requests_are_shared(self):
+        h = Highlighter(processes=1, incremental=False)
+        submitted = []
+
+        class Pool:
+            def submit(self, *args):
+                submitted.append(args)
+                return concurrent.futures.Future()
+        h._pool = Pool()
+        first = h.submit(SHA, 'example.py', lambda: CODE)
+
+        def read():
+            raise AssertionError("should wait for the pending request")
+        assert h.submit(SHA, 'example.py', read) is first
+        assert len(submitted) == 1
+        first.set_result({1: []})
+        assert h.submit(SHA, 'example.py', read).result() == {1: []}
+        assert not h._pending
+
+    def test_disk_cache_is_pruned(self, tmp_path):
+        h = Highlighter(cache_dir=str(tmp_path), incremental=False)
+        markup = highlight_file('example.py', CODE)
+        shas = ['%040x' % i for i in range(5)]
+        for i, sha in enumerate(shas):
+            key = h.key(sha, 'example.py')
+            h.store(key, markup)
+            os.utime(h._path(key), (i, i))
+        size = os.path.getsize(h._path(h.key(shas[0], 'example.py')))
+        # Reading an entry makes it the most recently used.
+        h._entries.clear()
+        assert h.lookup(h.key(shas[0], 'example.py')) == markup
+        h.cache_dir_size = size * 5
+        h.store(h.key('%040x' % 5, 'example.py'), markup)
+        kept = [sha for sha in shas
+                if os.path.exists(h._path(h.key(sha, 'example.py')))]
+        assert kept == [shas[0], shas[3], shas[4]]
+        assert h._disk_usage == size * 4
+
+    def test_process_pool(self):
+        h = Highlighter(processes=1, incremental=False)
+        try:
+            future = h.submit(SHA, 'example.py', lambda: CODE)
+            assert future.result(timeout=60) == highlight_file(
+                'example.py', CODE)
+        finally:
+            h.shutdown()
+
+
+@pytest.fixture
+def repo(tmp_path):
+    """A repository with two commits changing a Python file."""
+    path = str(tmp_path / 'repo')
+    r = git.Repo.init(path)
+    with r.config_writer() as cw:
+        cw.set_value('user', 'name', 'Test')
+        cw.set_value('user', 'email', 'test@example.com')
+    shas = []
+    for content in (CODE, CODE.replace('42', '43')):
+        with open(tmp_path / 'repo' / 'example.py', 'w') as f:
+            f.write(content)
+        r.index.add(['example.py'])
+        shas.append(r.index.commit('change').hexsha)
+    r.close()
+    return path, shas
+
+
+class TestDeferredHighlighting:
+    """Files are parsed without highlighting until it is ready."""
+
+    def test_deferred_then_highlighted(self, repo):
+        path, (old, new) = repo
+        h = Highlighter(processes=1, incremental=False)
+        try:
+            f = Repo(None, path, syntax_highlighter=h).diff(old, new)[-1]
+            assert f.newname == 'example.py'
+            assert f.deferred_syntax is not None
+            assert not f.new_syntax
+            highlighted = f.deferred_syntax.result()
+            assert highlighted.new_syntax == highlight_file(
+                'example.py', CODE.replace('42', '43'))
+            # Copies made from now on use the highlighted version.
+            assert f.copy().deferred_syntax is None
+            assert f.copy().new_syntax == highlighted.new_syntax
+        finally:
+            h.shutdown()
+
+    def test_cached_highlighting_used_immediately(self, repo):
+        path, (old, new) = repo
+        r = Repo(None, path, syntax_highlighter=Highlighter())
+        f = r.diff(old, new)[-1]
+        assert f.deferred_syntax is None
+        assert f.new_syntax
+
+    def test_lexing_far_into_a_file_is_deferred(self, tmp_path):
+        path = str(tmp_path / 'long')
+        r = git.Repo.init(path)
+        with r.config_writer() as cw:
+            cw.set_value('user', 'name', 'Test')
+            cw.set_value('user', 'email', 'test@example.com')
+        lines = ['x_%d = %d\n' % (i, i) for i in range(2000)]
+        shas = []
+        for content in (lines, lines[:-1] + ['y = "changed"\n']):
+            with open(tmp_path / 'long' / 'example.py', 'w') as f:
+                f.writelines(content)
+            r.index.add(['example.py'])
+            shas.append(r.index.commit('change').hexsha)
+        r.close()
+        f = Repo(None, path, syntax_highlighter=Highlighter()).diff(*shas)[-1]
+        assert f.deferred_syntax is not None
+        highlighted = f.deferred_syntax.result()
+        assert highlighted.new_syntax.get(2000) == highlight_file(
+            'example.py', ''.join(lines[:-1]) + 'y = "changed"\n')[2000]
@@ -0,0 +1,130 @@
+# Copyright The Hubtty Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Tests for the intraline diff engines."""
+
+import pytest
+
+from hubtty.intraline import (CharacterEngine, IntralineEngine, WordEngine,
+                              emph_trailing_ws, get_engine)
+from hubtty.syntax import _flatten_to_chars
+
+
+def _text(markup):
+    return ''.join(c for _, c in _flatten_to_chars(markup))
+
+
+def _attrs(markup):
+    """Return the set of attributes used in *markup*."""
+    return {a for a, _ in _flatten_to_chars(markup)}
+
+
+class TestEmphTrailingWs:
+
+    def test_no_trailing_ws(self):
+        assert emph_trailing_ws('added-line', 'foo') == ('added-line', 'foo')
+
+    def test_trailing_ws(self):
+        assert emph_trailing_ws('added-line', 'foo  ') == [
+            ('added-line', 'foo'), ('trailing-ws', '  ')]
+
+    def test_only_ws(self):
+        assert emph_trailing_ws('added-line', '  ') == ('trailing-ws', '  ')
+
+
+@pytest.mark.parametrize('engine', [WordEngine(), CharacterEngine(),
+                                    IntralineEngine()],
+                         ids=lambda e: e.name)
+class TestEngineContract:
+    """All engines return one markup per line with the original text."""
+
+    def test_line_counts_and_text(self, engine):
+        old = ['def foo(a, b):', '    return a + b', 'x = 1']
+        new = ['def foo(a, b, c):', '    return a + b + c', '', 'y = 2 ']
+        out_old, out_new = engine.compare(old, new)
+        assert [_text(m) for m in out_old] == old
+        assert [_text(m) for m in out_new] == new
+
+    def test_pure_addition(self, engine):
+        out_old, out_new = engine.compare([], ['new line'])
+        assert out_old == []
+        assert out_new == [('added-line', 'new line')]
+
+    def test_pure_removal(self, engine):
+        out_old, out_new = engine.compare(['old line'], [])
+        assert out_old == [('removed-line', 'old line')]
+        assert out_new == []
+
+
+class TestWordEngine:
+
+    def test_changed_word_emphasised(self):
+        out_old, out_new = WordEngine().compare(
+            ['    "version": "1.2.3",'], ['    "version": "1.2.4",'])
+        assert ('removed-word', '3') in out_old[0]
+        assert ('added-word', '4') in out_new[0]
+        assert out_new[0][0] == ('added-line', '    "version": "1.2.')
+
+    def test_dissimilar_lines_not_paired(self):
+        out_old, out_new = WordEngine().compare(
+            ['completely different'], ['import os'])
+        assert out_old == [('removed-line', 'completely different')]
+        assert out_new == [('added-line', 'import os')]
+
+    def test_pairs_with_most_similar_line(self):
+        old = ['value = compute(a, b)']
+        new = ['# a new comment', 'value = compute(a, c)']
+        out_old, out_new = WordEngine().compare(old, new)
+        assert out_new[0] == ('added-line', '# a new comment')
+        assert 'added-word' in _attrs(out_new[1])
+        assert 'removed-word' in _attrs(out_old[0])
+
+    def test_identical_lines_are_context(self):
+        out_old, out_new = WordEngine().compare(['a', 'same'], ['b', 'same'])
+        assert out_old[1] == ('context-line', 'same')
+        assert out_new[1] == ('context-line', 'same')
+
+    def test_trailing_ws_on_emphasised_line(self):
+        out_old, out_new = WordEngine().compare(['foo = 1'], ['foo = 2  '])
+        assert out_new[0][-1] == ('trailing-ws', '  ')
+
+    def test_long_lines_skip_emphasis(self):
+        engine = WordEngine(max_line_length=10)
+        out_old, out_new = engine.compare(['a = 1 + 2 + 3'], ['a = 1 + 2 + 4'])
+        assert out_old == [('removed-line', 'a = 1 + 2 + 3')]
+        assert out_new == [('added-line', 'a = 1 + 2 + 4')]
+
+    def test_large_hunks_skip_emphasis(self):
+        engine = WordEngine(max_hunk_size=20)
+        old = ['x = %d' % i for i in range(10)]
+        new = ['x = %d' % (i + 1) for i in range(10)]
+        out_old, out_new = engine.compare(old, new)
+        assert all(m == ('removed-line', line) for m, line in zip(out_old, old))
+
+
+class TestCharacterEngine:
+
+    def test_changed_character_emphasised(self):
+        out_old, out_new = CharacterEngine().compare(['abcd'], ['abxd'])
+        assert out_old[0] == [('removed-line', 'ab'), ('removed-word', 'c'),
+                              ('removed-line', 'd')]
+        assert out_new[0] == [('added-line', 'ab'), ('added-word', 'x'),
+                              ('added-line', 'd')]
+
+
+def test_get_engine():
+    assert isinstance(get_engine('word'), WordEngine)
+    assert isinstance(get_engine('character'), CharacterEngine)
+    with pytest.raises(KeyError):
+        get_engine('bogus')
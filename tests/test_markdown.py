@@ -0,0 +1,96 @@
+# Copyright The Hubtty Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Tests for markdown rendering and the render cache."""
+
+import types
+
+from hubtty.commentlink import CommentLink
+from hubtty.markdown import RenderCache, Renderer
+from hubtty import mywid
+
+
+def _commentlink(url='https://example.com/{number}'):
+    return CommentLink(dict(
+        match=r"#(?P<number>\d+)",
+        replacements=[dict(link=dict(text="#{number}", url=url))]))
+
+
+def _renderer(commentlinks, cache):
+    app = types.SimpleNamespace(
+        config=types.SimpleNamespace(commentlinks=commentlinks))
+    return Renderer(app, cache)
+
+
+class TestRenderMessage:
+    """Renderer.renderMessage applies markdown and commentlinks."""
+
+    def test_without_cache(self):
+        md = _renderer([_commentlink()], None)
+        markup = md.renderMessage('Fixes #12')
+        assert markup[0] == 'Fixes '
+        assert isinstance(markup[1], mywid.Link)
+        assert markup[1].text == '#12'
+
+    def test_empty_body(self):
+        md = _renderer([_commentlink()], RenderCache())
+        assert md.renderMessage(None) == []
+        assert md.renderMessage('') == []
+
+
+class TestRenderCache:
+    """RenderCache only renders a message again when it changes."""
+
+    def test_same_body_is_cached(self):
+        cache = RenderCache()
+        md = _renderer([_commentlink()], cache)
+        first = md.renderMessage('See #1')
+        assert md.renderMessage('See #1') is first
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_changed_body_is_rendered(self):
+        cache = RenderCache()
+        md = _renderer([_commentlink()], cache)
+        md.renderMessage('See #1')
+        markup = md.renderMessage('See #2')
+        assert markup[1].text == '#2'
+        assert cache.misses == 2
+
+    def test_commentlink_config_is_part_of_key(self):
+        cache = RenderCache()
+        _renderer([_commentlink()], cache).renderMessage('See #1')
+        other = _renderer([_commentlink('https://example.org/{number}')],
+                          cache)
+        other.renderMessage('See #1')
+        # The same configuration, even in a new object, is a hit.
+        _renderer([_commentlink()], cache).renderMessage('See #1')
+        assert (cache.hits, cache.misses) == (1, 2)
+
+    def test_context_is_part_of_key(self):
+        cache = RenderCache()
+        md = _renderer([_commentlink()], cache)
+        md.renderMessage('See #1', {'repository': 'a/b'})
+        md.renderMessage('See #1', {'repository': 'c/d'})
+        assert cache.misses == 2
+
+    def test_evicts_least_recently_used(self):
+        cache = RenderCache(max_entries=2)
+        md = _renderer([], cache)
+        md.renderMessage('one')
+        md.renderMessage('two')
+        md.renderMessage('one')
+        md.renderMessage('three')
+        assert len(cache) == 2
+        assert RenderCache.key('one', []) in cache._entries
+        assert RenderCache.key('two', []) not in cache._entries
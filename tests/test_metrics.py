@@ -0,0 +1,146 @@
+# Copyright The Hubtty Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Tests for the metrics subsystem."""
+
+import json
+import pstats
+from unittest import mock
+
+import pytest
+
+from hubtty import metrics
+
+
+class TestEndpoint:
+    """Request URLs are grouped by endpoint."""
+
+    @pytest.mark.parametrize('url, expected', [
+        ('https://api.github.com/repos/org/repo/pulls/12?page=2',
+         'repos/:owner/:repo/pulls/:number'),
+        ('https://api.github.com/repos/org/repo/commits/' + 'a1' * 20
+         + '/check-runs', 'repos/:owner/:repo/commits/:sha/check-runs'),
+        ('https://api.github.com/users/someone', 'users/:user'),
+        ('https://github.example.com/api/v3/search/issues?q=is%3Apr',
+         'search/issues'),
+        ('https://api.github.com/user/repos', 'user/repos'),
+    ])
+    def test_endpoint(self, url, expected):
+        assert metrics.endpoint(url) == expected
+
+
+class TestHistogram:
+    """Histograms bucket observations and estimate quantiles."""
+
+    def test_empty(self):
+        h = metrics.Histogram().snapshot()
+        assert h['count'] == 0
+        assert h['mean'] == 0.0
+        assert h['p95'] == 0.0
+
+    def test_buckets_and_quantiles(self):
+        h = metrics.Histogram()
+        for seconds in [0.002] * 90 + [0.3] * 9 + [120]:
+            h.observe(seconds)
+        snapshot = h.snapshot()
+        assert snapshot['count'] == 100
+        assert snapshot['max'] == 120
+        assert snapshot['buckets']['<=0.005'] == 90
+        assert snapshot['buckets']['<=0.5'] == 9
+        assert snapshot['buckets']['>60'] == 1
+        assert snapshot['p50'] == 0.005
+        assert snapshot['p95'] == 0.5
+        assert h.quantile(1) == 120
+
+
+class TestMetrics:
+    """Metrics are collected and exported as JSON."""
+
+    def test_latency(self):
+        m = metrics.Metrics()
+        m.observe('task', 'SyncRepositoryTask', 0.2)
+        with mock.patch('hubtty.metrics.time.perf_counter',
+                        side_effect=[1.0, 1.5]):
+            with m.timed('refresh', 'PullRequestView'):
+                pass
+        latency = m.snapshot()['latency']
+        assert latency['task']['SyncRepositoryTask']['total'] == 0.2
+        assert latency['refresh']['PullRequestView']['total'] == 0.5
+
+    def test_requests(self):
+        m = metrics.Metrics()
+        url = 'https://api.github.com/repos/org/repo/pulls/%d'
+        m.request('get', url % 1, 200, 100)
+        m.request('GET', url % 2, 304, 0)
+        m.request('POST', url % 3 + '/reviews', 201, 10)
+        assert m.snapshot()['requests'] == [
+            {'method': 'GET', 'endpoint': 'repos/:owner/:repo/pulls/:number',
+             'count': 2, 'bytes': 100, 'status': {'200': 1, '304': 1}},
+            {'method': 'POST',
+             'endpoint': 'repos/:owner/:repo/pulls/:number/reviews',
+             'count': 1, 'bytes': 10, 'status': {'201': 1}},
+        ]
+
+    def test_etag_hit_rate(self):
+        m = metrics.Metrics()
+        assert m.snapshot()['etag']['hit_rate'] == 0.0
+        for hit in (True, True, True, False):
+            m.etag(hit)
+        assert m.snapshot()['etag'] == {'hits': 3, 'misses': 1,
+                                        'hit_rate': 0.75}
+
+    def test_queue_peak_between_samples(self):
+        m = metrics.Metrics()
+        with mock.patch('hubtty.metrics.time.time', side_effect=[100, 105, 106]):
+            m.observeQueue({0: 1, 1: 5})
+            m.observeQueue({0: 0, 1: 9})
+            m.sampleQueue({0: 0, 1: 2})
+            # An idle queue is still sampled.
+            m.sampleQueue({0: 0, 1: 0})
+            queue = m.snapshot()['queue']
+        assert queue == [
+            {'time': 100, 'depths': {'0': 0, '1': 2},
+             'peak': {'0': 1, '1': 9}},
+            {'time': 105, 'depths': {'0': 0, '1': 0},
+             'peak': {'0': 0, '1': 0}},
+        ]
+
+    def test_dump(self, tmp_path):
+        m = metrics.Metrics()
+        m.observe('task', 'SyncAccountTask', 0.01)
+        path = str(tmp_path / 'sub' / 'metrics.json')
+        m.dump(path)
+        with open(path) as f:
+            data = json.load(f)
+        assert data['latency']['task']['SyncAccountTask']['count'] == 1
+
+    def test_reset(self):
+        metrics.get_metrics().etag(True)
+        assert metrics.reset() is metrics.get_metrics()
+        assert metrics.get_metrics().snapshot()['etag']['hits'] == 0
+
+
+class TestProfiler:
+    """The profiler writes pstats data when stopped."""
+
+    def test_start_stop(self, tmp_path):
+        profiler = metrics.Profiler()
+        assert not profiler.running
+        profiler.start()
+        assert profiler.running
+        sorted(range(1000))
+        path = str(tmp_path / 'hubtty.prof')
+        profiler.stop(path)
+        assert not profiler.running
+        assert pstats.Stats(path).total_calls > 0
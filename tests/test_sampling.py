@@ -0,0 +1,142 @@
+# Copyright The Hubtty Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Tests for the sampling profiler."""
+
+import contextlib
+import threading
+import types
+
+from hubtty import sampling
+
+
+class FakeView:
+    def __init__(self, started, release):
+        self.started = started
+        self.release = release
+
+    def refresh(self):
+        self.started.set()
+        self.release.wait()
+
+
+@contextlib.contextmanager
+def running(target, name):
+    """Run *target* in a thread until the end of the with statement."""
+    started = threading.Event()
+    release = threading.Event()
+    thread = threading.Thread(target=target, args=(started, release),
+                              name=name)
+    thread.start()
+    started.wait()
+    try:
+        yield thread
+    finally:
+        release.set()
+        thread.join()
+
+
+def in_task(started, release):
+    with sampling.activity('SyncPullRequestTask'):
+        started.set()
+        release.wait()
+
+
+def in_view(started, release):
+    FakeView(started, release).refresh()
+
+
+def stacks_of(profiler, thread_name):
+    return [stack for stack in profiler.stacks
+            if stack.split(';')[0] == thread_name]
+
+
+class TestActivity:
+    """Threads declare what they are busy with."""
+
+    def test_nesting(self):
+        ident = threading.get_ident()
+        with sampling.activity('outer'):
+            with sampling.activity('inner'):
+                assert sampling._activities[ident] == 'inner'
+            assert sampling._activities[ident] == 'outer'
+        assert ident not in sampling._activities
+
+
+class TestQualname:
+    """Methods are named after their class on every Python version."""
+
+    def test_without_co_qualname(self):
+        # Code objects have no co_qualname before Python 3.11.
+        code = types.SimpleNamespace(co_name='refresh', co_argcount=1,
+                                     co_varnames=('self',))
+        view = FakeView(None, None)
+        frame = types.SimpleNamespace(f_code=code, f_locals={'self': view})
+        assert sampling._qualname(frame) == 'FakeView.refresh'
+        assert sampling._label(None, [frame]) == 'FakeView.refresh'
+
+    def test_function_without_co_qualname(self):
+        code = types.SimpleNamespace(co_name='in_view', co_argcount=2,
+                                     co_varnames=('started', 'release'))
+        frame = types.SimpleNamespace(f_code=code, f_locals={})
+        assert sampling._qualname(frame) == 'in_view'
+
+
+class TestSamplingProfiler:
+    """Samples are attributed to the activity of their thread."""
+
+    def test_task_activity(self, tmp_path):
+        profiler = sampling.SamplingProfiler(str(tmp_path / 'profile'))
+        with running(in_task, 'sync'):
+            profiler.sample()
+            profiler.sample()
+        [stack] = stacks_of(profiler, 'sync')
+        frames = stack.split(';')
+        assert frames[1] == 'SyncPullRequestTask'
+        assert frames[-1].startswith('threading.py:')
+        assert 'test_sampling.py:in_task' in frames
+        assert profiler.stacks[stack] == 2
+        assert profiler.samples == 2
+
+    def test_view_method(self, tmp_path):
+        profiler = sampling.SamplingProfiler(str(tmp_path / 'profile'))
+        with running(in_view, 'main'):
+            profiler.sample()
+        [stack] = stacks_of(profiler, 'main')
+        assert stack.split(';')[1] == 'FakeView.refresh'
+
+    def test_other(self, tmp_path):
+        profiler = sampling.SamplingProfiler(str(tmp_path / 'profile'))
+        with running(lambda started, release: (started.set(),
+                                               release.wait()), 'idle'):
+            profiler.sample()
+        [stack] = stacks_of(profiler, 'idle')
+        assert stack.split(';')[1] == 'other'
+
+    def test_write(self, tmp_path):
+        path = tmp_path / 'out' / 'profile'
+        profiler = sampling.SamplingProfiler(str(path), interval=0.001)
+        with running(in_task, 'periodic sync'):
+            profiler.start()
+            while not profiler.samples:
+                threading.Event().wait(0.001)
+        profiler.stop()
+        lines = path.read_text().splitlines()
+        assert lines
+        for line in lines:
+            stack, count = line.rsplit(' ', 1)
+            assert ' ' not in stack
+            assert int(count) > 0
+        assert any(line.startswith('periodic_sync;SyncPullRequestTask;')
+                   for line in lines)
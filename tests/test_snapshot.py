@@ -0,0 +1,87 @@
+# Copyright The Hubtty Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Tests for repository list snapshots."""
+
+import json
+import types
+
+import urwid
+
+from hubtty import snapshot
+from hubtty.view import repository_list
+
+ROWS = [
+    dict(type='repository', key=1, name='org/alpha', subscribed=True,
+         unreviewed_prs=3, open_prs=7),
+    dict(type='topic', key=2, name='Team', unreviewed_prs=1, open_prs=4),
+]
+
+
+class TestSaveLoad:
+    """Snapshots survive a round trip; bad files are ignored."""
+
+    def test_round_trip(self, tmp_path):
+        path = str(tmp_path / 'sub' / 'hubtty.snapshot')
+        snapshot.save(path, dict(rows=ROWS, held=2))
+        data = snapshot.load(path)
+        assert data['rows'] == ROWS
+        assert data['held'] == 2
+
+    def test_missing(self, tmp_path):
+        assert snapshot.load(str(tmp_path / 'none')) is None
+
+    def test_corrupt(self, tmp_path):
+        path = tmp_path / 'hubtty.snapshot'
+        path.write_text('{"rows": [')
+        assert snapshot.load(str(path)) is None
+
+    def test_other_version(self, tmp_path):
+        path = tmp_path / 'hubtty.snapshot'
+        path.write_text(json.dumps(dict(rows=ROWS,
+                                        version=snapshot.VERSION + 1)))
+        assert snapshot.load(str(path)) is None
+
+
+class TestRepositoryListSnapshot:
+    """The repository list can be drawn from a snapshot alone."""
+
+    def _make_app(self):
+        def no_database():
+            raise AssertionError("database used")
+        return types.SimpleNamespace(
+            header=urwid.Text(''),
+            status=types.SimpleNamespace(update=lambda **kw: None),
+            db=types.SimpleNamespace(getSession=no_database),
+            repository_cache=None)
+
+    def test_show_snapshot(self):
+        view = repository_list.RepositoryListView(self._make_app(),
+                                                  dict(rows=ROWS))
+        rows = list(view.listbox.body)
+        assert rows[0].repository_name == 'org/alpha'
+        assert rows[0].unreviewed_prs.text == '3 '
+        assert rows[1].topic_name == 'Team'
+        assert rows[1].open_prs.text == '4 '
+
+    def test_snapshot_round_trip(self):
+        view = repository_list.RepositoryListView(self._make_app(),
+                                                  dict(rows=ROWS))
+        assert view.getSnapshot() == dict(rows=ROWS)
+
+    def test_no_snapshot_of_filtered_list(self):
+        view = repository_list.RepositoryListView(self._make_app(),
+                                                  dict(rows=ROWS))
+        view.subscribed = False
+        assert view.getSnapshot() is None
@@ -14,6 +14,9 @@
 
 """Tests for hubtty.syntax module."""
 
+import random
+
+import pytest
 from pygments.token import Token
 
 from hubtty.syntax import (
@@ -21,15 +24,19 @@ from hubtty.syntax import (
     LIGHT_DIFF_LINE_STYLES,
     LIGHT_SYNTAX_PALETTE,
     SYNTAX_PALETTE,
+    LineHighlighter,
     _chars_to_markup,
     _flatten_to_chars,
+    _merged_attr,
     _simplify_markup,
     _token_to_attr,
     build_light_syntax_palette,
     build_syntax_focus_map,
     build_syntax_palette,
+    get_lexer,
     highlight_file,
     merge_syntax_with_diff,
+    resumable,
 )
 
 
@@ -182,6 +189,74 @@ class TestHighlightFile:
         assert text == 'def foo():'
 
 
+# ------------------------------------------------------------------
+# LineHighlighter
+# ------------------------------------------------------------------
+
+LONG_CODE = ''.join(
+    'def f%d(x):\n    """Doc\n    string %d."""\n    return x + %d\n\n'
+    % (i, i, i) for i in range(100))
+
+
+class TestLineHighlighter:
+
+    def test_resumable(self):
+        assert resumable(get_lexer('example.py'))
+        # Post-processes the tokens of RegexLexer.
+        assert resumable(get_lexer('example.c'))
+        # Keeps its own state.
+        assert not resumable(get_lexer('example.rb'))
+        assert not resumable(get_lexer('example.json'))
+
+    def test_matches_highlight_file(self):
+        """Lines resumed from checkpoints, in any order, match."""
+        expected = highlight_file('example.py', LONG_CODE)
+        lines = LineHighlighter(get_lexer('example.py'), LONG_CODE, 7)
+        for lineno in list(range(500, 0, -3)) + list(range(1, 502)):
+            assert lines.get(lineno) == expected.get(lineno)
+
+    def test_leading_blank_lines(self):
+        code = '\n\nimport os\n'
+        assert highlight_file('example.py', code).get(3) is not None
+        lines = LineHighlighter(get_lexer('example.py'), code)
+        assert lines[3] == highlight_file('example.py', code)[3]
+
+    def test_lexes_only_as_far_as_needed(self):
+        lines = LineHighlighter(get_lexer('example.py'), LONG_CODE, 10)
+        assert 'syn-keyword' in str(lines[1])
+        assert lines._lines[-1] < 20
+        assert not lines.ready(400)
+        lines.prepare(400)
+        assert lines.ready(400)
+        assert lines._lines[-1] < 400
+        assert len(lines._blocks) == 1
+
+    def test_lines(self):
+        lines = LineHighlighter(get_lexer('example.py'), LONG_CODE, 10)
+        lines.get(1)
+        assert lines.lines() == highlight_file('example.py', LONG_CODE)
+
+    def test_on_finished(self):
+        finished = []
+        lines = LineHighlighter(get_lexer('example.py'), LONG_CODE, 10,
+                                on_finished=finished.append)
+        lines.prepare(400)
+        assert finished == []
+        lines.get(600)
+        assert finished == [lines]
+        lines.get(1)
+        lines.lines()
+        assert finished == [lines]
+
+    def test_mapping(self):
+        lines = LineHighlighter(get_lexer('example.py'), 'x = 1\n\n')
+        assert 1 in lines
+        assert 2 not in lines
+        assert lines.get(0, 'default') == 'default'
+        with pytest.raises(KeyError):
+            lines[5]
+
+
 # ------------------------------------------------------------------
 # _simplify_markup
 # ------------------------------------------------------------------
@@ -371,6 +446,33 @@ class TestMergeSyntaxWithDiff:
         result = merge_syntax_with_diff(syn, diff)
         assert result == diff
 
+    def test_matches_character_merge(self):
+        """Runs split at different points merge like single characters."""
+        rnd = random.Random(0)
+        syn_attrs = [None, 'syn-keyword', 'syn-string']
+        diff_attrs = [None, 'added-line', 'added-word', 'context-line',
+                      'trailing-ws']
+        for _ in range(200):
+            text = ''.join(rnd.choice('ab c')
+                           for _ in range(rnd.randint(1, 30)))
+            syn = _random_markup(rnd, text, syn_attrs)
+            diff = _random_markup(rnd, text, diff_attrs)
+            expected = _chars_to_markup([
+                (_merged_attr(d, s), c) for (s, _), (d, c) in
+                zip(_flatten_to_chars(syn), _flatten_to_chars(diff))])
+            assert merge_syntax_with_diff(syn, diff) == expected
+
+
+def _random_markup(rnd, text, attrs):
+    markup = []
+    pos = 0
+    while pos < len(text):
+        end = rnd.randint(pos, len(text))
+        attr = rnd.choice(attrs)
+        markup.append((attr, text[pos:end]) if attr else text[pos:end])
+        pos = end
+    return [markup] if rnd.random() < 0.2 else markup
+
 
 # ------------------------------------------------------------------
 # build_syntax_palette